@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+
+import profiling
+from file_lock import atomic_write
+
+RUNS_DIR = os.path.join("cache", "runs")
+
+
+class RunCheckpoint:
+    """Atomic per-stage checkpoints of one report run.
+
+    Every stage result is stored as JSON under a run directory keyed by the
+    report type and the reporting window. A resumed run loads completed stages
+    instead of recomputing them; a fresh run clears the directory first so
+    stale stages from an earlier run are never mixed in.
+    """
+
+    def __init__(self, report_type, start_date, end_date, resume=False, runs_dir=RUNS_DIR):
+        self.run_dir = os.path.join(runs_dir, f"{report_type}_{start_date}_{end_date}")
+        self.resume = resume
+        if not resume and os.path.isdir(self.run_dir):
+            shutil.rmtree(self.run_dir)
+        os.makedirs(self.run_dir, exist_ok=True)
+
+    def _path(self, stage):
+        return os.path.join(self.run_dir, f"{stage.replace(':', '_')}.json")
+
+    def has(self, stage):
+        """Returns True if a resumed run can skip this stage."""
+        return self.resume and os.path.exists(self._path(stage))
+
+    def load(self, stage):
+        """Loads a completed stage, or returns None if it has to be (re)computed."""
+        if not self.has(stage):
+            return None
+        with open(self._path(stage)) as f:
+            value = json.load(f)
+        print(f"Resuming from checkpoint: skipped stage '{stage}'")
+        return value
+
+    def save(self, stage, value):
+        """Writes a stage result atomically so a killed run never leaves a partial file."""
+        atomic_write(self._path(stage), json.dumps(value))
+
+    def stage(self, stage, compute):
+        """Returns the checkpointed result of a stage, computing and saving it if needed.
+
+        Results that are None (failed stages) are not saved, so a retry only
+        repeats the stages that failed.
+        """
+        if self.has(stage):
+            return self.load(stage)
+        with profiling.stage(stage):
+            value = compute()
+        if value is not None:
+            self.save(stage, value)
+        return value
+
+
+class NoCheckpoint:
+    """Stand-in used when a stage runs outside of a checkpointed run."""
+
+    def has(self, stage):
+        return False
+
+    def load(self, stage):
+        return None
+
+    def save(self, stage, value):
+        pass
+
+    def stage(self, stage, compute):
+        with profiling.stage(stage):
+            return compute()
+
+
+def add_checkpoint_arguments(parser):
+    """Adds the --resume option to a script's argument parser."""
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the stages completed by an earlier run for the same report window.")
@@ -0,0 +1,108 @@
+import argparse
+import re
+import time
+
+from settings import settings
+
+DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*$")
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+# Shortest timeout given to a request while the deadline is close, so a
+# request is still attempted rather than failing on a zero timeout
+MIN_TIMEOUT = 1.0
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+def parse_duration(text):
+    """Parses '120', '120s', '2m' or '1h' into seconds (argparse type)."""
+    match = DURATION_RE.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid duration '{text}', expected e.g. 120s, 2m or 1h")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+class RunDeadline:
+    """A wall-clock deadline for one report run and the degradations it forced.
+
+    Steps ask the deadline before spending time: optional enrichment (epics,
+    owner names) is skipped once less than DEADLINE_ENRICHMENT_SHARE of the
+    run's time is left, an LLM call is only made if its expected latency fits
+    in the time left (the cached reply or the plain section is used
+    otherwise), and every request timeout is capped by the time left. A
+    reserve of DEADLINE_RESERVE_SECONDS is kept for rendering and writing the
+    report. Without --deadline every check passes.
+    """
+
+    def __init__(self):
+        self.seconds = None
+        self.started = time.monotonic()
+        self.degradations = []
+
+    def configure(self, seconds):
+        """Starts the run's clock with a deadline of the given seconds, or none."""
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.degradations = []
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def available(self):
+        """Returns the seconds left for work before the rendering reserve, or None without a deadline."""
+        if self.seconds is None:
+            return None
+        return self.seconds - self.elapsed() - _env_float("DEADLINE_RESERVE_SECONDS", 5)
+
+    def allows(self, seconds):
+        """True if a step expected to take the given seconds still fits."""
+        available = self.available()
+        return available is None or available >= seconds
+
+    def timeout(self, default):
+        """Caps a request timeout by the time left; returns the default without a deadline."""
+        available = self.available()
+        if available is None:
+            return default
+        return max(MIN_TIMEOUT, min(default, available))
+
+    def expired(self):
+        available = self.available()
+        return available is not None and available <= 0
+
+    def degrade(self, step, detail):
+        """Records a degradation forced by the deadline."""
+        self.degradations.append({"step": step, "detail": detail, "elapsed_seconds": round(self.elapsed(), 3)})
+        print(f"Deadline: {detail}")
+
+    def guard(self, step, compute):
+        """Wraps an optional enrichment stage so it is skipped (returns None) when time runs low."""
+        def guarded():
+            available = self.available()
+            if available is not None and available < self.seconds * _env_float("DEADLINE_ENRICHMENT_SHARE", 0.5):
+                self.degrade(step, f"skipping {step}, {max(available, 0):.0f}s of {self.seconds:.0f}s left")
+                return None
+            return compute()
+        return guarded
+
+    def summary(self):
+        """Returns the deadline and the degradations of the run, or None without a deadline."""
+        if self.seconds is None:
+            return None
+        return {
+            "deadline_seconds": self.seconds,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "degradations": self.degradations,
+        }
+
+
+run_deadline = RunDeadline()
+
+
+def add_deadline_arguments(parser):
+    """Adds the --deadline option to a script's argument parser."""
+    parser.add_argument("--deadline", type=parse_duration, default=None, metavar="DURATION",
+                        help="Finish the run within this time (e.g. 120s, 2m), degrading optional steps as needed.")
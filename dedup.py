@@ -0,0 +1,125 @@
+import hashlib
+import random
+import re
+
+from settings import settings
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands of 4 rows put the LSH threshold around a Jaccard similarity of 0.5
+SHINGLE_SIZE = 4
+
+# Platform words are ignored so "Fix X on iOS" and "Fix X on Android" collapse
+PLATFORM_WORDS = {"ios", "android", "extension", "browser", "web", "mobile", "iphone", "ipad"}
+
+STORY_LINE_RE = re.compile(r"^(?P<prefix>- )?\[(?P<title>.*)\]\((?P<url>[^)]*)\)(?P<rest>.*)$")
+
+# Each "permutation" XORs the 64-bit shingle hashes with a fixed random mask
+_rng = random.Random(42)
+_MASKS = [_rng.getrandbits(64) for _ in range(NUM_PERMUTATIONS)]
+
+
+def similarity_threshold():
+    """Returns the estimated Jaccard similarity above which stories are collapsed (0 disables)."""
+    return float(settings.get("STORY_DEDUP_THRESHOLD", 0.6))
+
+
+def shingles(text):
+    """Returns the character shingles of a normalized story title."""
+    words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    normalized = " ".join(word for word in words if word not in PLATFORM_WORDS)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    """Returns the MinHash signature of a set of shingles."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingle_set]
+    return [min(h ^ mask for h in hashes) for mask in _MASKS]
+
+
+def cluster_titles(titles, groups=None):
+    """Clusters near-duplicate titles with MinHash signatures and LSH banding.
+
+    Args:
+        titles: The titles to cluster.
+        groups: Optional group key per title; only titles of the same group are merged.
+
+    Returns:
+        A list of clusters, each a list of title indexes in input order.
+    """
+    threshold = similarity_threshold()
+    parent = list(range(len(titles)))
+    if threshold <= 0 or len(titles) < 2:
+        return [[i] for i in range(len(titles))]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    signatures = [minhash(shingles(title)) for title in titles]
+    rows = NUM_PERMUTATIONS // BANDS
+    buckets = {}
+    for i, signature in enumerate(signatures):
+        group = groups[i] if groups else None
+        for band in range(BANDS):
+            key = (group, band, tuple(signature[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(i)
+
+    # Stories join the cluster of their first similar story, compared against that
+    # cluster's representative, so dissimilar stories are never chained together
+    for candidates in buckets.values():
+        for position, other in enumerate(candidates):
+            if parent[other] != other:
+                continue
+            for first in candidates[:position]:
+                representative = find(first)
+                matches = sum(a == b for a, b in zip(signatures[representative], signatures[other]))
+                if matches / NUM_PERMUTATIONS >= threshold:
+                    parent[other] = representative
+                    break
+
+    clusters = {}
+    for i in range(len(titles)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values())
+
+
+def collapse_story_lines(lines, group_of=None):
+    """Replaces each cluster of near-duplicate story lines by one representative line.
+
+    Story lines look like '- [title](url) ...' or '[title](url) ...'; other lines
+    are kept as they are. The representative is the first line of its cluster,
+    followed by the number and links of the stories it stands for.
+
+    Args:
+        lines: The lines to collapse.
+        group_of: Optional callable returning a group key for a story line;
+            only lines of the same group are collapsed together.
+
+    Returns:
+        The collapsed lines, in input order.
+    """
+    story_indexes = [i for i, line in enumerate(lines) if STORY_LINE_RE.match(line)]
+    matches = [STORY_LINE_RE.match(lines[i]) for i in story_indexes]
+    groups = [group_of(lines[i]) for i in story_indexes] if group_of else None
+
+    replaced, dropped = {}, set()
+    for cluster in cluster_titles([m.group("title") for m in matches], groups):
+        if len(cluster) < 2:
+            continue
+        representative = lines[story_indexes[cluster[0]]]
+        urls = ", ".join(matches[i].group("url") for i in cluster[1:])
+        replaced[story_indexes[cluster[0]]] = f"{representative} ({len(cluster)} similar stories, also: {urls})"
+        dropped.update(story_indexes[i] for i in cluster[1:])
+
+    if dropped:
+        print(f"Collapsed {len(dropped)} near-duplicate stories before prompting.")
+    return [replaced.get(i, line) for i, line in enumerate(lines) if i not in dropped]
+
+
+def collapse_report(markdown_report, group_of=None):
+    """Collapses near-duplicate story lines of a Markdown report for use in a prompt."""
+    return "\n".join(collapse_story_lines(markdown_report.split("\n"), group_of))
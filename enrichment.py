@@ -0,0 +1,74 @@
+import string
+
+import shortcut_api
+from settings import settings
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+BASE_URL = "https://api.app.shortcut.com"
+
+# Story fields that cost extra Shortcut requests to fill in
+OWNERS = "owners"
+
+
+def template_fields(*templates):
+    """Returns the names of the fields referenced by str.format templates."""
+    return {
+        name.split(".")[0].split("[")[0]
+        for template in templates
+        for _, name, _, _ in string.Formatter().parse(template)
+        if name
+    }
+
+
+def uses(field, *templates):
+    """True if any of the output templates references the field."""
+    return field in template_fields(*templates)
+
+
+def fetch_members():
+    """Fetches the workspace members with one request.
+
+    Returns:
+        The member dictionaries as returned by the Shortcut API, or None if they cannot be fetched.
+    """
+    try:
+        response = shortcut_api.get(f"{BASE_URL}/api/v3/members", headers={"Shortcut-Token": settings.shortcut_api_key})
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching members: {e}")
+        return None
+
+
+def member_names(members, owner_ids):
+    """Maps owner ids to names from fetched members; ids that cannot be resolved map to 'Unknown User'."""
+    owner_ids = set(owner_ids)
+    names = {
+        member["id"]: member.get("profile", {}).get("name", "Unknown User")
+        for member in members or []
+        if member.get("id") in owner_ids
+    }
+    return {owner_id: names.get(owner_id, "Unknown User") for owner_id in owner_ids}
+
+
+def fetch_member_names(owner_ids):
+    """Resolves owner ids to names with one request for all workspace members.
+
+    Args:
+        owner_ids: The member ids to resolve.
+
+    Returns:
+        A dictionary of owner id to name; ids that cannot be resolved map to 'Unknown User'.
+    """
+    if not owner_ids:
+        return {}
+    return member_names(fetch_members(), owner_ids)
+
+
+def owner_names(owner_ids, owner_details):
+    """Formats the names of a story's owners, or '' if owner names were not resolved."""
+    if owner_details is None:
+        return ""
+    return ", ".join(owner_details.get(owner_id, "Unknown User") for owner_id in owner_ids)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Locks live in the system temp directory so processes started from different
+# working directories (e.g. workspace runs) agree on them
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), "shortcut-ai-locks")
+
+
+def lock_dir():
+    """Returns the directory of the lock files, SHORTCUT_LOCK_DIR if set."""
+    return settings.get("SHORTCUT_LOCK_DIR", DEFAULT_LOCK_DIR)
+
+
+class FileLock:
+    """Exclusive advisory lock on a path, shared by the threads and processes of all scripts.
+
+    The lock is held on a separate file named after the absolute path, so the
+    protected file itself is never touched, and the operating system releases
+    it if the holding process dies. Locks are not reentrant.
+
+    Lock protocol: every read-modify-write of a shared cache file and every
+    append to a shared log happens while holding FileLock(path); whole-file
+    writes go through atomic_write, so readers never see a partial file.
+    """
+
+    def __init__(self, path):
+        digest = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+        self.lock_path = os.path.join(lock_dir(), f"{digest}.lock")
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self.file = open(self.lock_path, "a+")
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+def replace_file(path, content):
+    """Replaces a file in one step through a temporary file unique to this process and thread."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write(path, content):
+    """Writes a whole file atomically while holding its lock."""
+    with FileLock(path):
+        replace_file(path, content)
+
+
+def append_line(path, line):
+    """Appends one line to a shared log file while holding its lock."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with FileLock(path):
+        with open(path, "a") as f:
+            f.write(line.rstrip("\n") + "\n")
+
+
+class SharedTokenBucket:
+    """Token bucket rate limiter whose state is shared by every process on the machine.
+
+    The bucket state is a small JSON file in lock_dir(), read and updated under
+    its FileLock, so concurrent cron runs of all report scripts together stay
+    under one quota.
+    """
+
+    def __init__(self, name, rate, burst):
+        self.path = os.path.join(lock_dir(), f"{name}.bucket.json")
+        self.rate = rate
+        self.burst = burst
+
+    def _read(self, now):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {"tokens": self.burst, "updated": now, "paused_until": 0}
+
+    def _write(self, state):
+        with open(self.path, "w") as f:
+            json.dump(state, f)
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with FileLock(self.path):
+                now = time.time()
+                state = self._read(now)
+                if state["paused_until"] > now:
+                    wait = state["paused_until"] - now
+                else:
+                    state["tokens"] = min(self.burst, state["tokens"] + max(0, now - state["updated"]) * self.rate)
+                    state["updated"] = now
+                    if state["tokens"] >= 1:
+                        state["tokens"] -= 1
+                        self._write(state)
+                        return
+                    wait = (1 - state["tokens"]) / self.rate
+                    self._write(state)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every process using this bucket for the given number of seconds, e.g. after a 429."""
+        with FileLock(self.path):
+            now = time.time()
+            state = self._read(now)
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+            state["tokens"] = 0
+            state["updated"] = now
+            self._write(state)
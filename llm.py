@@ -0,0 +1,778 @@
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import deadline
+import file_lock
+import model_router
+import profiling
+import prompts
+from settings import settings
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+PORTKEY_URL = "https://api.portkey.ai/v1/chat/completions"
+
+HEALTH_PATH = os.path.join("cache", "llm_health.json")
+RESPONSE_CACHE_DIR = os.path.join("cache", "llm_responses")
+HEALTH_WINDOW = 50  # Calls per model kept for latency percentiles and error rates
+
+# USD per million input/output tokens, used for cost estimates only
+MODEL_PRICES = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+# Share of the input price charged for prompt tokens served from the provider's prefix cache
+CACHED_INPUT_PRICE_FACTOR = 0.25
+# Share of the price charged for requests sent through the gateway's batch API
+BATCH_PRICE_FACTOR = 0.5
+
+PLATFORMS = ("extension", "ios", "android")
+PLATFORM_TITLES = {
+    "extension": "Extension",
+    "ios": "iOS",
+    "android": "Android",
+}
+
+SECTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "extension": {"type": "string"},
+        "ios": {"type": "string"},
+        "android": {"type": "string"},
+    },
+    "required": ["summary", "extension", "ios", "android"],
+    "additionalProperties": False,
+}
+
+
+def portkey_headers():
+    """Returns the Portkey gateway headers for the Google virtual key."""
+    return {
+        "x-portkey-api-key": settings.portkey_api_key,
+        "x-portkey-virtual-key": settings.google_virtual_key,
+        "Content-Type": "application/json",
+    }
+
+
+class LLMSkipped(Exception):
+    """Base class of the errors raised when an LLM call is skipped without a request."""
+
+
+class LLMBudgetExceeded(LLMSkipped):
+    """Raised instead of making an LLM call once the run's budget is spent."""
+
+
+class LLMDeadlineExceeded(LLMSkipped):
+    """Raised when a call would not finish before the run's deadline."""
+
+
+class LLMUnavailable(LLMSkipped):
+    """Raised without making a request while the gateway is unusable: breaker open or keys missing."""
+
+
+class LLMDeferred(LLMSkipped):
+    """Raised in a batched run when a request was collected for the next batch instead of sent."""
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+class GatewayHealth:
+    """Rolling per-model latencies and a circuit breaker for the Portkey gateway.
+
+    The state is persisted between runs so a cron run that starts while the
+    gateway is failing does not spend a full timeout per call to find out.
+    Pass path=None for an in-memory instance, e.g. in router simulations.
+    """
+
+    def __init__(self, path=HEALTH_PATH):
+        self.path = path
+        self.models = {}
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe = None
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+                self.models = state.get("models", {})
+                self.consecutive_failures = state.get("consecutive_failures", 0)
+                self.opened_at = state.get("opened_at")
+                self.probe = state.get("probe")
+            except (IOError, ValueError):
+                pass
+
+    def _owner(self):
+        return f"{os.getpid()}:{id(self)}"
+
+    def _holds_probe(self):
+        return self.probe is not None and self.probe["owner"] == self._owner()
+
+    def latencies(self, model):
+        return [call[1] for call in self.models.get(model, []) if call[2]]
+
+    def recent_calls(self, model, window=10, max_age=None):
+        """Returns the model's last calls, ignoring those older than max_age seconds."""
+        calls = self.models.get(model, [])[-window:]
+        if max_age is not None:
+            calls = [call for call in calls if time.time() - call[0] <= max_age]
+        return calls
+
+    def error_rate(self, model, window=10, max_age=None):
+        """Returns the share of failed calls among the model's last calls, or None without data."""
+        calls = self.recent_calls(model, window, max_age)
+        if not calls:
+            return None
+        return sum(1 for call in calls if not call[2]) / len(calls)
+
+    def seconds_per_prompt_token(self, model, window=10, max_age=None):
+        """Returns the median observed latency per prompt token, or None without data."""
+        rates = sorted(
+            call[1] / call[3]
+            for call in self.recent_calls(model, window, max_age)
+            if call[2] and len(call) > 3 and call[3]
+        )
+        return rates[len(rates) // 2] if rates else None
+
+    def hedge_delay(self, model):
+        """Returns the delay after which a duplicate request is fired, or None to disable hedging."""
+        percentile = _env_float("LLM_HEDGE_PERCENTILE", 90)
+        if percentile <= 0:
+            return None
+
+        latencies = sorted(self.latencies(model))
+        if len(latencies) < _env_float("LLM_HEDGE_MIN_SAMPLES", 5):
+            return _env_float("LLM_HEDGE_DEFAULT_DELAY", 20)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+    def allow(self):
+        """Returns False while the breaker is open; lets one probe through after the cooldown.
+
+        Once the cooldown has passed the breaker is half-open: the first
+        caller, of any process, records a probe in the persisted state and is
+        let through, and every other caller is kept out until the probe's call
+        records a success (closing the breaker) or a failure (opening it
+        again). A probe not resolved within LLM_BREAKER_PROBE_SECONDS (default
+        300), e.g. because its process died, passes to the next caller.
+        """
+        cooldown = _env_float("LLM_BREAKER_COOLDOWN", 300)
+        if self.opened_at is None:
+            return True
+        if time.time() - self.opened_at < cooldown:
+            return False
+        if self._holds_probe():
+            return True
+        if not self.path:
+            return self._claim_probe()
+
+        try:
+            with file_lock.FileLock(self.path):
+                # Another process may have claimed the probe or resolved it meanwhile
+                on_disk = GatewayHealth(self.path)
+                self.consecutive_failures = on_disk.consecutive_failures
+                self.opened_at = on_disk.opened_at
+                self.probe = on_disk.probe
+                if self.opened_at is None:
+                    return True
+                if time.time() - self.opened_at < cooldown or not self._claim_probe():
+                    return False
+                self._write()
+                return True
+        except IOError as e:
+            print(f"Error writing LLM gateway health: {e}")
+            return self._claim_probe()
+
+    def _claim_probe(self):
+        """Takes the half-open probe unless another caller holds a live one."""
+        probe_seconds = _env_float("LLM_BREAKER_PROBE_SECONDS", 300)
+        if self.probe is not None and time.time() - self.probe["started_at"] < probe_seconds:
+            return False
+        print("Circuit breaker cooldown passed, letting one probe call through.")
+        self.probe = {"owner": self._owner(), "started_at": time.time()}
+        return True
+
+    def record(self, model, latency, ok, prompt_tokens=None):
+        calls = self.models.setdefault(model, [])
+        calls.append([time.time(), round(latency, 3), ok, prompt_tokens])
+        del calls[:-HEALTH_WINDOW]
+
+        if ok:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probe = None
+        else:
+            self.consecutive_failures += 1
+            if self._holds_probe():
+                print("Circuit breaker probe failed, opening the breaker again.")
+                self.opened_at = time.time()
+                self.probe = None
+            elif self.consecutive_failures >= _env_float("LLM_BREAKER_THRESHOLD", 3):
+                if self.opened_at is None:
+                    print("Portkey gateway looks unhealthy, opening the circuit breaker.")
+                self.opened_at = time.time()
+        self.save()
+
+    def save(self):
+        """Writes the state, merging the calls other report processes recorded in the meantime."""
+        if not self.path:
+            return
+        try:
+            with file_lock.FileLock(self.path):
+                on_disk = GatewayHealth(self.path)
+                for model, calls in on_disk.models.items():
+                    merged = {call[0]: call for call in calls + self.models.get(model, [])}
+                    self.models[model] = sorted(merged.values())[-HEALTH_WINDOW:]
+                pending = on_disk.probe
+                if self.probe is None and self.opened_at is not None and pending and pending["owner"] != self._owner():
+                    self.probe = pending  # Keep another process's unresolved probe
+                self._write()
+        except IOError as e:
+            print(f"Error writing LLM gateway health: {e}")
+
+    def _write(self):
+        file_lock.replace_file(self.path, json.dumps({
+            "models": self.models,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at,
+            "probe": self.probe,
+        }))
+
+
+gateway_health = GatewayHealth()
+
+
+class RunUsage:
+    """Token, latency and cost accounting for the LLM calls of one report run."""
+
+    def __init__(self):
+        self.report_type = None
+        self.max_tokens = None
+        self.max_seconds = None
+        self.on_budget_exceeded = "downgrade"
+        self.calls = []
+
+    def configure(self, report_type, max_tokens=None, max_seconds=None, on_budget_exceeded="downgrade"):
+        """Sets the report type and the per-run budgets."""
+        self.report_type = report_type
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.on_budget_exceeded = on_budget_exceeded
+
+    def total_tokens(self):
+        return sum(call["total_tokens"] for call in self.calls)
+
+    def total_seconds(self):
+        return sum(call["latency_seconds"] for call in self.calls)
+
+    def check_budget(self):
+        """Raises LLMBudgetExceeded, or aborts the run, if a budget is spent."""
+        reason = None
+        if self.max_tokens is not None and self.total_tokens() >= self.max_tokens:
+            reason = f"token budget of {self.max_tokens} spent ({self.total_tokens()} tokens used)"
+        elif self.max_seconds is not None and self.total_seconds() >= self.max_seconds:
+            reason = f"time budget of {self.max_seconds}s spent ({self.total_seconds():.1f}s used)"
+        if reason is None:
+            return
+
+        if self.on_budget_exceeded == "abort":
+            print(json.dumps(self.summary(), indent=2))
+            raise SystemExit(f"Aborting run: LLM {reason}")
+        raise LLMBudgetExceeded(f"LLM {reason}")
+
+    def record(self, purpose, model, usage, latency, cache_status=None, error=None, hedged=False, prompt_version=None,
+               batch=False):
+        """Records one LLM call from the 'usage' field of its response.
+
+        Prompt tokens the provider served from its prefix cache are read from
+        'usage.prompt_tokens_details.cached_tokens' and priced at
+        CACHED_INPUT_PRICE_FACTOR of the input price; calls answered through
+        the batch API (batch=True) at BATCH_PRICE_FACTOR of the price.
+        """
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+
+        call = {
+            "purpose": purpose,
+            "model": model,
+            "prompt_version": prompt_version,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "total_tokens": usage.get("total_tokens", prompt_tokens + completion_tokens),
+            "latency_seconds": round(latency, 3),
+            "cache_hit": (cache_status or "").upper() in ("HIT", "SEMANTIC HIT"),
+            "cost_usd": ((prompt_tokens - cached_tokens) * input_price
+                         + cached_tokens * input_price * CACHED_INPUT_PRICE_FACTOR
+                         + completion_tokens * output_price) / 1_000_000 * (BATCH_PRICE_FACTOR if batch else 1),
+            "hedged": hedged,
+            "batch": batch,
+            "error": error,
+        }
+        self.calls.append(call)
+        print(
+            f"LLM call '{purpose}' ({model}): {prompt_tokens} prompt "
+            f"{f'({cached_tokens} cached) ' if cached_tokens else ''}+ {completion_tokens} completion tokens, "
+            f"{latency:.2f}s{', cache hit' if call['cache_hit'] else ''}{', hedged' if hedged else ''}"
+            f"{', batch' if batch else ''}"
+            f"{f', error: {error}' if error else ''}"
+        )
+
+    def summary(self):
+        """Aggregates the recorded calls per purpose and for the whole run."""
+        by_purpose = defaultdict(lambda: defaultdict(int))
+        by_prompt_version = defaultdict(lambda: defaultdict(int))
+        for call in self.calls:
+            if call.get("prompt_version"):
+                versions = by_prompt_version[call["prompt_version"]]
+                versions["calls"] += 1
+                versions["prompt_tokens"] += call["prompt_tokens"]
+                versions["cached_tokens"] += call["cached_tokens"]
+            totals = by_purpose[call["purpose"]]
+            totals["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens",
+                        "latency_seconds", "cost_usd"):
+                totals[key] += call[key]
+            totals["cache_hits"] += call["cache_hit"]
+            totals["errors"] += call["error"] is not None
+
+        prompt_tokens = sum(call["prompt_tokens"] for call in self.calls)
+        cached_tokens = sum(call["cached_tokens"] for call in self.calls)
+        return {
+            "report_type": self.report_type,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "calls": len(self.calls),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+            "cached_tokens": cached_tokens,
+            "cached_token_share": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "total_tokens": self.total_tokens(),
+            "latency_seconds": round(self.total_seconds(), 3),
+            "cost_usd": round(sum(call["cost_usd"] for call in self.calls), 6),
+            "cache_hits": sum(call["cache_hit"] for call in self.calls),
+            "batch_calls": sum(call.get("batch", False) for call in self.calls),
+            "by_purpose": {purpose: dict(totals) for purpose, totals in by_purpose.items()},
+            "by_prompt_version": {version: dict(totals) for version, totals in by_prompt_version.items()},
+            "deadline": deadline.run_deadline.summary(),
+            "details": self.calls,
+        }
+
+    def write(self, report_filename):
+        """Writes the run's usage next to the report and appends it to the per-report-type history."""
+        summary = self.summary()
+        usage_filename = os.path.splitext(report_filename)[0] + ".usage.json"
+        try:
+            file_lock.atomic_write(usage_filename, json.dumps(summary, indent=2))
+
+            history = {key: value for key, value in summary.items() if key != "details"}
+            file_lock.append_line(os.path.join(os.path.dirname(report_filename), "llm_usage.jsonl"), json.dumps(history))
+            print(f"LLM usage saved to {usage_filename}")
+            if summary["deadline"]:
+                print(f"Run took {summary['deadline']['elapsed_seconds']:.1f}s of its "
+                      f"{summary['deadline']['deadline_seconds']:.0f}s deadline with "
+                      f"{len(summary['deadline']['degradations'])} degradation(s)")
+        except IOError as e:
+            print(f"Error writing LLM usage: {e}")
+
+
+run_usage = RunUsage()
+
+
+def add_budget_arguments(parser):
+    """Adds the per-run LLM budget options to a script's argument parser."""
+    parser.add_argument("--max-llm-tokens", type=int, default=None,
+                        help="Stop making LLM calls once this many tokens were used in the run.")
+    parser.add_argument("--max-llm-seconds", type=float, default=None,
+                        help="Stop making LLM calls once they took this many seconds in total.")
+    parser.add_argument("--on-budget-exceeded", choices=["downgrade", "abort"], default="downgrade",
+                        help="Fall back to the plain report sections, or abort the run, when a budget is spent.")
+
+
+def _post(data):
+    response = requests.post(
+        PORTKEY_URL,
+        headers=portkey_headers(),
+        json=data,
+        timeout=(
+            deadline.run_deadline.timeout(_env_float("LLM_CONNECT_TIMEOUT", 5)),
+            deadline.run_deadline.timeout(_env_float("LLM_READ_TIMEOUT", 90)),
+        ),
+    )
+    response.raise_for_status()
+    return response
+
+
+def _post_hedged(data, hedge_delay):
+    """Posts a request and fires one duplicate if no reply arrived after hedge_delay seconds.
+
+    Returns:
+        A tuple of (response, hedged) with the first successful response; hedged
+        is True only if that response came from the duplicate.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        futures = [executor.submit(_post, data)]
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done:
+            print(f"No LLM reply after {hedge_delay:.1f}s, sending a hedged duplicate request.")
+            futures.append(executor.submit(_post, data))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # The original wins a tie
+            for future in sorted(done, key=futures.index):
+                try:
+                    return future.result(), future is not futures[0]
+                except requests.exceptions.RequestException as e:
+                    error = e
+        raise error
+    finally:
+        # The slower request is abandoned rather than awaited
+        executor.shutdown(wait=False)
+
+
+def request_key(data):
+    """Returns the key identifying a request body, including its model."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _response_cache_path(data):
+    return os.path.join(RESPONSE_CACHE_DIR, f"{request_key(data)}.json")
+
+
+def _load_cached_response(data):
+    path = _response_cache_path(data)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["content"]
+
+
+def _store_cached_response(data, content):
+    # Entries are keyed by their request, so concurrent writers of one entry write the same content
+    file_lock.replace_file(_response_cache_path(data), json.dumps({"model": data["model"], "content": content}))
+
+
+def _complete(data, purpose, prompt_version=None):
+    """Makes one hedged request for a fixed model and records its outcome."""
+    model = data["model"]
+    started = time.perf_counter()
+    try:
+        with profiling.stage("llm_wait"):
+            response, hedged = _post_hedged(data, gateway_health.hedge_delay(model))
+    except requests.exceptions.RequestException as e:
+        latency = time.perf_counter() - started
+        run_usage.record(purpose, model, {}, latency, error=str(e), prompt_version=prompt_version)
+        gateway_health.record(model, latency, ok=False)
+        raise
+
+    latency = time.perf_counter() - started
+    body = response.json()
+    usage = body.get("usage") or {}
+    gateway_health.record(
+        model, latency, ok=True,
+        prompt_tokens=usage.get("prompt_tokens") or model_router.estimate_prompt_tokens(data["messages"]),
+    )
+    run_usage.record(
+        purpose,
+        model,
+        usage,
+        latency,
+        response.headers.get("x-portkey-cache-status"),
+        hedged=hedged,
+        prompt_version=prompt_version,
+    )
+    content = body["choices"][0]["message"]["content"]
+    _store_cached_response(data, content)
+    return content
+
+
+class BatchRequests:
+    """The LLM requests of a batched run (see llm_batch), collected instead of sent.
+
+    While a batch round is active, chat_completion answers a request from
+    the replies of the earlier rounds, or collects it and raises LLMDeferred
+    so the caller keeps its plain section for this round. In the final round
+    requests without a reply raise LLMUnavailable instead.
+
+    A reply is matched by the request's key, which includes the model, so
+    each call is routed once per batched run and keeps that route in every
+    round (and in the direct calls after a failed batch).
+    """
+
+    def __init__(self):
+        self.active = False
+        self.final = False
+        self.pending = {}
+        self.replies = {}
+        self.served = set()
+        self.routes = {}
+
+    def start_round(self, final=False):
+        self.active = True
+        self.final = final
+
+    def stop(self):
+        self.active = False
+
+    def route(self, purpose, quality, route):
+        """Returns the models a call was routed to earlier in the batched run, calling route() the first time."""
+        key = (purpose, quality)
+        if key not in self.routes:
+            self.routes[key] = route()
+        return self.routes[key]
+
+    def answers(self, request):
+        """True if the request is part of an active batch round or already has a batch reply."""
+        return self.active or request_key(request) in self.replies
+
+    def take_pending(self):
+        """Returns the requests collected in this round by request key and clears them."""
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def add_replies(self, replies, seconds):
+        """Adds the replies of a finished batch; its wall time is spread over its requests."""
+        for key, reply in replies.items():
+            self.replies[key] = dict(reply, latency=seconds / len(replies))
+
+    def complete(self, request, purpose, prompt_version=None):
+        """Returns the batch reply to a request, recording its usage once."""
+        key = request_key(request)
+        reply = self.replies.get(key)
+        if reply is None:
+            if self.final:
+                raise LLMUnavailable(f"No batch reply for '{purpose}', skipping the call")
+            self.pending[key] = request
+            raise LLMDeferred(f"'{purpose}' was added to the next batch")
+
+        if key not in self.served:
+            self.served.add(key)
+            run_usage.record(purpose, request["model"], reply.get("usage") or {}, reply["latency"],
+                             error=reply.get("error"), prompt_version=prompt_version, batch=True)
+            if reply.get("error") is None:
+                _store_cached_response(request, reply["content"])
+        if reply.get("error") is not None:
+            raise LLMUnavailable(f"Batch request for '{purpose}' failed: {reply['error']}")
+        return reply["content"]
+
+
+batch_requests = BatchRequests()
+
+
+def pace(seconds):
+    """Waits between sequential calls to spare the gateway's rate limit; batched runs do not wait."""
+    if not batch_requests.active:
+        with profiling.stage("llm_wait"):
+            time.sleep(seconds)
+
+
+def chat_completion(data, purpose, quality="standard", prompt_version=None):
+    """Posts a chat completion to Portkey and records its usage.
+
+    Unless the request pins a 'model', the model is picked per call by
+    model_router from the quality tier, the prompt size and the observed
+    latencies and error rates; when a model fails the next one is tried.
+    Requests use explicit connect/read timeouts and are hedged with a duplicate
+    once they run longer than the model's observed latency percentile. While
+    the circuit breaker is open, or when every model fails, the last reply to
+    an identical request is served from the on-disk response cache if present.
+    In a batched run the request is answered from the batch instead.
+
+    Args:
+        data: The request body, including 'messages' and optionally 'model'.
+        purpose: Short label of the call, e.g. 'summary' or 'release_notes:ios'.
+        quality: Required quality tier, 'standard' or 'high'.
+        prompt_version: Key of the PromptTemplate the request was built from, recorded with its usage.
+
+    Returns:
+        The content of the first choice.
+
+    Raises:
+        LLMBudgetExceeded: If the run's budget is already spent.
+        LLMDeferred: In a batched run, if the request was collected for the next batch.
+        LLMUnavailable: If the circuit breaker is open or the gateway keys are missing,
+            and no cached reply exists.
+        LLMDeadlineExceeded: If the call would not finish before the run's deadline
+            and no cached reply exists.
+        requests.exceptions.RequestException: If the request fails.
+    """
+    run_usage.check_budget()
+
+    prompt_tokens = model_router.estimate_prompt_tokens(data["messages"])
+    if "model" in data:
+        models = [data["model"]]
+    elif batch_requests.active or (purpose, quality) in batch_requests.routes:
+        models = batch_requests.route(
+            purpose, quality, lambda: model_router.route(purpose, prompt_tokens, quality, gateway_health)
+        )
+    else:
+        models = model_router.route(purpose, prompt_tokens, quality, gateway_health)
+    candidates = [dict(data, model=model) for model in models]
+
+    if batch_requests.answers(candidates[0]):
+        return batch_requests.complete(candidates[0], purpose, prompt_version)
+
+    if not settings.llm_configured:
+        error = LLMUnavailable("PORTKEY_API_KEY or GOOGLE_VIRTUAL_KEY is not set, skipping the call")
+    elif not deadline.run_deadline.allows(expected_latency(models[0], prompt_tokens)):
+        error = LLMDeadlineExceeded(f"'{purpose}' would not finish before the run deadline, skipping the call")
+    elif gateway_health.allow():
+        error = None
+        for index, request in enumerate(candidates):
+            try:
+                return _complete(request, purpose, prompt_version)
+            except requests.exceptions.RequestException as e:
+                error = e
+                if index + 1 < len(candidates):
+                    if not deadline.run_deadline.allows(expected_latency(candidates[index + 1]["model"], prompt_tokens)):
+                        error = LLMDeadlineExceeded(f"No time left before the run deadline to retry '{purpose}'")
+                        break
+                    print(f"'{purpose}' failed on {request['model']}, falling back to {candidates[index + 1]['model']}.")
+                    run_usage.check_budget()
+                if not gateway_health.allow():
+                    break
+    else:
+        error = LLMUnavailable("Portkey circuit breaker is open, skipping the call")
+
+    late = isinstance(error, LLMDeadlineExceeded) or deadline.run_deadline.expired()
+    for request in candidates:
+        cached = _load_cached_response(request)
+        if cached is not None:
+            print(f"Using the cached reply for '{purpose}' from {request['model']}.")
+            if late:
+                deadline.run_deadline.degrade(f"llm_cached:{purpose}", f"used the cached reply for '{purpose}'")
+            return cached
+    if late:
+        deadline.run_deadline.degrade(f"llm_skipped:{purpose}", f"kept the plain section instead of '{purpose}'")
+    raise error
+
+
+def expected_latency(model, prompt_tokens):
+    """Estimates a call's latency from the model's observed seconds per prompt token."""
+    rate = gateway_health.seconds_per_prompt_token(model)
+    if rate is None:
+        return _env_float("LLM_HEDGE_DEFAULT_DELAY", 20)
+    return rate * prompt_tokens
+
+
+def tag_report_with_platforms(markdown_report, categorized_stories):
+    """Marks every story line of a report with the platform it was categorized into.
+
+    Args:
+        markdown_report: The Markdown report the stories were categorized from.
+        categorized_stories: Output of categorize_stories_by_platform.
+
+    Returns:
+        The report with ' [IOS]'-style tags appended to platform story lines.
+    """
+    platform_by_story = {}
+    for platform in PLATFORMS:
+        for story in categorized_stories.get(platform, []):
+            platform_by_story[story.rsplit(" (Team: ", 1)[0]] = platform
+
+    lines = []
+    for line in markdown_report.split("\n"):
+        platform = platform_by_story.get(line[2:].strip()) if line.startswith("- [") else None
+        lines.append(f"{line} [{platform.upper()}]" if platform else line)
+    return "\n".join(lines)
+
+
+def _platform_tag(line):
+    for platform in PLATFORMS:
+        if line.endswith(f" [{platform.upper()}]"):
+            return platform
+    return None
+
+
+def parse_sections(content):
+    """Validates a structured response and splits it into report sections.
+
+    Raises:
+        ValueError: If the content is not a JSON object with every section as a string.
+    """
+    sections = json.loads(content)
+    if not isinstance(sections, dict):
+        raise ValueError("Structured response is not a JSON object")
+    for key in SECTIONS_SCHEMA["required"]:
+        if not isinstance(sections.get(key), str):
+            raise ValueError(f"Structured response is missing the '{key}' section")
+    return {key: sections[key].strip() for key in SECTIONS_SCHEMA["required"]}
+
+
+def sections_prompt(summary_instructions, release_notes_instructions):
+    """Returns the PromptTemplate of the structured call from a script's summary and release notes instructions."""
+    return prompts.PromptTemplate("sections", 2, f"""You write the weekly release report from the list of stories the user sends.
+Stories tagged [EXTENSION], [IOS] or [ANDROID] belong to that platform. Untagged stories only count towards the summary.
+
+Task 1 - "summary" field:
+{summary_instructions}
+
+Task 2 - "extension", "ios" and "android" fields, each written only from the stories tagged with that platform (use an empty string when a platform has no stories, and do not repeat the platform heading inside a field):
+{release_notes_instructions}
+
+Respond with a single JSON object matching the provided schema.""")
+
+
+def generate_report_sections(markdown_report, categorized_stories, summary_instructions,
+                             release_notes_instructions, quality="standard"):
+    """Generates the summary and all platform release notes with one structured LLM call.
+
+    The story list is sent once, tagged with the locally computed platforms,
+    instead of once for the summary and once per platform, after the static
+    instructions. Near-duplicate stories of the same platform are collapsed
+    into one line.
+
+    Args:
+        markdown_report: The Markdown report listing the stories.
+        categorized_stories: Output of categorize_stories_by_platform.
+        summary_instructions: The script's summary prompt instructions.
+        release_notes_instructions: The script's release notes prompt instructions.
+        quality: Quality tier the model router picks the model for.
+
+    Returns:
+        A dictionary with 'summary', 'extension', 'ios' and 'android' sections,
+        or None if the call fails or the response does not match the schema.
+    """
+    template = sections_prompt(summary_instructions, release_notes_instructions)
+    tagged_report = tag_report_with_platforms(markdown_report, categorized_stories)
+    data = template.request(
+        prompts.story_block(tagged_report, group_of=_platform_tag),
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "weekly_report_sections", "strict": True, "schema": SECTIONS_SCHEMA},
+        },
+    )
+
+    try:
+        return parse_sections(chat_completion(data, "sections", quality, prompt_version=template.key))
+    except LLMDeferred:
+        raise  # The separate calls are not a fallback while the batch is pending
+    except (requests.exceptions.RequestException, LLMSkipped) as e:
+        print(f"Error during structured LLM call: {e}")
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        print(f"Invalid structured LLM response: {e}")
+    return None
+
+
+def compose_release_notes(sections, categorized_stories):
+    """Builds the release notes Markdown from the platform sections of a structured response."""
+    release_notes = "# Release Notes\n\n"
+    for platform in PLATFORMS:
+        if categorized_stories.get(platform) and sections.get(platform):
+            release_notes += f"\n## {PLATFORM_TITLES[platform]}\n\n{sections[platform]}\n\n"
+    return release_notes
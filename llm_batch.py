@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import time
+
+import deadline
+import file_lock
+import llm
+import profiling
+from settings import settings
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+PORTKEY_BASE_URL = "https://api.portkey.ai/v1"
+BATCH_DIR = os.path.join("cache", "llm_batches")
+
+# One round for the first calls, one per corrective release notes call
+# depending on them (release_notes.MAX_FIXES) and one using the last replies
+MAX_ROUNDS = 4
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchFailed(Exception):
+    """Raised when a batch job ends without output or cannot be waited for."""
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+def batch_input(pending):
+    """Returns the JSON Lines input file of a batch job from requests by key."""
+    return "\n".join(
+        json.dumps({"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": body})
+        for key, body in pending.items()
+    ) + "\n"
+
+
+def parse_output(text):
+    """Parses the JSON Lines output file of a batch job.
+
+    Returns:
+        Dictionary of custom_id to {'content', 'usage'}, or {'error'} for failed requests.
+    """
+    replies = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error") or response.get("status_code", 200) >= 400 or not body.get("choices"):
+            replies[record["custom_id"]] = {"error": str(record.get("error") or body.get("error") or "no reply")}
+        else:
+            replies[record["custom_id"]] = {
+                "content": body["choices"][0]["message"]["content"],
+                "usage": body.get("usage") or {},
+            }
+    return replies
+
+
+class PortkeyBatchGateway:
+    """Batch jobs through the Portkey gateway's OpenAI-compatible files and batches API."""
+
+    def __init__(self):
+        self.poll_seconds = _env_float("LLM_BATCH_POLL_SECONDS", 30)
+
+    def _headers(self, content_type=True):
+        headers = llm.portkey_headers()
+        if not content_type:
+            headers.pop("Content-Type", None)
+        return headers
+
+    def submit(self, input_jsonl):
+        """Uploads the input file and creates the batch job; returns its id."""
+        response = requests.post(
+            f"{PORTKEY_BASE_URL}/files",
+            headers=self._headers(content_type=False),
+            files={"file": ("batch.jsonl", input_jsonl.encode(), "application/jsonl")},
+            data={"purpose": "batch"},
+            timeout=deadline.run_deadline.timeout(60),
+        )
+        response.raise_for_status()
+        response = requests.post(
+            f"{PORTKEY_BASE_URL}/batches",
+            headers=self._headers(),
+            json={
+                "input_file_id": response.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+            timeout=deadline.run_deadline.timeout(60),
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def retrieve(self, batch_id):
+        response = requests.get(f"{PORTKEY_BASE_URL}/batches/{batch_id}", headers=self._headers(),
+                                timeout=deadline.run_deadline.timeout(60))
+        response.raise_for_status()
+        return response.json()
+
+    def download(self, file_id):
+        response = requests.get(f"{PORTKEY_BASE_URL}/files/{file_id}/content", headers=self._headers(),
+                                timeout=deadline.run_deadline.timeout(120))
+        response.raise_for_status()
+        return response.text
+
+
+def standin_reply(body):
+    """Answers a request of the local stand-in: a JSON object for structured requests, else a short note."""
+    schema = (body.get("response_format") or {}).get("json_schema", {}).get("schema")
+    if schema:
+        return json.dumps({key: f"Stand-in {key}." for key in schema.get("required", [])})
+    first_line = body["messages"][-1]["content"].strip().split("\n")[0]
+    return f"Stand-in reply to: {first_line[:80]}"
+
+
+class LocalBatchGateway:
+    """Stand-in for the gateway's batch API that runs batch jobs on disk without network calls.
+
+    Jobs take the same validating -> in_progress -> completed steps, one per
+    poll, and produce an output file in the API's format, answered by
+    responder (standin_reply by default). Meant for testing batched runs.
+    """
+
+    def __init__(self, batch_dir=os.path.join(BATCH_DIR, "local"), responder=standin_reply):
+        self.batch_dir = batch_dir
+        self.responder = responder
+        self.poll_seconds = 0
+
+    def _path(self, name):
+        return os.path.join(self.batch_dir, name)
+
+    def submit(self, input_jsonl):
+        batch_id = f"batch_local_{hashlib.sha256(input_jsonl.encode()).hexdigest()[:16]}"
+        file_lock.replace_file(self._path(f"{batch_id}.input.jsonl"), input_jsonl)
+        file_lock.replace_file(self._path(f"{batch_id}.json"), json.dumps({"id": batch_id, "status": "validating"}))
+        return batch_id
+
+    def retrieve(self, batch_id):
+        with open(self._path(f"{batch_id}.json")) as f:
+            batch = json.load(f)
+        if batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress":
+            output = []
+            with open(self._path(f"{batch_id}.input.jsonl")) as f:
+                for line in f:
+                    if line.strip():
+                        request = json.loads(line)
+                        content = self.responder(request["body"])
+                        prompt_tokens = sum(len(m["content"]) for m in request["body"]["messages"]) // 4
+                        output.append(json.dumps({"custom_id": request["custom_id"], "error": None, "response": {
+                            "status_code": 200,
+                            "body": {
+                                "choices": [{"message": {"role": "assistant", "content": content}}],
+                                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                                          "total_tokens": prompt_tokens + len(content) // 4},
+                            },
+                        }}))
+            file_lock.replace_file(self._path(f"{batch_id}.output.jsonl"), "\n".join(output) + "\n")
+            batch.update(status="completed", output_file_id=f"{batch_id}.output.jsonl")
+        file_lock.replace_file(self._path(f"{batch_id}.json"), json.dumps(batch))
+        return batch
+
+    def download(self, file_id):
+        with open(self._path(file_id)) as f:
+            return f.read()
+
+
+def run_batch(gateway, pending):
+    """Submits the requests as one batch job, waits for it and returns the replies by request key.
+
+    The id of a submitted job is kept in cache/llm_batches/ until it
+    finishes, so a rerun with the same requests (e.g. after an interrupted
+    wait) polls the existing job instead of submitting it again.
+
+    Raises:
+        BatchFailed: If the job fails, expires, or the run's deadline passes while waiting.
+        requests.exceptions.RequestException: If the gateway cannot be reached.
+    """
+    input_jsonl = batch_input(pending)
+    submitted_path = os.path.join(BATCH_DIR, "submitted", f"{hashlib.sha256(input_jsonl.encode()).hexdigest()}.json")
+    if os.path.exists(submitted_path):
+        with open(submitted_path) as f:
+            batch_id = json.load(f)["id"]
+        print(f"Resuming batch {batch_id}")
+    else:
+        batch_id = gateway.submit(input_jsonl)
+        file_lock.replace_file(submitted_path, json.dumps({"id": batch_id, "requests": len(pending)}))
+        print(f"Submitted batch {batch_id} with {len(pending)} requests")
+
+    with profiling.stage("llm_wait"):
+        while True:
+            batch = gateway.retrieve(batch_id)
+            if batch["status"] in TERMINAL_STATUSES:
+                break
+            if deadline.run_deadline.expired():
+                raise BatchFailed(f"run deadline reached while batch {batch_id} was {batch['status']}")
+            time.sleep(gateway.poll_seconds)
+
+    os.remove(submitted_path)
+    if batch["status"] != "completed" or not batch.get("output_file_id"):
+        raise BatchFailed(f"batch {batch_id} ended as {batch['status']}")
+    replies = parse_output(gateway.download(batch["output_file_id"]))
+    for key in pending:
+        replies.setdefault(key, {"error": "missing from the batch output"})
+    return replies
+
+
+def run(generate, mode=None, max_rounds=MAX_ROUNDS):
+    """Runs a script's LLM sections directly, or in rounds of batch jobs.
+
+    In batch mode generate() runs once per round. Its LLM calls are answered
+    from the replies of the earlier rounds; the others are collected and
+    submitted together as one batch job, and their sections are finished in
+    the next round. Calls that depend on earlier replies (corrective release
+    notes calls) go into later rounds. If a batch fails, the remaining calls
+    are made directly.
+
+    Args:
+        generate: Function computing the sections; called again every round.
+        mode: None to call the LLM directly, 'portkey' or 'local' (the stand-in) for batches.
+        max_rounds: Rounds after which calls still without a reply are skipped.
+
+    Returns:
+        The result of the last generate() call.
+    """
+    if not mode:
+        return generate()
+
+    gateway = LocalBatchGateway() if mode == "local" else PortkeyBatchGateway()
+    collector = llm.batch_requests
+    try:
+        for round_number in range(1, max_rounds + 1):
+            collector.start_round(final=round_number == max_rounds)
+            try:
+                result = generate()
+            except llm.LLMDeferred:
+                result = None
+            pending = collector.take_pending()
+            if not pending:
+                return result
+
+            started = time.perf_counter()
+            try:
+                collector.add_replies(run_batch(gateway, pending), time.perf_counter() - started)
+            except (requests.exceptions.RequestException, BatchFailed, ValueError, KeyError) as e:
+                print(f"Batch failed ({e}), making the remaining LLM calls directly")  # Earlier replies are kept
+                collector.stop()
+                return generate()
+            print(f"Batch round {round_number}: {len(pending)} replies in {time.perf_counter() - started:.1f}s")
+    finally:
+        collector.stop()
+    return result
+
+
+def add_batch_arguments(parser):
+    """Adds the --batch option to a script's argument parser."""
+    parser.add_argument("--batch", nargs="?", const="portkey", choices=["portkey", "local"], default=None,
+                        help="Send all LLM calls of the run as batch jobs through the gateway (cheaper, "
+                             "for backfills where latency does not matter); 'local' runs them on a "
+                             "local stand-in for testing.")
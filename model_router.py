@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import random
+import time
+
+import file_lock
+from settings import settings
+
+ROUTING_LOG_PATH = os.path.join("cache", "model_routing.jsonl")
+
+# Models in the order they are preferred for each quality tier. Later models
+# are fallbacks; a model of a lower tier is only used when the others fail.
+TIER_MODELS = {
+    "standard": ["gemini-2.0-flash", "gemini-2.5-flash"],
+    "high": ["gemini-2.5-flash", "gemini-2.0-flash"],
+}
+
+CHARS_PER_TOKEN = 4  # Rough prompt size estimate before the real usage is known
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+def estimate_prompt_tokens(messages):
+    """Estimates the prompt tokens of a chat request from its message lengths."""
+    return sum(len(str(message.get("content", ""))) for message in messages) // CHARS_PER_TOKEN
+
+
+def route(purpose, prompt_tokens, quality, health, log=True):
+    """Ranks the models to try for one LLM call.
+
+    The tier's preferred models are kept in order unless their rolling error
+    rate is too high or their expected latency for a prompt of this size is
+    above the slow threshold; such models are moved behind the healthy ones.
+    Observations expire after a while, and a small share of calls keeps the
+    preferred order anyway, so a demoted model gets probed and can recover.
+
+    Args:
+        purpose: Short label of the call, used for logging.
+        prompt_tokens: Estimated prompt size in tokens.
+        quality: Required quality tier, a key of TIER_MODELS.
+        health: A GatewayHealth with the rolling per-model observations.
+        log: Whether to print and log the decision.
+
+    Returns:
+        The models to try, best first.
+    """
+    max_error_rate = _env_float("LLM_ROUTER_MAX_ERROR_RATE", 0.5)
+    slow_seconds = _env_float("LLM_ROUTER_SLOW_SECONDS", 60)
+    max_age = _env_float("LLM_ROUTER_MEMORY_SECONDS", 6 * 3600)
+
+    if random.random() < _env_float("LLM_ROUTER_PROBE_RATE", 0.05):
+        models = list(TIER_MODELS[quality])
+        if log:
+            log_decision(purpose, prompt_tokens, quality, models, {}, probe=True)
+        return models
+
+    healthy, demoted, reasons = [], [], {}
+    for model in TIER_MODELS[quality]:
+        error_rate = health.error_rate(model, max_age=max_age)
+        rate = health.seconds_per_prompt_token(model, max_age=max_age)
+        expected_latency = rate * prompt_tokens if rate is not None else None
+
+        if error_rate is not None and error_rate > max_error_rate:
+            reasons[model] = f"error rate {error_rate:.0%}"
+            demoted.append(model)
+        elif expected_latency is not None and expected_latency > slow_seconds:
+            reasons[model] = f"expected latency {expected_latency:.1f}s"
+            demoted.append(model)
+        else:
+            healthy.append(model)
+
+    models = healthy + demoted
+    if log:
+        log_decision(purpose, prompt_tokens, quality, models, reasons)
+    return models
+
+
+def log_decision(purpose, prompt_tokens, quality, models, reasons, probe=False):
+    """Prints a routing decision and appends it to the routing log for tuning."""
+    demoted = ", ".join(f"{model} ({reason})" for model, reason in reasons.items())
+    print(f"Routing '{purpose}' ({quality}, ~{prompt_tokens} tokens) to {models[0]}"
+          f"{' as a probe' if probe else ''}{f'; demoted {demoted}' if demoted else ''}")
+    try:
+        file_lock.append_line(ROUTING_LOG_PATH, json.dumps({
+            "at": time.time(),
+            "purpose": purpose,
+            "quality": quality,
+            "prompt_tokens": prompt_tokens,
+            "models": models,
+            "demoted": reasons,
+            "probe": probe,
+        }))
+    except IOError as e:
+        print(f"Error writing routing log: {e}")
+
+
+def simulate(profiles, calls, quality, prompt_tokens):
+    """Runs the router against a local stand-in gateway with per-model latency profiles.
+
+    Args:
+        profiles: Mapping of model to (seconds_per_1k_tokens, error_rate).
+        calls: Number of calls to route.
+        quality: Quality tier to request.
+        prompt_tokens: Prompt size of every simulated call.
+
+    Returns:
+        A mapping of model to the number of calls it served.
+    """
+    from llm import GatewayHealth
+
+    health = GatewayHealth(path=None)
+    served = {}
+    for _ in range(calls):
+        for model in route("simulation", prompt_tokens, quality, health, log=False):
+            seconds_per_1k, error_rate = profiles[model]
+            latency = random.uniform(0.8, 1.2) * seconds_per_1k * prompt_tokens / 1000
+            ok = random.random() >= error_rate
+            health.record(model, latency, ok, prompt_tokens)
+            if ok:
+                served[model] = served.get(model, 0) + 1
+                break
+    return served
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate model routing against a local stand-in gateway.")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--quality", choices=sorted(TIER_MODELS), default="high")
+    parser.add_argument("--prompt-tokens", type=int, default=8000)
+    parser.add_argument("--profile", action="append", default=[],
+                        help="MODEL=SECONDS_PER_1K_TOKENS:ERROR_RATE, e.g. gemini-2.5-flash=12:0.2")
+    args = parser.parse_args()
+
+    latency_profiles = {"gemini-2.0-flash": (1.0, 0.0), "gemini-2.5-flash": (4.0, 0.0)}
+    for profile in args.profile:
+        model, values = profile.split("=", 1)
+        seconds_per_1k, error_rate = values.split(":")
+        latency_profiles[model] = (float(seconds_per_1k), float(error_rate))
+
+    print(json.dumps(simulate(latency_profiles, args.calls, args.quality, args.prompt_tokens), indent=2))
@@ -0,0 +1,255 @@
+import argparse
+import csv
+import json
+import os
+import re
+import time
+
+from settings import settings
+
+np = None  # numpy is optional and imported on first use; see _import_numpy
+
+DEFAULT_MODEL_PATH = os.path.join("cache", "platform_classifier.npz")
+CLASSES = ("extension", "ios", "android", "other")
+MIN_CONFIDENCE = 0.6  # Predictions below this posterior fall back to the keyword rules
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_model = None
+_model_loaded = False
+
+
+def model_path():
+    """Returns the path of the trained model, PLATFORM_CLASSIFIER_PATH if set."""
+    return settings.get("PLATFORM_CLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+
+
+def _import_numpy():
+    """Imports numpy on first use; returns False if it is not installed."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # Categorization falls back to the keyword rules
+            return False
+        np = numpy
+    return True
+
+
+class PlatformClassifier:
+    """Multinomial naive Bayes over story title tokens, stored as a compact weight matrix."""
+
+    def __init__(self, classes, vocabulary, log_prior, log_likelihood):
+        self.classes = list(classes)
+        self.vocabulary = {token: index for index, token in enumerate(vocabulary)}
+        self.log_prior = log_prior.astype(np.float32)
+        # One extra zero column absorbs tokens that are not in the vocabulary
+        self.weights = np.hstack([log_likelihood, np.zeros((len(self.classes), 1))]).astype(np.float32)
+
+    @classmethod
+    def load(cls, path=None):
+        data = np.load(path or model_path(), allow_pickle=False)
+        return cls(data["classes"], data["vocabulary"], data["log_prior"], data["log_likelihood"])
+
+    def predict_proba(self, texts):
+        """Scores a batch of texts at once.
+
+        All token indexes of the batch are gathered from the weight matrix in
+        one go and summed per text with np.add.reduceat.
+
+        Returns:
+            An array of shape (len(texts), len(classes)) with class probabilities.
+        """
+        unknown = self.weights.shape[1] - 1
+        lookup = self.vocabulary.get
+        indexes, offsets = [], []
+        for text in texts:
+            offsets.append(len(indexes))
+            indexes.extend(lookup(token, unknown) for token in TOKEN_RE.findall(text.lower()))
+            indexes.append(unknown)  # Keeps every text non-empty for reduceat
+
+        gathered = self.weights[:, np.asarray(indexes, dtype=np.int64)]
+        scores = np.add.reduceat(gathered, np.asarray(offsets, dtype=np.int64), axis=1).T + self.log_prior
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, texts, min_confidence=MIN_CONFIDENCE):
+        """Returns the predicted class per text, or None where the model is not confident."""
+        if not texts:
+            return []
+        probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        confident = probabilities[np.arange(len(texts)), best] >= min_confidence
+        return [self.classes[b] if ok else None for b, ok in zip(best.tolist(), confident.tolist())]
+
+
+def train(texts, labels, alpha=1.0, min_count=1):
+    """Trains the classifier from labeled texts.
+
+    Args:
+        texts: Story texts, formatted like the report lines ('[title](url)').
+        labels: One of CLASSES per text.
+        alpha: Laplace smoothing.
+        min_count: Minimum number of occurrences for a token to enter the vocabulary.
+
+    Returns:
+        A PlatformClassifier.
+    """
+    tokenized = [TOKEN_RE.findall(text.lower()) for text in texts]
+    counts = {}
+    for tokens in tokenized:
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+    vocabulary = sorted(token for token, count in counts.items() if count >= min_count)
+    index = {token: i for i, token in enumerate(vocabulary)}
+
+    class_index = {label: i for i, label in enumerate(CLASSES)}
+    rows, columns = [], []
+    for tokens, label in zip(tokenized, labels):
+        for token in tokens:
+            if token in index:
+                rows.append(class_index[label])
+                columns.append(index[token])
+
+    token_counts = np.zeros((len(CLASSES), len(vocabulary)), dtype=np.float64)
+    np.add.at(token_counts, (np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)), 1)
+    class_counts = np.bincount([class_index[label] for label in labels], minlength=len(CLASSES))
+
+    log_prior = np.log((class_counts + alpha) / (class_counts.sum() + alpha * len(CLASSES)))
+    smoothed = token_counts + alpha
+    log_likelihood = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+    return PlatformClassifier(CLASSES, vocabulary, log_prior, log_likelihood)
+
+
+def save(classifier, path=None):
+    """Writes the classifier as a compressed .npz weight matrix, to model_path() by default."""
+    path = path or model_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    vocabulary = sorted(classifier.vocabulary, key=classifier.vocabulary.get)
+    np.savez_compressed(
+        path,
+        classes=np.array(classifier.classes),
+        vocabulary=np.array(vocabulary),
+        log_prior=classifier.log_prior,
+        log_likelihood=classifier.weights[:, :-1],
+    )
+
+
+def get_classifier():
+    """Returns the trained classifier, or None if numpy or the model file is missing."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        path = model_path()
+        if os.path.exists(path) and _import_numpy():
+            try:
+                _model = PlatformClassifier.load(path)
+            except (IOError, KeyError, ValueError) as e:
+                print(f"Error loading platform classifier, using keyword rules: {e}")
+    return _model
+
+
+def predict_platforms(texts):
+    """Predicts the platform of each story line, or None where keyword rules should decide."""
+    classifier = get_classifier()
+    if classifier is None:
+        return [None] * len(texts)
+    return classifier.predict(texts)
+
+
+def story_text(story):
+    """Formats a raw story like the story lines the classifier sees in reports."""
+    return f"[{story['name']}]({story.get('app_url', '')})"
+
+
+def label_from_story(story, corrections):
+    """Derives a training label from manual corrections, story labels or repository links.
+
+    Returns:
+        One of CLASSES, or None if the story carries no platform evidence.
+    """
+    if str(story.get("id")) in corrections:
+        return corrections[str(story["id"])]
+
+    for label in story.get("labels", []):
+        name = label.get("name", "").lower()
+        for platform in ("extension", "ios", "android"):
+            if platform in name:
+                return platform
+
+    links = [link for link in story.get("external_links", [])]
+    links += [pr.get("url", "") for pr in story.get("pull_requests", [])]
+    links += [branch.get("url", "") for branch in story.get("branches", [])]
+    links = [link.lower() for link in links if "github.com" in link.lower() or "gitlab" in link.lower()]
+    for platform in ("extension", "ios", "android"):
+        if any(platform in link for link in links):
+            return platform
+    return "other" if links else None
+
+
+def load_stories(path):
+    """Reads raw stories from a JSON array or JSON Lines file."""
+    with open(path) as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def load_corrections(path):
+    """Reads manual corrections from a 'story_id,label' CSV file."""
+    if not path:
+        return {}
+    with open(path) as f:
+        return {row[0].strip(): row[1].strip() for row in csv.reader(f) if len(row) >= 2 and row[1].strip() in CLASSES}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or benchmark the story platform classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train from raw stories (JSON array or JSON Lines).")
+    train_parser.add_argument("stories", nargs="+")
+    train_parser.add_argument("--corrections", help="CSV of story_id,label manual corrections.")
+    train_parser.add_argument("--output", default=model_path())
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Time batched scoring of synthetic stories.")
+    benchmark_parser.add_argument("--stories", type=int, default=100000)
+
+    classify_parser = subparsers.add_parser("classify", help="Classify story titles.")
+    classify_parser.add_argument("titles", nargs="+")
+    args = parser.parse_args()
+
+    if not _import_numpy():
+        raise SystemExit("numpy is required for the platform classifier: pip install numpy")
+
+    if args.command == "train":
+        corrections = load_corrections(args.corrections)
+        texts, labels = [], []
+        for path in args.stories:
+            for story in load_stories(path):
+                label = label_from_story(story, corrections)
+                if label:
+                    texts.append(story_text(story))
+                    labels.append(label)
+        if not texts:
+            raise SystemExit("No labeled stories found.")
+
+        save(train(texts, labels), args.output)
+        print(f"Trained on {len(texts)} stories " +
+              ", ".join(f"{c}: {labels.count(c)}" for c in CLASSES) + f"; saved to {args.output}")
+
+    elif args.command == "benchmark":
+        classifier = get_classifier()
+        if classifier is None:
+            raise SystemExit(f"No trained model at {model_path()}")
+        vocabulary = list(classifier.vocabulary)
+        texts = [" ".join(vocabulary[(i * 7 + j * 13) % len(vocabulary)] for j in range(8))
+                 for i in range(args.stories)]
+        started = time.perf_counter()
+        classifier.predict(texts)
+        print(f"Classified {len(texts)} stories in {time.perf_counter() - started:.3f}s")
+
+    else:
+        for title, platform in zip(args.titles, predict_platforms(args.titles)):
+            print(f"{platform or 'keyword rules'}\t{title}")
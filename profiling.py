@@ -0,0 +1,291 @@
+import atexit
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from settings import settings
+
+PROFILES_DIR = "profiles"
+
+# Allocation sites and functions listed per stage in the summary
+TOP_ENTRIES = 10
+
+NO_STAGE = "(no stage)"
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+def _file_name(stage):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in stage)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StageStats:
+    """The profile of one pipeline stage, accumulated over all the times it ran."""
+
+    def __init__(self):
+        import cProfile
+
+        self.calls = 0
+        self.seconds = 0.0
+        self.profile = cProfile.Profile()
+        self.net_bytes = 0
+        self.peak_bytes = 0
+        self.allocations = {}
+
+
+class _Stage:
+    """Context manager of one run of a stage; see RunProfile.stage."""
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.stats = None
+        self.overhead = 0.0
+        self.started = None
+        self.snapshot = None
+        self.traced = 0
+        self.peak = 0
+
+    def __enter__(self):
+        self.profile._enter(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile._exit(self)
+        return False
+
+
+class RunProfile:
+    """cProfile, stack sampling and allocation tracking per pipeline stage of one report run.
+
+    Stages are the run's checkpoint stages (search pagination under
+    'stories', 'categorized', 'summary', ...) plus finer ones marked with
+    stage() or @profiled: Shortcut and LLM waits, JSON decoding, date
+    parsing and rendering. Without --profile every stage is a no-op.
+
+    With it, a background thread samples the main thread's stack every
+    PROFILE_SAMPLE_MS milliseconds (default 5) into collapsed stacks rooted
+    at the active stage path, ready for flamegraph.pl or speedscope; each
+    stage gets its own cProfile, switched off while a nested stage runs so
+    its times are exclusive; and tracemalloc gives every stage its net and
+    peak allocations (inclusive of nested stages) and, from snapshots taken
+    around its first PROFILE_SNAPSHOT_CALLS runs (default 5, as snapshots
+    are slow), its top allocation sites. The profiler's own bookkeeping is left
+    out of the samples, allocations and stage times. Everything is written
+    to profiles/<report>_<time>/ when the run exits.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.report_type = None
+        self.output_dir = None
+        self.stages = {}
+        self.active = []
+        self.samples = {}
+        self.stage_samples = {}
+        self.overhead = 0.0
+        self.snapshot_calls = 0
+        self._busy = False
+        self._filters = None
+        self._thread_id = None
+        self._started = None
+        self._stop = None
+        self._sampler = None
+
+    def configure(self, report_type, output_dir=None):
+        """Starts profiling the run if output_dir is given ('' for the default directory)."""
+        if output_dir is None:
+            return
+        import tracemalloc
+
+        self.enabled = True
+        self.report_type = report_type
+        self.output_dir = output_dir or os.path.join(
+            PROFILES_DIR, f"{report_type}_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}"
+        )
+        self.snapshot_calls = int(_env_float("PROFILE_SNAPSHOT_CALLS", 5))
+        self._started = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        tracemalloc.start()
+        self._filters = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample, args=(self._thread_id, _env_float("PROFILE_SAMPLE_MS", 5) / 1000),
+            name="profile-sampler", daemon=True,
+        )
+        self._sampler.start()
+        atexit.register(self.write)
+        print(f"Profiling the run into {self.output_dir}")
+
+    def _sample(self, thread_id, interval):
+        while not self._stop.wait(interval):
+            if self._busy:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            path = [stage.name for stage in list(self.active)] or [NO_STAGE]
+            frames = []
+            while frame is not None:
+                if frame.f_code.co_filename != __file__:
+                    frames.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            key = ";".join(path + frames[::-1])
+            self.samples[key] = self.samples.get(key, 0) + 1
+            self.stage_samples[path[-1]] = self.stage_samples.get(path[-1], 0) + 1
+
+    def _snapshot(self):
+        import tracemalloc
+
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+
+    def _fold_peak(self):
+        """Credits the traced peak so far to every active stage before the peak is reset."""
+        import tracemalloc
+
+        peak = tracemalloc.get_traced_memory()[1]
+        for stage in self.active:
+            stage.peak = max(stage.peak, peak)
+
+    def stage(self, name):
+        """Returns a context manager profiling the code in it as the named stage.
+
+        Only stages entered on the thread that started profiling are
+        recorded; elsewhere (e.g. hedged LLM requests) this is a no-op.
+        """
+        if not self.enabled or threading.get_ident() != self._thread_id:
+            return contextlib.nullcontext()
+        return _Stage(self, name)
+
+    def _enter(self, stage):
+        import tracemalloc
+
+        bookkeeping = time.perf_counter()
+        self._busy = True
+        stats = stage.stats = self.stages.get(stage.name)
+        if stats is None:
+            stats = stage.stats = self.stages[stage.name] = StageStats()
+        if self.active:
+            self.active[-1].stats.profile.disable()
+        self._fold_peak()
+        if stats.calls < self.snapshot_calls:
+            stage.snapshot = self._snapshot()
+        stage.traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.active.append(stage)
+        self._busy = False
+        stage.started = time.perf_counter()
+        self.overhead += stage.started - bookkeeping
+        stage.overhead = self.overhead
+        stats.profile.enable()
+
+    def _exit(self, stage):
+        import tracemalloc
+
+        stats = stage.stats
+        stats.profile.disable()
+        bookkeeping = time.perf_counter()
+        self._busy = True
+        self._fold_peak()
+        self.active.pop()
+        stats.calls += 1
+        # Time spent profiling nested stages is not the stage's own
+        stats.seconds += bookkeeping - stage.started - (self.overhead - stage.overhead)
+        stats.net_bytes += tracemalloc.get_traced_memory()[0] - stage.traced
+        stats.peak_bytes = max(stats.peak_bytes, stage.peak - stage.traced)
+        if stage.snapshot is not None:
+            for diff in self._snapshot().compare_to(stage.snapshot, "lineno"):
+                if diff.size_diff:
+                    frame = diff.traceback[0]
+                    site = f"{frame.filename}:{frame.lineno}"
+                    size, count = stats.allocations.get(site, (0, 0))
+                    stats.allocations[site] = (size + diff.size_diff, count + diff.count_diff)
+        self._busy = False
+        self.overhead += time.perf_counter() - bookkeeping
+        if self.active:
+            self.active[-1].stats.profile.enable()
+
+    def summary(self):
+        """Returns the per-stage summary: wall time, samples, allocations and top functions."""
+        import pstats
+
+        lines = [f"Profile of the {self.report_type} run ({time.perf_counter() - self._started:.2f}s, "
+                 f"{sum(self.samples.values())} samples)", ""]
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+            lines.append(
+                f"== {name}: {stats.calls} calls, {stats.seconds:.3f}s, {self.stage_samples.get(name, 0)} samples, "
+                f"net {stats.net_bytes / 1024:+.1f} KiB, peak {stats.peak_bytes / 1024:.1f} KiB"
+            )
+            lines.append("  Top allocations (net bytes, blocks):")
+            top = sorted(stats.allocations.items(), key=lambda item: -abs(item[1][0]))[:TOP_ENTRIES]
+            lines += [f"    {size:+10d} {count:+6d}  {site}" for site, (size, count) in top] or ["    none"]
+            lines.append("  Top functions (own seconds, calls):")
+            functions = sorted(
+                (item for item in pstats.Stats(stats.profile).stats.items() if item[0][0] != __file__),
+                key=lambda item: -item[1][2],
+            )[:TOP_ENTRIES]
+            lines += [
+                f"    {own:10.4f} {calls:6d}  {function} ({os.path.basename(filename)}:{lineno})"
+                for (filename, lineno, function), (_, calls, own, _, _) in functions
+            ] or ["    none"]
+            lines.append("")
+        return "\n".join(lines)
+
+    def write(self):
+        """Stops profiling and writes the collapsed stacks, the cProfile files and the summary."""
+        if not self.enabled:
+            return
+        import tracemalloc
+
+        self.enabled = False
+        self._stop.set()
+        self._sampler.join()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, "stacks.collapsed"), "w") as f:
+                for key, count in sorted(self.samples.items()):
+                    f.write(f"{key} {count}\n")
+            for name, stats in self.stages.items():
+                stats.profile.dump_stats(os.path.join(self.output_dir, f"{_file_name(name)}.prof"))
+            with open(os.path.join(self.output_dir, "summary.txt"), "w") as f:
+                f.write(self.summary() + "\n")
+            print(f"Profile written to {self.output_dir} (stacks.collapsed, summary.txt, one .prof per stage)")
+        except IOError as e:
+            print(f"Error writing profile: {e}")
+        finally:
+            tracemalloc.stop()
+
+
+run_profile = RunProfile()
+
+
+def stage(name):
+    """Profiles the code in a with block as the named stage of the run's profile."""
+    return run_profile.stage(name)
+
+
+def profiled(name):
+    """Decorator profiling every call of a function as the named stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with run_profile.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_profile_arguments(parser):
+    """Adds the --profile option to a script's argument parser."""
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="DIR",
+                        help=f"Profile every stage of the run (stack samples for flamegraphs, cProfile and "
+                             f"allocations) and write the results to DIR (default: {PROFILES_DIR}/).")
@@ -0,0 +1,98 @@
+import hashlib
+import re
+
+import dedup
+
+STORY_ID_RE = re.compile(r"/story/(\d+)")
+ENTITY_ID_RE = re.compile(r"/(epic|story)/(\d+)")
+HEADING_RE = re.compile(r"^(#+) ")
+
+
+class PromptTemplate:
+    """A versioned prompt laid out for provider-side prefix caching.
+
+    The static instructions are sent first, as the system message, and are
+    identical in every call and every run; only the user message after them
+    varies. Providers cache the longest repeated prompt prefix, so repeated
+    runs (and the per-platform calls sharing one template) only pay full
+    price for the variable part. Bump the version when the instructions
+    change in meaning; the key also carries a digest of the text, so usage
+    records never mix two wordings under one version.
+    """
+
+    def __init__(self, name, version, instructions):
+        self.name = name
+        self.version = version
+        self.instructions = instructions
+        self.key = f"{name}.v{version}:{hashlib.sha256(instructions.encode()).hexdigest()[:8]}"
+
+    def messages(self, content):
+        """Returns the chat messages: the static prefix, then the variable content."""
+        return [
+            {"role": "system", "content": self.instructions},
+            {"role": "user", "content": content},
+        ]
+
+    def request(self, content, **fields):
+        """Returns a chat completion request body for the content, with optional extra fields."""
+        return {"messages": self.messages(content), **fields}
+
+
+def _line_key(line):
+    match = ENTITY_ID_RE.search(line)
+    return (0, match.group(1), int(match.group(2)), line) if match else (1, "", 0, line)
+
+
+def canonical_lines(lines):
+    """Sorts story lines by their Shortcut id, so the same stories give the same prompt in any order.
+
+    Only lines that start a Markdown list item or link are moved; other lines
+    keep their positions.
+    """
+    positions = [i for i, line in enumerate(lines) if dedup.STORY_LINE_RE.match(line)]
+    ordered = sorted((lines[i] for i in positions), key=_line_key)
+    lines = list(lines)
+    for position, line in zip(positions, ordered):
+        lines[position] = line
+    return lines
+
+
+def canonical_report(markdown_report):
+    """Returns the report with sibling sections sorted by heading and their story lines by id.
+
+    Team sections otherwise follow the order the API returned their first
+    story in; the canonical form is the same for every ordering of the same
+    stories, which keeps the prompt prefix and the response cache key stable.
+    """
+    root = {"heading": None, "lines": [], "children": []}
+    stack = [(0, root)]
+    for line in markdown_report.split("\n"):
+        match = HEADING_RE.match(line)
+        if match:
+            level = len(match.group(1))
+            while stack[-1][0] >= level:
+                stack.pop()
+            node = {"heading": line, "lines": [], "children": []}
+            stack[-1][1]["children"].append(node)
+            stack.append((level, node))
+        else:
+            stack[-1][1]["lines"].append(line)
+
+    def render(node):
+        lines = [node["heading"]] if node["heading"] is not None else []
+        lines += canonical_lines(node["lines"])
+        for child in sorted(node["children"], key=lambda child: child["heading"]):
+            lines += render(child)
+        return lines
+
+    return "\n".join(render(root))
+
+
+def story_block(markdown_report, group_of=None):
+    """Returns the canonical, near-duplicate collapsed story block of a report for a prompt."""
+    return dedup.collapse_report(canonical_report(markdown_report), group_of)
+
+
+def story_lines_block(lines):
+    """Returns the canonical, near-duplicate collapsed block of a list of story lines."""
+    return "\n".join(dedup.collapse_story_lines(canonical_lines(lines)))
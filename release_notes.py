@@ -0,0 +1,181 @@
+import argparse
+import re
+import sys
+
+import llm
+import prompts
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+# Store listing limits on the release notes body, heading excluded
+NOTE_LIMITS = {
+    "extension": 700,
+    "ios": 700,
+    "android": 500,
+}
+NOTE_SECTIONS = ("Features", "Security Enhancements", "Bug Fixes")
+FORBIDDEN_MARKDOWN = {
+    "bold or underline markers (** or __)": re.compile(r"\*\*|__"),
+    "inline code backticks": re.compile(r"`"),
+    "Markdown links": re.compile(r"\[[^\]]*\]\([^)]*\)"),
+    "Markdown headings": re.compile(r"^\s*#", re.M),
+}
+MAX_FIXES = 2
+
+HEADING_RE = re.compile(r"^\s*#{1,6}\s*(.+?)\s*$")
+
+CORRECTIVE_PROMPT = prompts.PromptTemplate("release_notes_fix", 2, """You revise release notes. Keep their content, tone and order, fix only the problems the user lists and return only the revised release notes.""")
+
+
+def split_heading(text):
+    """Splits platform notes into their leading Markdown heading (or None) and the body."""
+    lines = text.strip().split("\n")
+    match = HEADING_RE.match(lines[0]) if lines else None
+    if not match:
+        return None, text.strip()
+    return match.group(1), "\n".join(lines[1:]).strip()
+
+
+def validate_notes(platform, text, heading=True):
+    """Checks the release notes of one platform against the store constraints.
+
+    Args:
+        platform: 'extension', 'ios' or 'android'.
+        text: The generated notes.
+        heading: Whether the notes must start with their '## <Platform>'
+            heading (separate per-platform calls) or must have none
+            (structured single call, where the heading is added locally).
+
+    Returns:
+        A list of violations, each phrased as the fix it needs; empty if
+        the notes are valid.
+    """
+    title = llm.PLATFORM_TITLES[platform]
+    found_heading, body = split_heading(text)
+    violations = []
+
+    if heading and (found_heading is None or not found_heading.lower().startswith(title.lower())):
+        violations.append(f'Start with the heading "## {title}".')
+    if not heading and found_heading is not None:
+        violations.append("Remove the heading; start directly with the notes.")
+
+    limit = NOTE_LIMITS[platform]
+    if len(body) > limit:
+        violations.append(f"Shorten the notes to at most {limit} characters (currently {len(body)}).")
+
+    if not any(re.search(rf"\b{section}\b", body, re.I) for section in NOTE_SECTIONS):
+        violations.append(f"Organize the notes under {', '.join(NOTE_SECTIONS)} (at least one of them).")
+
+    for description, pattern in FORBIDDEN_MARKDOWN.items():
+        if pattern.search(body):
+            violations.append(f"Remove the {description}; use plain text and line breaks.")
+    return violations
+
+
+def corrective_prompt(platform, text, violations, heading=True):
+    """Returns the user message of CORRECTIVE_PROMPT asking to fix only the listed violations of a section."""
+    title = llm.PLATFORM_TITLES[platform]
+    fixes = "\n".join(f"- {violation}" for violation in violations)
+    heading_rule = f'Start with the heading "## {title}".' if heading else "Do not include a heading."
+    return f"""Revise the following {title} release notes, fixing only these problems:
+{fixes}
+
+{heading_rule}
+
+{text.strip()}"""
+
+
+def _trim_to_limit(platform, text, heading=True):
+    """Drops trailing lines of the notes body until it fits the platform's limit."""
+    found_heading, body = split_heading(text)
+    lines = body.split("\n")
+    while len(lines) > 1 and len("\n".join(lines).strip()) > NOTE_LIMITS[platform]:
+        lines.pop()
+    body = "\n".join(lines).strip()[:NOTE_LIMITS[platform]]
+    return f"## {found_heading}\n\n{body}" if heading and found_heading else body
+
+
+def enforce_constraints(platform, text, heading=True):
+    """Validates the notes of one platform and regenerates only them if they break a constraint.
+
+    The corrective prompt carries the notes and the violations, not the
+    stories, so a fix costs a fraction of the original call. After
+    MAX_FIXES attempts notes that are only too long are trimmed at a line
+    boundary; other remaining violations are reported and kept.
+
+    Args:
+        platform: 'extension', 'ios' or 'android'.
+        text: The generated notes.
+        heading: See validate_notes.
+
+    Returns:
+        The valid (or best available) notes.
+    """
+    title = llm.PLATFORM_TITLES[platform]
+    violations = validate_notes(platform, text, heading)
+    for _ in range(MAX_FIXES):
+        if not violations:
+            return text
+        print(f"{title} release notes break {len(violations)} constraint(s), regenerating the section: "
+              f"{' '.join(violations)}")
+        data = CORRECTIVE_PROMPT.request(corrective_prompt(platform, text, violations, heading))
+        try:
+            text = llm.chat_completion(data, f"release_notes_fix:{platform}", prompt_version=CORRECTIVE_PROMPT.key)
+        except llm.LLMDeferred:
+            raise  # The section is finished in a later batch round
+        except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
+            print(f"Error regenerating release notes for {platform}: {e}")
+            break
+        violations = validate_notes(platform, text, heading)
+
+    if violations and all(violation.startswith("Shorten") for violation in violations):
+        print(f"Trimming {title} release notes to {NOTE_LIMITS[platform]} characters")
+        return _trim_to_limit(platform, text, heading)
+    if violations:
+        print(f"{title} release notes still break constraints: {' '.join(violations)}")
+    return text
+
+
+def platform_section(platform, text):
+    """Returns the platform's own section of notes that cover several platforms, else the notes unchanged."""
+    title = llm.PLATFORM_TITLES[platform]
+    for chunk in re.split(r"^(?=## )", text.strip(), flags=re.M):
+        found_heading, _ = split_heading(chunk)
+        if found_heading and found_heading.lower().startswith(title.lower()):
+            return chunk.strip()
+    return text
+
+
+def report_release_notes(markdown):
+    """Extracts the platform sections of the '# Release Notes' part of a report.
+
+    Returns:
+        A dictionary of platform to its notes, heading included.
+    """
+    _, _, notes = markdown.partition("# Release Notes")
+    sections = {}
+    for chunk in re.split(r"^(?=## )", notes, flags=re.M):
+        found_heading, _ = split_heading(chunk)
+        for platform, title in llm.PLATFORM_TITLES.items():
+            if found_heading and found_heading.lower().startswith(title.lower()):
+                sections[platform] = chunk.strip()
+    return sections
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the release notes of generated GO reports against the store constraints.")
+    parser.add_argument("reports", nargs="+", help="Report Markdown files, e.g. reports/weekly_go_*.md")
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.reports:
+        with open(path, encoding="utf-8") as f:
+            sections = report_release_notes(f.read())
+        for platform, text in sections.items():
+            violations = validate_notes(platform, text)
+            _, body = split_heading(text)
+            status = "ok" if not violations else " ".join(violations)
+            print(f"{path} {llm.PLATFORM_TITLES[platform]} ({len(body)}/{NOTE_LIMITS[platform]} chars): {status}")
+            failed = failed or bool(violations)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import sys
+import threading
+
+REPORT_SCRIPTS = {
+    "done": "shortcut.py",
+    "go": "shortcut-go.py",
+    "dogfooding": "shortcut-done.py",
+}
+
+# Held while a script runs its module code, so concurrent callers (threaded
+# servers) never see a partially executed module
+_load_lock = threading.RLock()
+
+
+def load_report_script(report_type):
+    """Imports one of the report scripts as a module so its functions can be reused.
+
+    The scripts have hyphenated file names and cannot be imported with a plain
+    import statement, so they are loaded by path and cached in sys.modules.
+
+    Args:
+        report_type: One of the keys of REPORT_SCRIPTS.
+
+    Returns:
+        The loaded module.
+    """
+    filename = REPORT_SCRIPTS[report_type]
+    module_name = os.path.splitext(filename)[0].replace("-", "_")
+    with _load_lock:
+        return sys.modules.get(module_name) or _load(module_name, filename)
+
+
+def _load(module_name, filename):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
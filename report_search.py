@@ -0,0 +1,261 @@
+import argparse
+import os
+import re
+import time
+
+REPORTS_DIR = "reports"
+INDEX_NAME = ".search_index.sqlite"
+INDEX_VERSION = 1
+
+REPORT_NAME_RE = re.compile(r"^(?P<kind>[a-z_]+?)_(?P<date>\d{4}-\d{2}-\d{2})\.md$")
+TERM_RE = re.compile(r"[a-z0-9]{2,}")
+STORY_URL_RE = re.compile(r"https?://\S*?/story/(\d+)[^\s)]*")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    kind TEXT,
+    date TEXT,
+    mtime REAL,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    PRIMARY KEY (term, file_id, line)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_file ON postings (file_id);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    PRIMARY KEY (term, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS terms_by_file ON terms (file_id);
+CREATE TABLE IF NOT EXISTS vocabulary (term TEXT PRIMARY KEY, files INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stories (
+    story_id INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    url TEXT,
+    PRIMARY KEY (story_id, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stories_by_file ON stories (file_id);
+"""
+
+
+def _connect(reports_dir):
+    """Opens the index of a reports directory, creating it if needed."""
+    import sqlite3
+
+    connection = sqlite3.connect(os.path.join(reports_dir, INDEX_NAME), timeout=30)
+    connection.executescript(SCHEMA)
+    version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if version is None or int(version[0]) != INDEX_VERSION:
+        connection.executescript(
+            "DELETE FROM postings; DELETE FROM terms; DELETE FROM vocabulary; DELETE FROM stories; DELETE FROM files;"
+        )
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(INDEX_VERSION),))
+        connection.commit()
+    return connection
+
+
+def _remove_file(connection, name):
+    """Drops a report file and its postings from the index."""
+    row = connection.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        return
+    file_id = row[0]
+    connection.execute(
+        "UPDATE vocabulary SET files = files - 1 WHERE term IN (SELECT term FROM terms WHERE file_id = ?)", (file_id,)
+    )
+    connection.execute("DELETE FROM vocabulary WHERE files <= 0")
+    for table in ("postings", "terms", "stories"):
+        connection.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+    connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+
+def _index_file(connection, reports_dir, name):
+    """(Re)indexes one report file: its terms per line and the stories it links to."""
+    path = os.path.join(reports_dir, name)
+    stat = os.stat(path)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        lines = f.read().split("\n")
+
+    _remove_file(connection, name)
+    match = REPORT_NAME_RE.match(name)
+    file_id = connection.execute(
+        "INSERT INTO files (name, kind, date, mtime, size) VALUES (?, ?, ?, ?, ?)",
+        (name, match.group("kind") if match else None, match.group("date") if match else None,
+         stat.st_mtime, stat.st_size),
+    ).lastrowid
+
+    postings, stories = set(), {}
+    for number, line in enumerate(lines, 1):
+        for term in TERM_RE.findall(line.lower()):
+            postings.add((term, file_id, number))
+        for url_match in STORY_URL_RE.finditer(line):
+            stories.setdefault(int(url_match.group(1)), url_match.group(0))
+    terms = {term for term, _, _ in postings}
+    connection.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+    connection.executemany("INSERT INTO terms VALUES (?, ?)", [(term, file_id) for term in terms])
+    connection.executemany(
+        "INSERT INTO vocabulary VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET files = files + 1",
+        [(term,) for term in terms],
+    )
+    connection.executemany("INSERT INTO stories VALUES (?, ?, ?)",
+                           [(story_id, file_id, url) for story_id, url in stories.items()])
+
+
+def update_index(reports_dir=REPORTS_DIR):
+    """Brings the index up to date with the Markdown reports of a directory.
+
+    Only new or changed files (by modification time and size) are read;
+    entries of deleted files are dropped.
+
+    Returns:
+        A tuple of (indexed, removed) file counts.
+    """
+    if not os.path.isdir(reports_dir):
+        return 0, 0
+    connection = _connect(reports_dir)
+    known = {name: (mtime, size) for name, mtime, size in connection.execute("SELECT name, mtime, size FROM files")}
+
+    on_disk = {}
+    for name in os.listdir(reports_dir):
+        if name.endswith(".md"):
+            stat = os.stat(os.path.join(reports_dir, name))
+            on_disk[name] = (stat.st_mtime, stat.st_size)
+
+    indexed = [name for name, signature in on_disk.items() if known.get(name) != signature]
+    removed = [name for name in known if name not in on_disk]
+    with connection:
+        for name in indexed:
+            _index_file(connection, reports_dir, name)
+        for name in removed:
+            _remove_file(connection, name)
+    connection.close()
+    return len(indexed), len(removed)
+
+
+def index_report(filename):
+    """Adds a freshly written report to the index of its directory."""
+    reports_dir = os.path.dirname(filename) or "."
+    try:
+        connection = _connect(reports_dir)
+        with connection:
+            _index_file(connection, reports_dir, os.path.basename(filename))
+        connection.close()
+    except Exception as e:  # The index is a convenience; never fail a report run over it
+        print(f"Error indexing {filename} for search: {e}")
+
+
+def search(terms, reports_dir=REPORTS_DIR, kind=None, limit=20):
+    """Finds the reports containing every term.
+
+    The rarest term drives the lookup and the others are checked per
+    candidate report, so the cost follows the size of the answer rather
+    than the size of the archive.
+
+    Args:
+        terms: Words to look for; matching is case-insensitive on whole words.
+        reports_dir: The reports archive.
+        kind: Optional report kind to restrict to, e.g. 'weekly_go'.
+        limit: Maximum number of reports to return.
+
+    Returns:
+        A list of (name, date, [(line_number, line), ...]) tuples, newest first.
+    """
+    words = {word for term in terms for word in TERM_RE.findall(term.lower())}
+    if not words:
+        return []
+
+    connection = _connect(reports_dir)
+    placeholders = ", ".join("?" for _ in words)
+    frequencies = dict(connection.execute(
+        f"SELECT term, files FROM vocabulary WHERE term IN ({placeholders})", sorted(words)
+    ))
+    if len(frequencies) < len(words):
+        connection.close()
+        return []
+
+    rarest, *others = sorted(words, key=frequencies.get)
+    rows = connection.execute(
+        f"""SELECT f.id, f.name, f.date FROM terms t JOIN files f ON f.id = t.file_id
+            WHERE t.term = ? {"AND f.kind = ?" if kind else ""}
+            {"".join(" AND EXISTS (SELECT 1 FROM terms o WHERE o.term = ? AND o.file_id = t.file_id)" for _ in others)}
+            ORDER BY f.date DESC, f.name DESC LIMIT ?""",
+        [rarest] + ([kind] if kind else []) + others + [limit],
+    ).fetchall()
+
+    results = []
+    for file_id, name, date in rows:
+        numbers = [number for (number,) in connection.execute(
+            f"SELECT DISTINCT line FROM postings WHERE file_id = ? AND term IN ({placeholders}) ORDER BY line",
+            [file_id] + sorted(words),
+        )]
+        with open(os.path.join(reports_dir, name), encoding="utf-8", errors="replace") as f:
+            lines = f.read().split("\n")
+        results.append((name, date, [(number, lines[number - 1].strip()) for number in numbers if number <= len(lines)]))
+    connection.close()
+    return results
+
+
+def find_story(story, reports_dir=REPORTS_DIR):
+    """Lists the reports linking to a story, oldest first.
+
+    Args:
+        story: A story id or a Shortcut story URL.
+
+    Returns:
+        A list of (name, kind, date, url) tuples.
+    """
+    match = STORY_URL_RE.search(story)
+    story_id = int(match.group(1) if match else story)
+    connection = _connect(reports_dir)
+    rows = connection.execute(
+        """SELECT f.name, f.kind, f.date, s.url FROM stories s JOIN files f ON f.id = s.file_id
+           WHERE s.story_id = ? ORDER BY f.date, f.name""",
+        (story_id,),
+    ).fetchall()
+    connection.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the archive of generated reports.")
+    parser.add_argument("--reports-dir", default=REPORTS_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("update", help="Index new and changed reports.")
+
+    query_parser = subparsers.add_parser("query", help="Find the reports containing all words.")
+    query_parser.add_argument("terms", nargs="+")
+    query_parser.add_argument("--kind", help="Only reports of this kind, e.g. weekly_go or dogfooding_report.")
+    query_parser.add_argument("--limit", type=int, default=20)
+
+    story_parser = subparsers.add_parser("story", help="Find the reports that listed a story.")
+    story_parser.add_argument("story", help="Story id or Shortcut story URL.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "update":
+        indexed, removed = update_index(args.reports_dir)
+        print(f"Indexed {indexed} reports, removed {removed} in {time.perf_counter() - started:.2f}s")
+
+    elif args.command == "query":
+        results = search(args.terms, args.reports_dir, args.kind, args.limit)
+        for name, date, lines in results:
+            print(f"{name} ({date or 'undated'})")
+            for number, line in lines[:5]:
+                print(f"  {number}: {line}")
+            if len(lines) > 5:
+                print(f"  ... {len(lines) - 5} more lines")
+        print(f"{len(results)} reports in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    else:
+        rows = find_story(args.story, args.reports_dir)
+        for name, kind, date, url in rows:
+            print(f"{date or 'undated'}  {kind or '-'}  {name}  {url}")
+        print(f"{len(rows)} reports in {(time.perf_counter() - started) * 1000:.1f}ms")
@@ -0,0 +1,320 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from report_loader import REPORT_SCRIPTS, load_report_script
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS_DIR = "reports"
+LOG_DIR = os.path.join("cache", "report_server")
+
+# Report file each script writes, by the start date of its window
+REPORT_FILES = {
+    "done": "weekly_release_{start}.md",
+    "go": "weekly_go_{start}.md",
+    "dogfooding": "dogfooding_report_{start}.md",
+}
+
+# Function of each script computing the start of the window it reports on now
+WINDOW_STARTS = {
+    "done": "get_last_tuesday_utc",
+    "go": "get_last_tuesday_utc",
+    "dogfooding": "get_start_of_last_friday_utc",
+}
+
+# Weekday (Monday=0) every window of a report starts on; dogfooding windows start on any day
+WINDOW_WEEKDAYS = {"done": 1, "go": 1}
+
+# Report types whose file name another script writes too: shortcut-done.py also saves a weekly_release_<start>.md
+SHARED_FILE_NAMES = {"done"}
+
+
+class BuildFailed(Exception):
+    """Raised when a report script exits with an error or writes no report."""
+
+
+class ReportNotFound(Exception):
+    """Raised for a past window that has no report on disk."""
+
+
+def current_window_start(report_type):
+    """Returns the start date ('2026-10-13') of the window a run of the report would cover now."""
+    script = load_report_script(report_type)
+    return getattr(script, WINDOW_STARTS[report_type])().strftime("%Y-%m-%d")
+
+
+def report_path(report_type, start):
+    return os.path.join(REPORTS_DIR, REPORT_FILES[report_type].format(start=start))
+
+
+def is_window_start(report_type, start):
+    """True if a window of the report can start on the date ('2026-10-13')."""
+    weekday = WINDOW_WEEKDAYS.get(report_type)
+    return weekday is None or datetime.strptime(start, "%Y-%m-%d").weekday() == weekday
+
+
+def written_by(report_type, path):
+    """True if the report file was last written by a run of the report's own script.
+
+    Every run writes its usage file next to the report right after it, so the
+    report is the run's if that usage names the report type and is not older
+    than the report. Without a usage file only unshared file names are trusted.
+    """
+    usage_path = os.path.splitext(path)[0] + ".usage.json"
+    try:
+        with open(usage_path) as f:
+            usage = json.load(f)
+        finished_at = datetime.fromisoformat(usage["finished_at"]).timestamp()
+    except (IOError, ValueError, KeyError):
+        return report_type not in SHARED_FILE_NAMES
+    return usage.get("report_type") == report_type and os.path.getmtime(path) <= finished_at + 1
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile wait for its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def in_flight(self):
+        with self._lock:
+            return sorted(self._flights)
+
+    def do(self, key, function):
+        """Calls function, or waits for the call already running for the key.
+
+        Returns:
+            A tuple of (result, shared), shared being True for callers that
+            waited for another caller's call.
+
+        Raises:
+            The exception of the call, for every caller sharing it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+class CachedReport:
+    """A built report with its ETag."""
+
+    def __init__(self, body, path):
+        self.body = body
+        self.path = path
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.built_at = time.time()
+
+    def age(self):
+        return time.time() - self.built_at
+
+
+class ReportServer:
+    """Builds reports on demand by running their scripts, with coalescing and a short-lived cache.
+
+    A report of the current window is built by running its script, like a
+    scheduled run, and reading the report file it writes; reports of past
+    windows are read from the files of earlier runs. Results are cached for
+    ttl seconds. While a build runs, further requests for the same report
+    wait for it instead of starting their own, so a burst of identical
+    requests costs one build. If a rebuild fails, the last built copy is
+    served until a later build succeeds.
+    """
+
+    def __init__(self, script_args=(), ttl=300):
+        self.script_args = list(script_args)
+        self.ttl = ttl
+        self.cache = {}
+        self.builds = 0
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def _read(self, report_type, start):
+        path = report_path(report_type, start)
+        if not is_window_start(report_type, start):
+            raise ReportNotFound(f"No {report_type} window starts on {start}")
+        if not os.path.exists(path) or not written_by(report_type, path):
+            raise ReportNotFound(f"No {report_type} report for the window starting {start}")
+        with open(path, "rb") as f:
+            report = CachedReport(f.read(), path)
+        with self._lock:
+            self.cache[(report_type, start)] = report
+        return report
+
+    def _build(self, report_type, start):
+        import subprocess
+
+        os.makedirs(LOG_DIR, exist_ok=True)
+        log_path = os.path.join(LOG_DIR, f"{report_type}_{start}.log")
+        script = os.path.join(SCRIPT_DIR, REPORT_SCRIPTS[report_type])
+        print(f"Building the {report_type} report for {start}...")
+        started = time.perf_counter()
+        with open(log_path, "w") as log:
+            completed = subprocess.run([sys.executable, script] + self.script_args, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0:
+            raise BuildFailed(f"{report_type} report failed with exit code {completed.returncode}, log in {log_path}")
+        try:
+            report = self._read(report_type, start)
+        except ReportNotFound:
+            raise BuildFailed(f"{report_type} report wrote no {report_path(report_type, start)}, log in {log_path}")
+        with self._lock:
+            self.builds += 1
+        print(f"Built the {report_type} report for {start} in {time.perf_counter() - started:.1f}s")
+        return report
+
+    def get(self, report_type, start=None):
+        """Returns a report, from the cache if it is fresh.
+
+        Args:
+            report_type: One of REPORT_SCRIPTS.
+            start: Start date of the report window; the current window if None.
+
+        Returns:
+            A tuple of (CachedReport, source), source being 'cache', 'build',
+            'shared' (another request's build), 'archive' or 'stale'.
+
+        Raises:
+            ReportNotFound: If a past window has no report file.
+            BuildFailed: If the build fails and no earlier copy exists.
+        """
+        current = current_window_start(report_type)
+        start = start or current
+        key = (report_type, start)
+        with self._lock:
+            cached = self.cache.get(key)
+        if cached is not None and cached.age() < self.ttl:
+            return cached, "cache"
+        if start != current:
+            return self._read(report_type, start), "archive"
+
+        try:
+            report, shared = self._flights.do(key, lambda: self._build(report_type, start))
+        except BuildFailed as e:
+            if cached is None:
+                raise
+            print(f"{e}; serving the copy built {cached.age():.0f}s ago")
+            return cached, "stale"
+        return report, "shared" if shared else "build"
+
+    def status(self):
+        with self._lock:
+            cached = {f"{report_type}/{start}": round(report.age(), 1) for (report_type, start), report in self.cache.items()}
+            builds = self.builds
+        return {
+            "builds": builds,
+            "ttl_seconds": self.ttl,
+            "cached_age_seconds": cached,
+            "building": [f"{report_type}/{start}" for report_type, start in self._flights.in_flight()],
+        }
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value lists the ETag (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def make_handler(server):
+    """Creates the HTTP request handler bound to a report server."""
+
+    class ReportHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                self._respond(200, json.dumps(server.status()).encode(), "application/json")
+                return
+
+            report_type = url.path.rstrip("/").rsplit("/", 1)[-1]
+            if not url.path.startswith("/reports/") or report_type not in REPORT_SCRIPTS:
+                self.send_error(404)
+                return
+            start = parse_qs(url.query).get("start", [None])[0]
+            if start is not None:
+                try:
+                    datetime.strptime(start, "%Y-%m-%d")
+                except ValueError:
+                    self.send_error(400, "start must be a date such as 2026-10-13")
+                    return
+
+            try:
+                report, source = server.get(report_type, start)
+            except ReportNotFound as e:
+                self.send_error(404, str(e))
+                return
+            except BuildFailed as e:
+                self.send_error(502, str(e))
+                return
+
+            headers = {
+                "ETag": report.etag,
+                "Cache-Control": f"max-age={max(0, int(server.ttl - report.age()))}",
+                "X-Report-Source": source,
+            }
+            if etag_matches(self.headers.get("If-None-Match"), report.etag):
+                self._respond(304, b"", headers=headers)
+            else:
+                self._respond(200, report.body, "text/markdown; charset=utf-8", headers)
+
+        def _respond(self, status, body, content_type="text/plain", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if status != 304:
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ReportHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the done, go and dogfooding reports, built on demand.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--ttl", type=float, default=300,
+                        help="Seconds a built report is served from the cache before the next request rebuilds it.")
+    args, script_args = parser.parse_known_args()  # Unknown options are passed on to the report scripts
+
+    report_server = ReportServer(script_args, args.ttl)
+    http_server = ThreadingHTTPServer((args.host, args.port), make_handler(report_server))
+    print(f"Serving reports on http://{args.host}:{args.port}/reports/<done|go|dogfooding>")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,113 @@
+import json
+import os
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+from file_lock import atomic_write
+
+REPORTED_DIR = os.path.join("cache", "reported")
+MAX_WEEKS = 26  # Weeks of history kept per report type
+INDEX_VERSION = 1
+
+STORY_URL_RE = re.compile(r"/story/(\d+)")
+
+
+def current_week(now=None):
+    """Returns the ISO week key ('2025-W07') that a run at `now` reports into."""
+    year, week, _ = (now or datetime.now(timezone.utc)).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class ReportedIndex:
+    """Persistent index of the story ids already included in one report type.
+
+    Ids are kept as one sorted int list per ISO week in
+    cache/reported/<report_type>.json. Stories recorded in earlier weeks are
+    excluded from the next report; the current week is left out of the lookup
+    so rerunning a report in the same week produces the same stories.
+    """
+
+    def __init__(self, report_type, week=None, skip_reported=True, read_only=False, index_dir=REPORTED_DIR):
+        self.report_type = report_type
+        self.read_only = read_only
+        self.week = week or current_week()
+        self.path = os.path.join(index_dir, f"{report_type}.json")
+        self.weeks = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION:
+                    self.weeks = data["weeks"]
+            except (IOError, ValueError, KeyError) as e:
+                print(f"Error reading reported story index {self.path}, starting a new one: {e}")
+
+        # All ids of earlier weeks merged into one sorted array for O(log n) lookups
+        earlier = set()
+        for week, ids in self.weeks.items():
+            if skip_reported and week != self.week:
+                earlier.update(ids)
+        self._earlier = array("q", sorted(earlier))
+
+    def __contains__(self, story_id):
+        if story_id is None:
+            return False
+        i = bisect_left(self._earlier, story_id)
+        return i < len(self._earlier) and self._earlier[i] == story_id
+
+    def __len__(self):
+        return len(self._earlier)
+
+    def exclude(self, stories, also=()):
+        """Drops the raw stories already reported in an earlier week.
+
+        Args:
+            stories: Raw story dictionaries as returned by the Shortcut API.
+            also: Further ReportedIndex instances whose stories are excluded too.
+
+        Returns:
+            The stories that were not reported yet, in input order.
+        """
+        indexes = (self,) + tuple(also)
+        kept = [story for story in stories if not any(story.get("id") in index for index in indexes)]
+        if len(kept) < len(stories):
+            print(f"Skipped {len(stories) - len(kept)} stories already reported in earlier weeks.")
+        return kept
+
+    def record_report(self, *markdown_reports):
+        """Records the stories linked from the given reports as reported this week."""
+        ids = set()
+        for report in markdown_reports:
+            ids.update(int(story_id) for story_id in STORY_URL_RE.findall(report or ""))
+        self.weeks[self.week] = sorted(ids)
+
+        for week in sorted(self.weeks)[:-MAX_WEEKS]:
+            del self.weeks[week]
+
+    def save(self):
+        """Writes the index atomically, unless it was opened read-only."""
+        if self.read_only:
+            return
+        try:
+            atomic_write(self.path, json.dumps({"version": INDEX_VERSION, "weeks": self.weeks}, separators=(",", ":")))
+        except IOError as e:
+            print(f"Error writing reported story index: {e}")
+
+
+def open_reported_index(report_type, include_reported=False, from_snapshot=False):
+    """Returns the reported story index for a run, honouring --include-reported.
+
+    Runs rendered from a snapshot neither skip nor record stories: the
+    snapshot already is the data of the report.
+    """
+    if from_snapshot:
+        return ReportedIndex(report_type, skip_reported=False, read_only=True)
+    return ReportedIndex(report_type, skip_reported=not include_reported)
+
+
+def add_reported_arguments(parser):
+    """Adds the --include-reported option to a script's argument parser."""
+    parser.add_argument("--include-reported", action="store_true",
+                        help="Do not skip the stories already reported in earlier weeks.")
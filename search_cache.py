@@ -0,0 +1,180 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import file_lock
+import profiling
+import shortcut_api
+from settings import settings
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+BASE_URL = "https://api.app.shortcut.com"
+
+SEARCH_CACHE_DIR = os.path.join("cache", "search_days")
+BUCKET_VERSION = 1
+
+# Search operator prefix and story attribute of every bucketed date field. Move dates are not
+# bucketed: a story moved into a state may leave it again, which a final bucket would never see.
+DATE_FIELDS = {"completed": "completed_at"}
+
+MAX_PAGES = 10
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _moment(story, attribute, default):
+    return _parse_time(story.get(attribute)) or default
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def search_stories(query):
+    """Runs a story search and follows its pages.
+
+    Returns:
+        A list of raw story dictionaries, or None if a page could not be fetched.
+    """
+    headers = {"Shortcut-Token": settings.shortcut_api_key}
+    url = f"{BASE_URL}/api/v3/search/stories?query={requests.utils.quote(query)}&detail=full"
+    stories = []
+    for _ in range(MAX_PAGES):
+        try:
+            response = shortcut_api.get(url, headers=headers)
+            response.raise_for_status()
+            with profiling.stage("json_decode"):
+                data = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Request error for search '{query}': {e}")
+            return None
+        stories.extend(data.get("data", []))
+        if not data.get("next"):
+            break
+        url = f"{BASE_URL}{data['next']}"
+    return stories
+
+
+class DaySearchCache:
+    """Story search results of one workflow state, cached in one bucket per UTC day.
+
+    A bucket holds the stories in the state whose completion date falls on
+    that day. A day's bucket is final once it
+    was fetched SEARCH_CACHE_SETTLE_HOURS (default 1) after the day ended
+    and is never fetched again; today's bucket, and a past day's fetched
+    before it settled, are refetched on every use. Any window is composed
+    from the buckets of the days it touches, so overlapping and sliding
+    windows of the three reports only fetch the unsettled days.
+
+    A final bucket keeps the stories that were in the state when it was
+    fetched; a story that leaves the state later stays in its bucket.
+    """
+
+    def __init__(self, directory=SEARCH_CACHE_DIR):
+        self.directory = directory
+        self.settle = timedelta(hours=_env_float("SEARCH_CACHE_SETTLE_HOURS", 1))
+
+    def _path(self, state_id, field, day):
+        return os.path.join(self.directory, str(state_id), field, f"{day.isoformat()}.json")
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                bucket = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"Error loading search bucket {path}, refetching it: {e}")
+            return None
+        return bucket if bucket.get("version") == BUCKET_VERSION else None
+
+    def _fetch_day(self, state_id, field, day):
+        """Searches the stories of one state whose date field falls on the day."""
+        start, end = _day_start(day), _day_start(day + timedelta(days=1))
+        stories = search_stories(f"state:{state_id} {field}_after:{start.isoformat()} {field}_before:{end.isoformat()}")
+        if stories is None:
+            return None
+        attribute = DATE_FIELDS[field]
+        return [story for story in stories if start <= _moment(story, attribute, end) < end]
+
+    def bucket(self, state_id, field, day, now=None):
+        """Returns the stories of one day's bucket, fetching it unless it is final.
+
+        Returns:
+            A tuple of (stories, fetched), or (None, True) if the day could not be fetched.
+        """
+        now = now or datetime.now(timezone.utc)
+        path = self._path(state_id, field, day)
+        bucket = self._load(path)
+        if bucket is not None and bucket["final"]:
+            return bucket["stories"], False
+
+        stories = self._fetch_day(state_id, field, day)
+        if stories is None:
+            return None, True
+        final = now >= _day_start(day + timedelta(days=1)) + self.settle
+        try:
+            file_lock.replace_file(path, json.dumps({
+                "version": BUCKET_VERSION,
+                "state_id": str(state_id),
+                "field": field,
+                "day": day.isoformat(),
+                "fetched_at": now.isoformat(),
+                "final": final,
+                "stories": stories,
+            }))
+        except IOError as e:
+            print(f"Error saving search bucket {path}: {e}")
+        return stories, True
+
+    def stories(self, state_id, field, start, end):
+        """Returns the stories of a state whose date field falls in [start, end].
+
+        Args:
+            state_id: The workflow state id.
+            field: The date field the window applies to, a key of DATE_FIELDS.
+            start: Timezone-aware start of the window.
+            end: Timezone-aware end of the window.
+
+        Returns:
+            A list of raw story dictionaries, or None if a day could not be fetched.
+        """
+        now = datetime.now(timezone.utc)
+        attribute = DATE_FIELDS[field]
+        by_id = {}
+        days = fetched = 0
+        day = start.astimezone(timezone.utc).date()
+        while day <= end.astimezone(timezone.utc).date():
+            stories, was_fetched = self.bucket(state_id, field, day, now)
+            if stories is None:
+                return None
+            # A story completed again shows up in a later bucket too; the last one wins
+            by_id.update((story["id"], story) for story in stories)
+            days += 1
+            fetched += was_fetched
+            day += timedelta(days=1)
+        print(f"Search cache: state {state_id} by {field} date, {days - fetched} of {days} days cached, {fetched} fetched")
+        outside = end + timedelta(days=1)
+        return [story for story in by_id.values() if start <= _moment(story, attribute, outside) <= end]
+
+
+def add_search_cache_arguments(parser):
+    """Adds the --search-cache option to a script's argument parser."""
+    parser.add_argument("--search-cache", action="store_true",
+                        help=f"Compose the story search from per-day result buckets in {SEARCH_CACHE_DIR}/, "
+                             f"fetching only the days that are not final yet.")
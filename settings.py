@@ -0,0 +1,61 @@
+import os
+
+
+class MissingSetting(Exception):
+    """Raised when a setting needed by the current code path is not configured."""
+
+
+class Settings:
+    """Configuration read lazily from the environment and ./.env.
+
+    Nothing is read at import time: .env is loaded on the first lookup, and a
+    missing secret only fails the code path that actually needs it, so
+    render-only runs and runs resumed from checkpoints need no unused keys.
+    """
+
+    def __init__(self):
+        self._dotenv_loaded = False
+
+    def get(self, name, default=None):
+        """Returns a setting, or the default if it is unset or empty."""
+        if not self._dotenv_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            self._dotenv_loaded = True
+        return os.environ.get(name) or default
+
+    def require(self, name, purpose):
+        """Returns a setting that must be configured.
+
+        Args:
+            name: The environment variable.
+            purpose: What the setting is needed for, used in the error message.
+
+        Raises:
+            MissingSetting: If the setting is unset or empty.
+        """
+        value = self.get(name)
+        if not value:
+            raise MissingSetting(f"{name} is not set; it is needed {purpose}. Add it to the environment or .env.")
+        return value
+
+    @property
+    def shortcut_api_key(self):
+        return self.require("SHORTCUT_API_KEY", "to call the Shortcut API")
+
+    @property
+    def portkey_api_key(self):
+        return self.require("PORTKEY_API_KEY", "to call the LLM gateway")
+
+    @property
+    def google_virtual_key(self):
+        return self.require("GOOGLE_VIRTUAL_KEY", "to call the LLM gateway")
+
+    @property
+    def llm_configured(self):
+        """True if the LLM gateway keys are set."""
+        return bool(self.get("PORTKEY_API_KEY") and self.get("GOOGLE_VIRTUAL_KEY"))
+
+
+settings = Settings()
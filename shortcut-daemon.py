@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from report_loader import load_report_script
+from settings import settings
+from story_state import STATE_DIR, StoryState
+
+BASE_URL = "https://api.app.shortcut.com"
+
+state_lock = threading.Lock()
+
+
+def build_done_report(state):
+    """Builds the weekly 'Done' release report (shortcut.py) from the warm state."""
+    script = load_report_script("done")
+    last_tuesday = script.get_last_tuesday_utc()
+    now = datetime.now(timezone.utc)
+
+    stories = state.stories_in_states(script.workflow_states())
+    team_tasks, _ = script.group_completed_stories(stories, last_tuesday, now)
+    return script.create_markdown_report(team_tasks, last_tuesday.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d"))
+
+
+def build_go_report(state):
+    """Builds the weekly 'GO' release report (shortcut-go.py) from the warm state."""
+    script = load_report_script("go")
+    last_tuesday = script.get_last_tuesday_utc()
+    now = datetime.now(timezone.utc)
+
+    stories = state.stories_in_states(script.workflow_states())
+    team_tasks, _ = script.group_completed_stories(stories, last_tuesday, now)
+    teams = script.team_mapping()
+    completed_epics, _ = script.group_completed_epics(
+        list(state.epics.values()),
+        last_tuesday,
+        now,
+        lambda epic: state.team_for_epic(epic, teams),
+    )
+    return script.create_markdown_report(
+        team_tasks, completed_epics, last_tuesday.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d")
+    )
+
+
+def build_dogfooding_report(state):
+    """Builds the dogfooding story list (shortcut-done.py) from the warm state."""
+    script = load_report_script("dogfooding")
+    start_date = script.get_start_of_last_friday_utc()
+    last_tuesday = script.get_start_of_last_tuesday_utc()
+
+    # State intervals recorded from the seed and the webhooks, queried locally
+    index = state.history.index()
+    go_stories_to_exclude = index.in_state_during(script.go_state_id(), last_tuesday, last_tuesday + timedelta(days=1))
+
+    stories_by_team_and_state = defaultdict(lambda: defaultdict(list))
+    owner_ids_set = set()
+    states = script.workflow_states()
+    for state_id in script.target_state_ids():
+        entered = index.entered_during(state_id, start_date, datetime.now(timezone.utc))
+        script.add_stories_to_report(
+            [story for story in state.stories_in_states([state_id]) if story["id"] in entered],
+            states.get(state_id, "Unknown State"),
+            go_stories_to_exclude,
+            stories_by_team_and_state,
+            owner_ids_set,
+        )
+
+    return script.create_dogfooding_report(stories_by_team_and_state)
+
+
+REPORT_BUILDERS = {
+    "done": build_done_report,
+    "go": build_go_report,
+    "dogfooding": build_dogfooding_report,
+}
+
+
+def seed_state(state):
+    """Fills the state with a one-off Shortcut search for every reported workflow state."""
+    import requests
+
+    import shortcut_api
+
+    headers = {"Shortcut-Token": settings.shortcut_api_key}
+    state_ids = set()
+    for report_type in REPORT_BUILDERS:
+        state_ids.update(load_report_script(report_type).workflow_states())
+
+    searches = [(f"/api/v3/search/stories?query=state%3A{state_id}&detail=full", state.upsert_story)
+                for state_id in sorted(state_ids)]
+    searches.append(("/api/v3/search/epics?query=state%3A%22Done%22", state.upsert_epic))
+
+    for path, upsert in searches:
+        url = f"{BASE_URL}{path}"
+        page_count = 0
+        while url and page_count < 10:
+            try:
+                response = shortcut_api.get(url, headers=headers)
+                response.raise_for_status()
+                data = response.json()
+                for entity in data.get("data", []):
+                    upsert(entity)
+                next_page = data.get("next")
+                url = f"{BASE_URL}{next_page}" if next_page else None
+                page_count += 1
+            except requests.exceptions.RequestException as e:
+                print(f"Request error while seeding state: {e}")
+                break
+
+    print(f"Seeded state with {len(state.stories)} stories and {len(state.epics)} epics")
+    state.compact()
+
+
+def verify_signature(body, signature):
+    """Checks the Shortcut 'Payload-Signature' header when a webhook secret is configured."""
+    secret = settings.get("SHORTCUT_WEBHOOK_SECRET")
+    if not secret:
+        return True
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+def make_handler(state):
+    """Creates the HTTP request handler bound to a story state."""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/webhook":
+                self.send_error(404)
+                return
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not verify_signature(body, self.headers.get("Payload-Signature")):
+                self.send_error(401, "Invalid payload signature")
+                return
+
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self.send_error(400, "Invalid JSON payload")
+                return
+
+            with state_lock:
+                state.apply_webhook(payload)
+            self._respond(204, b"")
+
+        def do_GET(self):
+            if self.path == "/health":
+                with state_lock:
+                    status = {
+                        "stories": len(state.stories),
+                        "epics": len(state.epics),
+                        "last_changed_at": state.last_changed_at,
+                    }
+                self._respond(200, json.dumps(status).encode(), "application/json")
+                return
+
+            report_type = self.path.rstrip("/").rsplit("/", 1)[-1]
+            if not self.path.startswith("/reports/") or report_type not in REPORT_BUILDERS:
+                self.send_error(404)
+                return
+
+            started = time.perf_counter()
+            with state_lock:
+                report = REPORT_BUILDERS[report_type](state)
+            print(f"Built '{report_type}' report in {(time.perf_counter() - started) * 1000:.1f} ms")
+            self._respond(200, report.encode(), "text/markdown; charset=utf-8")
+
+        def _respond(self, status, body, content_type="text/plain"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return WebhookHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep a warm Shortcut story state from webhooks and serve reports.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--state-dir",
+                        help=f"Directory of the persisted state (default {STATE_DIR}, or a temporary directory with --replay).")
+    parser.add_argument("--seed", action="store_true", help="Seed the state with a Shortcut search before serving.")
+    parser.add_argument("--replay", nargs="*", default=[],
+                        help="JSON Lines files of recorded webhook payloads to apply before serving.")
+    parser.add_argument("--report", choices=sorted(REPORT_BUILDERS),
+                        help="Print this report from the state and exit instead of serving.")
+    args = parser.parse_args()
+    if args.state_dir is None:
+        # Replayed payloads must not end up in the live state's event log
+        args.state_dir = tempfile.mkdtemp(prefix="story_state_replay_") if args.replay else STATE_DIR
+        if args.replay:
+            print(f"Replaying into the temporary state directory {args.state_dir}")
+
+    story_state = StoryState(args.state_dir).load()
+    print(f"Loaded state with {len(story_state.stories)} stories and {len(story_state.epics)} epics")
+
+    if args.seed:
+        seed_state(story_state)
+
+    for replay_path in args.replay:
+        with open(replay_path) as f:
+            for line in f:
+                if line.strip():
+                    story_state.apply_webhook(json.loads(line))
+        print(f"Replayed webhook payloads from {replay_path}")
+
+    if args.report:
+        print(REPORT_BUILDERS[args.report](story_state))
+        sys.exit(0)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(story_state))
+    print(f"Listening for Shortcut webhooks on http://{args.host}:{args.port}/webhook")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with state_lock:
+            story_state.compact()
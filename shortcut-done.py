@@ -1,27 +1,34 @@
+import argparse
 import os
 import sys
-import requests
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
 import time
 
-load_dotenv()
-OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-OPENAI_ORG_KEY = os.environ["OPENAI_ORG_KEY"]
-SHORTCUT_API_KEY = os.environ["SHORTCUT_API_KEY"]
+import enrichment
+import file_lock
+import llm
+import llm_batch
+import profiling
+import prompts
+import report_search
+import search_cache
+import shortcut_api
+import state_history
+import work_queue
+import workspaces
+from checkpoint import RunCheckpoint, add_checkpoint_arguments
+from deadline import add_deadline_arguments, run_deadline
+from reported_index import add_reported_arguments, open_reported_index
+from settings import settings
+from snapshot import add_snapshot_arguments, open_fetch_stages
+from startup import lazy_import
+
+requests = lazy_import("requests")
 
 BASE_URL = "https://api.app.shortcut.com"
 
-WORKFLOW_STATES = {
-    "500000513": "Done",
-    "500028067": "Go",
-    "500015433": "In Testing",
-    "500029050": "Ready for deployment",
-}
-GO_STATE_ID = "500028067"
-
-TEAM_MAPPING = {
+DEFAULT_TEAM_MAPPING = {
     "686377b2-3918-4de2-bd88-924f7cff3374": "💰Earn Team",
     "67da9922-f33e-431a-9e40-5cbe4ac48d29": "🏦Banking Team",
     "685d209a-04cc-4ec9-9742-49174eae7908": "👋Activation Team",
@@ -39,7 +46,58 @@ TEAM_MAPPING = {
     "65b6a41b-8430-4775-bd60-33cfb1f54ac9": "QA Team",
 }
 
+# Story fields a shard result keeps: the report's own plus the ones
+# --state-history syncs and records the stories' states from
+SHARD_STORY_FIELDS = (
+    "id", "name", "app_url", "description", "group_id", "owner_ids",
+    "updated_at", "moved_at", "created_at", "workflow_state_id",
+)
+
+# Story line of both reports; owner names are only fetched from Shortcut
+# if it references {owners}
+STORY_LINE = "- [{title}]({url})"
+
+# Versioned prompt: the static instructions are the system message, so every
+# run shares the same prompt prefix; stories follow in canonical order
+DOGFOODING_SUMMARY_PROMPT = prompts.PromptTemplate("dogfooding.summary", 2, """You write the dogfooding highlights of the weekly list of stories the user sends.
+
+Based on the stories generate **Dogfooding Highlights**: A brief, high-level summary of the most important features or changes to dogfood.
+Add focus area of testing of a week based on stories. Attach challenges for focus area to make it as quest. If can't find a solid focus area, take a random one from list:
+Security & Privacy Week,New User Onboarding Week,DeFi and DApps Week,Localization & Internationalization Week,Specific Challenges,Performance Challenges,Ecosystem & Integration Challenges,UI/UX Challenges, Edge Case Challenges
+Don't add anything else.
+Use clear, concise language and emojis to make the document easy to read and act upon.""")
+
 # --- Helper Functions ---
+def go_state_id():
+    """Returns the 'Go' workflow state id of the current workspace."""
+    return workspaces.state_id("go", "500028067")
+
+
+def target_state_ids():
+    """Returns the workflow state ids the dogfooding report lists: Done, In Testing and Ready for deployment."""
+    return [
+        workspaces.state_id("done", "500000513"),
+        workspaces.state_id("in_testing", "500015433"),
+        workspaces.state_id("ready_for_deployment", "500029050"),
+    ]
+
+
+def workflow_states():
+    """Returns the names of the reported workflow states, by state id."""
+    done, in_testing, ready_for_deployment = target_state_ids()
+    return {
+        done: "Done",
+        go_state_id(): "Go",
+        in_testing: "In Testing",
+        ready_for_deployment: "Ready for deployment",
+    }
+
+
+def team_mapping():
+    """Returns the Shortcut group id to team name mapping of the current workspace."""
+    return workspaces.team_mapping(DEFAULT_TEAM_MAPPING)
+
+
 def get_start_of_last_friday_utc():
     """Returns the date of last Friday at 00:00 UTC as a timezone-aware datetime."""
     now = datetime.now(timezone.utc)
@@ -56,37 +114,31 @@ def get_start_of_last_tuesday_utc():
     last_tuesday = now - timedelta(days=days_since_tuesday)
     return last_tuesday.replace(hour=0, minute=0, second=0, microsecond=0)
 
-def fetch_owner_details(owner_ids):
-    """Fetches owner details from Shortcut API."""
-    owners = {}
-    for owner_id in owner_ids:
-        url = f"{BASE_URL}/api/v3/members/{owner_id}"
-        headers = {"Shortcut-Token": SHORTCUT_API_KEY}
-        try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                owner_data = response.json()
-                owners[owner_id] = owner_data.get("profile", {}).get("name", "Unknown User")
-            else:
-                owners[owner_id] = "Unknown User"
-        except requests.exceptions.RequestException:
-            owners[owner_id] = "Unknown User"
-    return owners
-
-def fetch_go_stories_from_last_tuesday():
-    """Fetches stories that were in the 'Go' column on the last Tuesday."""
-    headers = {"Shortcut-Token": SHORTCUT_API_KEY}
+def fetch_go_stories_from_last_tuesday(search_days=None):
+    """Fetches stories that were in the 'Go' column on the last Tuesday.
+
+    Args:
+        search_days: Optional search_cache.DaySearchCache to take the stories from Tuesday's bucket.
+
+    Returns:
+        A set of story ids, or None if there is an error fetching data.
+    """
+    headers = {"Shortcut-Token": settings.shortcut_api_key}
     last_tuesday = get_start_of_last_tuesday_utc()
+    if search_days is not None:
+        stories, _ = search_days.bucket(go_state_id(), "completed", last_tuesday.date())
+        return {story["id"] for story in stories} if stories is not None else None
     go_stories_set = set()
 
     # Query for stories completed in the 'Go' state since last Tuesday
-    query = f"state:{GO_STATE_ID} completed_after:{last_tuesday.isoformat()}"
+    query = f"state:{go_state_id()} completed_after:{last_tuesday.isoformat()}"
     url = f"{BASE_URL}/api/v3/search/stories?query={requests.utils.quote(query)}&detail=full"
 
     try:
-        response = requests.get(url, headers=headers)
+        response = shortcut_api.get(url, headers=headers)
         response.raise_for_status()
-        data = response.json()
+        with profiling.stage("json_decode"):
+            data = response.json()
         for story in data.get("data", []):
             if story.get("completed_at"):
                 completion_date = datetime.fromisoformat(story["completed_at"].replace('Z', '+00:00'))
@@ -94,16 +146,220 @@ def fetch_go_stories_from_last_tuesday():
                     go_stories_set.add(story["id"])
     except requests.exceptions.RequestException as e:
         print(f"Error fetching 'Go' stories: {e}")
-        return set()
+        return None
 
     return go_stories_set
 
 
-# The 'fetch_stories_by_state' function is removed, as its logic is now embedded directly in the main block.
+def search_stories_in_state(state_id, start_date, team_filter=""):
+    """Searches Shortcut for the stories moved into a workflow state since start_date.
+
+    Args:
+        state_id: The workflow state id.
+        start_date: Start of the reporting window.
+        team_filter: Optional search operators restricting the teams, e.g. 'team:earn'.
+
+    Returns:
+        A list of raw story dictionaries, or None if there is an error fetching data.
+    """
+    state_name = workflow_states().get(state_id, "Unknown State")
+    headers = {"Shortcut-Token": settings.shortcut_api_key}
+
+    # Build a valid query for each state individually
+    query = f"state:{state_id} moved_after:{start_date.isoformat()} {team_filter}".strip()
+    url = f"{BASE_URL}/api/v3/search/stories?query={requests.utils.quote(query)}&detail=full"
+
+    print(f"Fetching stories in '{state_name}' state since {start_date.date()}...")
+
+    fetched_stories = []
+    page_count = 0
+    while url and page_count < 10:
+        try:
+            response = shortcut_api.get(url, headers=headers)
+            response.raise_for_status()
+            with profiling.stage("json_decode"):
+                data = response.json()
+            fetched_stories.extend(data.get("data", []))
+
+            next_page = data.get("next")
+            url = f"{BASE_URL}{next_page}" if next_page else None
+            page_count += 1
+
+        except requests.exceptions.RequestException as e:
+            print(f"Request error for state '{state_name}': {e}")
+            return None
+
+    return fetched_stories
+
+
+def fetch_team_mention_names():
+    """Fetches the search mention names of the Shortcut teams (groups), by group id.
+
+    Returns:
+        A dictionary of group id to mention name, or None if there is an error fetching data.
+    """
+    headers = {"Shortcut-Token": settings.shortcut_api_key}
+    try:
+        response = shortcut_api.get(f"{BASE_URL}/api/v3/groups", headers=headers)
+        response.raise_for_status()
+        return {group["id"]: group["mention_name"] for group in response.json()}
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching teams: {e}")
+        return None
+
 
+def run_team_shard(task):
+    """Fetches the stories and owner names of one team shard (run by queue workers).
 
+    Args:
+        task: {"start": ISO start of the window, "team": mention name} for one
+            team, or {"start", "team": None, "exclude": [mention names]} for
+            the stories of every team not sharded on its own.
+
+    Returns:
+        {"stories": {state_id: [story]}, "owners": {owner_id: name} or None
+        if the reports do not show owners}, or {"error": message} if a search fails.
+    """
+    start_date = datetime.fromisoformat(task["start"])
+    if task["team"]:
+        team_filter = f"team:{task['team']}"
+    else:
+        team_filter = " ".join(f"!team:{team}" for team in task["exclude"])
+
+    stories_by_state = {}
+    owner_ids = set()
+    for state_id in target_state_ids():
+        stories = search_stories_in_state(state_id, start_date, team_filter)
+        if stories is None:
+            return {"error": f"search of state {state_id} failed"}
+        stories_by_state[state_id] = [
+            {key: story.get(key) for key in SHARD_STORY_FIELDS}
+            for story in stories
+        ]
+        for story in stories:
+            owner_ids.update(story.get("owner_ids", []))
+    owners = enrichment.fetch_member_names(owner_ids) if enrichment.uses(enrichment.OWNERS, STORY_LINE) else None
+    return {"stories": stories_by_state, "owners": owners}
+
+
+def fetch_sharded(args, start_date, end_date):
+    """Fetches the stories of every team through the shard work queue and merges the results.
+
+    One task is queued per team of team_mapping() plus one for all other
+    teams. args.shards local worker processes are started; workers on other
+    hosts can join with --worker on the same --queue-dir.
+
+    Returns:
+        {"stories": {state_id: [story]}, "owners": {owner_id: name}}, or
+        None if the teams cannot be listed.
+    """
+    import subprocess
+
+    mention_names = fetch_team_mention_names()
+    if mention_names is None:
+        return None
+
+    queue = work_queue.DirectoryQueue(args.queue_dir or os.path.join(
+        work_queue.QUEUE_DIR, f"dogfooding_{start_date.strftime('%Y-%m-%d')}_{end_date.strftime('%Y-%m-%d')}"
+    ))
+    if not args.resume:
+        queue.clear()
+
+    teams = [mention_names[group_id] for group_id in team_mapping() if group_id in mention_names]
+    tasks = {f"team_{team}": {"start": start_date.isoformat(), "team": team} for team in teams}
+    tasks["other_teams"] = {"start": start_date.isoformat(), "team": None, "exclude": teams}
+    for task_id, task in tasks.items():
+        queue.put(task_id, task)
+    print(f"Queued {len(tasks)} team shards in {queue.path} for {args.shards} local workers")
+
+    workers = []
+
+    def start_worker():
+        # Workers get the time left of the run, so none outlives its deadline
+        command = [sys.executable, os.path.abspath(__file__), "--worker", queue.path]
+        available = run_deadline.available()
+        if available is not None:
+            command += ["--deadline", f"{max(available, 1):.0f}s"]
+        workers.append(subprocess.Popen(command))
+
+    def handle_orphans(task_ids):
+        """Starts a local worker for shards nobody works on, or with --run-unclaimed runs them here."""
+        if run_deadline.expired():
+            return False
+        if args.shards:
+            start_worker()  # The workers started earlier may have exited already
+        elif args.run_unclaimed:
+            print(f"Running shards {', '.join(task_ids)} in the coordinator")
+            work_queue.run_worker(queue, run_team_shard, should_stop=run_deadline.expired)
+        else:
+            return False
+        return True
+
+    for _ in range(args.shards):
+        start_worker()
+    lease = float(settings.get("SHARD_LEASE_SECONDS") or 300)
+    results = work_queue.wait_for_results(
+        queue, set(tasks), lease, should_stop=run_deadline.expired, on_requeue=handle_orphans,
+        max_idle_leases=int(settings.get("SHARD_MAX_IDLE_LEASES") or 3),
+        claim_seconds=float(settings.get("SHARD_CLAIM_SECONDS") or 60), on_unclaimed=handle_orphans,
+    )
+    for worker in workers:
+        if worker.poll() is None and len(results) < len(tasks):
+            worker.terminate()
+        worker.wait()
+
+    merged = {"stories": {state_id: [] for state_id in target_state_ids()}, "owners": {}}
+    for task_id in tasks:
+        result = results.get(task_id)
+        if result is None:
+            run_deadline.degrade("shards", f"left out shard {task_id}, which did not finish in time")
+            continue
+        if "error" in result:
+            print(f"Shard {task_id} failed: {result['error']}")
+            continue
+        for state_id, stories in result["stories"].items():
+            merged["stories"][state_id].extend(stories)
+        merged["owners"].update(result["owners"] or {})
+    return merged
+
+
+@profiling.profiled("grouping")
+def add_stories_to_report(stories, state_name, go_stories_to_exclude, stories_by_team_and_state, owner_ids_set):
+    """Adds raw Shortcut stories of one workflow state to the team/state grouping.
+
+    Args:
+        stories: Raw story dictionaries as returned by the Shortcut API.
+        state_name: Display name of the workflow state the stories are in.
+        go_stories_to_exclude: Story ids that were already reported from 'Go'.
+        stories_by_team_and_state: Nested team -> state -> stories mapping to fill.
+        owner_ids_set: Set collecting the owner ids of added stories.
+    """
+    teams = team_mapping()
+    for story in stories:
+        story_id = story.get("id")
+        if story_id in go_stories_to_exclude:
+            continue
+
+        group_id = story.get("group_id", "")
+        team_name = teams.get(group_id, "Unknown Squad")
+
+        owner_ids = story.get("owner_ids", [])
+        owner_ids_set.update(owner_ids)
+
+        stories_by_team_and_state[team_name][state_name].append({
+            "title": story["name"],
+            "url": story["app_url"],
+            "description": story.get("description", ""),
+            "owner_ids": owner_ids
+        })
+
+
+@profiling.profiled("render")
 def create_markdown_report(team_tasks, owner_details, start_date, end_date):
-    """Generates the main Markdown report, grouping stories by team and then by state."""
+    """Generates the main Markdown report, grouping stories by team and then by state.
+
+    owner_details maps owner ids to names; it may be None unless STORY_LINE shows owners.
+    """
     markdown_output = f"# Weekly Release Report\n"
     markdown_output += f"**Period:** {start_date.date()} to {end_date.date()}\n\n"
 
@@ -113,10 +369,10 @@ def create_markdown_report(team_tasks, owner_details, start_date, end_date):
             for state, stories in states.items():
                 markdown_output += f"### {state}\n\n"
                 for story in stories:
-                    owner_names = ", ".join(
-                        owner_details.get(owner, "Unknown User") for owner in story["owner_ids"]
-                    )
-                    markdown_output += f"- [{story['title']}]({story['url']})\n"
+                    markdown_output += STORY_LINE.format(
+                        title=story["title"], url=story["url"],
+                        owners=enrichment.owner_names(story["owner_ids"], owner_details),
+                    ) + "\n"
                 markdown_output += "\n"
             markdown_output += "\n"
 
@@ -127,43 +383,17 @@ def generate_dogfooding_summary(markdown_report: str):
     Generates a summary for an agile dogfooding document using LLM.
     ... (rest of the function is the same)
     """
-    openai_api_key = OPENAI_API_KEY
-    if not openai_api_key:
-        print("Error: OPENAI_API_KEY not set.")
-        return None
-
-    headers = {
-        "x-portkey-api-key": os.environ["PORTKEY_API_KEY"],
-        "x-portkey-virtual-key": os.environ["GOOGLE_VIRTUAL_KEY"],
-        "Content-Type": "application/json",
-    }
-
-    prompt = f"""{markdown_report}
-
-Based on the stories above generate **Dogfooding Highlights**: A brief, high-level summary of the most important features or changes to dogfood.
-Add focus area of testing of a week based on stories. Attach challenges for focus area to make it as quest. If can't find a solid focus area, take a random one from list:
-Security & Privacy Week,New User Onboarding Week,DeFi and DApps Week,Localization & Internationalization Week,Specific Challenges,Performance Challenges,Ecosystem & Integration Challenges,UI/UX Challenges, Edge Case Challenges
-Don't add anything else.
-Use clear, concise language and emojis to make the document easy to read and act upon."""
-
-    data = {
-        "model": "gemini-2.5-flash",
-        "messages": [{"role": "user", "content": prompt}],
-    }
+    data = DOGFOODING_SUMMARY_PROMPT.request(prompts.story_block(markdown_report))
 
     try:
-        response = requests.post(
-            "https://api.portkey.ai/v1/chat/completions",
-            headers=headers,
-            json=data,
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
+        return llm.chat_completion(data, "dogfooding_summary", quality="high",
+                                   prompt_version=DOGFOODING_SUMMARY_PROMPT.key)
+    except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
         print(f"Error during OpenAI API call for dogfooding summary: {e}")
         return None
 
-def create_dogfooding_report(team_tasks):
+@profiling.profiled("render")
+def create_dogfooding_report(team_tasks, owner_details=None):
     """Generates a list of stories for dogfooding."""
     dogfooding_output = "# Dogfooding Stories\n\n"
     for team, states in team_tasks.items():
@@ -172,86 +402,133 @@ def create_dogfooding_report(team_tasks):
             for state, stories in states.items():
                 dogfooding_output += f"### {state}\n\n"
                 for story in stories:
-                    dogfooding_output += f"- [{story['title']}]({story['url']})\n"
+                    dogfooding_output += STORY_LINE.format(
+                        title=story["title"], url=story["url"],
+                        owners=enrichment.owner_names(story["owner_ids"], owner_details),
+                    ) + "\n"
                 dogfooding_output += "\n"
     return dogfooding_output
 
 
 if __name__ == "__main__":
-    # 1. Fetch stories from the 'Go' column from last Tuesday
-    go_stories_to_exclude = fetch_go_stories_from_last_tuesday()
-
-    DONE_STATE_ID = "500000513"
-    IN_TESTING_STATE_ID = "500015433"
-    READY_FOR_DEPLOYMENT_STATE_ID = "500029050"
-    TARGET_STATE_IDS = [DONE_STATE_ID, IN_TESTING_STATE_ID, READY_FOR_DEPLOYMENT_STATE_ID]
-
+    parser = argparse.ArgumentParser(description="Generate the weekly dogfooding report.")
+    llm.add_budget_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_reported_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_deadline_arguments(parser)
+    work_queue.add_shard_arguments(parser)
+    state_history.add_state_history_arguments(parser)
+    llm_batch.add_batch_arguments(parser)
+    profiling.add_profile_arguments(parser)
+    search_cache.add_search_cache_arguments(parser)
+    args = parser.parse_args()
+    run_deadline.configure(args.deadline)
+    profiling.run_profile.configure("dogfooding", args.profile)
+
+    if args.worker:
+        tasks = work_queue.run_worker(work_queue.DirectoryQueue(args.worker), run_team_shard, run_deadline.expired)
+        print(f"Worker {work_queue.worker_name()} finished {tasks} shards")
+        sys.exit(0)
+    llm.run_usage.configure("dogfooding", args.max_llm_tokens, args.max_llm_seconds, args.on_budget_exceeded)
+
+    fetch = open_fetch_stages(args, "dogfooding")
+    start_date, end_date = fetch.window or (get_start_of_last_friday_utc(), datetime.now(timezone.utc))
+    checkpoint = RunCheckpoint(
+        "dogfooding", start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"),
+        resume=args.resume, runs_dir=fetch.runs_dir,
+    )
+    fetch.bind(checkpoint)
+
+    # Stories of earlier dogfooding reports and of any 'Go' report are skipped
+    reported = open_reported_index("dogfooding", args.include_reported, args.from_snapshot)
+    go_reported = open_reported_index("go", args.include_reported, args.from_snapshot)
+
+    # 1. Fetch the stories moved into each target state since last Friday,
+    # with --shards per team through the work queue
     stories_by_team_and_state = defaultdict(lambda: defaultdict(list))
     owner_ids_set = set()
-    start_date = get_start_of_last_friday_utc()
-    end_date = datetime.now(timezone.utc)
 
-    for state_id in TARGET_STATE_IDS:
-        state_name = WORKFLOW_STATES.get(state_id, "Unknown State")
-        headers = {"Shortcut-Token": SHORTCUT_API_KEY}
+    sharded = {}
 
-        # Build a valid query for each state individually
-        query = f"state:{state_id} moved_after:{start_date.isoformat()}"
-        url = f"{BASE_URL}/api/v3/search/stories?query={requests.utils.quote(query)}&detail=full"
+    # Only the 'Go' check uses day buckets; a moved story's bucket would keep it after it left the state
+    search_days = search_cache.DaySearchCache() if args.search_cache else None
 
-        print(f"Fetching stories in '{state_name}' state since {start_date.date()}...")
+    def fetch_state(state_id):
+        if args.shards is None:
+            return search_stories_in_state(state_id, start_date)
+        if not sharded:
+            sharded.update(fetch_sharded(args, start_date, end_date) or {"stories": {}, "owners": None})
+        return sharded["stories"].get(state_id)
 
-        page_count = 0
-        while url and page_count < 10:
-            try:
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                stories = data.get("data", [])
+    def fetch_owners():
+        if sharded.get("owners") is not None:
+            return sharded["owners"]
+        return enrichment.fetch_member_names(owner_ids_set)
 
-                for story in stories:
-                    story_id = story.get("id")
-                    if story_id in go_stories_to_exclude:
-                        continue
-
-                    group_id = story.get("group_id", "")
-                    team_name = TEAM_MAPPING.get(group_id, "Unknown Squad")
-
-                    owner_ids = story.get("owner_ids", [])
-                    owner_ids_set.update(owner_ids)
-
-                    stories_by_team_and_state[team_name][state_name].append({
-                        "title": story["name"],
-                        "url": story["app_url"],
-                        "description": story.get("description", ""),
-                        "owner_ids": owner_ids
-                    })
-
-                next_page = data.get("next")
-                url = f"{BASE_URL}{next_page}" if next_page else None
-                page_count += 1
+    stories_by_state = {
+        state_id: fetch.stage(f"stories_{state_id}", lambda: fetch_state(state_id)) or []
+        for state_id in target_state_ids()
+    }
 
-            except requests.exceptions.RequestException as e:
-                print(f"Request error for state '{state_name}': {e}")
-                break
+    # 2. Skip the stories that were in the 'Go' column last Tuesday. With
+    # --state-history this is decided from the stories' state intervals, which
+    # also keeps only the stories that entered their state within the window;
+    # otherwise from the completion date of the stories now in 'Go'.
+    last_tuesday = get_start_of_last_tuesday_utc()
+    if args.state_history:
+        history = state_history.StateHistory().load()
+
+        def fetch_transitions():
+            transitions = history.sync([story for stories in stories_by_state.values() for story in stories])
+            history.save()
+            return transitions
+
+        index = state_history.StateIndex(fetch.stage("state_transitions", fetch_transitions) or {})
+        go_stories_to_exclude = index.in_state_during(go_state_id(), last_tuesday, last_tuesday + timedelta(days=1))
+        for state_id, stories in stories_by_state.items():
+            entered = index.entered_during(state_id, start_date, end_date)
+            stories_by_state[state_id] = [story for story in stories if story["id"] in entered]
+    else:
+        def fetch_go_exclusions():
+            go_stories = fetch_go_stories_from_last_tuesday(search_days)
+            return sorted(go_stories) if go_stories is not None else None
+
+        go_stories_to_exclude = set(fetch.stage("go_exclusions", fetch_go_exclusions) or [])
+
+    states = workflow_states()
+    for state_id, stories in stories_by_state.items():
+        add_stories_to_report(
+            reported.exclude(stories, also=(go_reported,)),
+            states.get(state_id, "Unknown State"),
+            go_stories_to_exclude,
+            stories_by_team_and_state,
+            owner_ids_set,
+        )
 
     if not stories_by_team_and_state:
         print("No stories fetched from Shortcut in the specified timeframe and states.")
         sys.exit(1)
 
-    owner_details = fetch_owner_details(owner_ids_set)
+    owner_details = None
+    if enrichment.uses(enrichment.OWNERS, STORY_LINE):
+        owner_details = fetch.stage("owners", run_deadline.guard("owners", fetch_owners)) or {}
+    fetch.write("dogfooding", start_date, end_date, path=args.snapshot)
 
     # 3. Generate the main report
     stories_report_markdown = create_markdown_report(stories_by_team_and_state, owner_details, start_date, end_date)
     print(stories_report_markdown)
 
     # 4. Generate the dogfooding report
-    dogfooding_report_markdown = create_dogfooding_report(stories_by_team_and_state)
+    dogfooding_report_markdown = create_dogfooding_report(stories_by_team_and_state, owner_details)
     print(dogfooding_report_markdown)
 
     # 5. (Optional) Generate AI summary
     form = "[Report your findings here.](https://forms.gle/F3r6rbq4uYJNfpAN8)"
-    openai_summary = generate_dogfooding_summary(stories_report_markdown)
+    openai_summary = llm_batch.run(
+        lambda: checkpoint.stage("dogfooding_summary", lambda: generate_dogfooding_summary(stories_report_markdown)),
+        args.batch,
+    )
     if openai_summary:
         print("\n--- OpenAI Summary ---\n")
         print(openai_summary)
@@ -263,21 +540,25 @@ if __name__ == "__main__":
     # Main report filename
     main_filename = os.path.join(reports_dir, f"weekly_release_{start_date.strftime('%Y-%m-%d')}.md")
     try:
-        with open(main_filename, "w") as f:
-            f.write(stories_report_markdown)
+        file_lock.atomic_write(main_filename, stories_report_markdown)
         print(f"Weekly release report saved to {main_filename}")
+        reported.record_report(stories_report_markdown)
+        reported.save()
+        report_search.index_report(main_filename)
     except IOError as e:
         print(f"Error writing main report to file: {e}")
 
     # Dogfooding report filename
     dogfooding_filename = os.path.join(reports_dir, f"dogfooding_report_{start_date.strftime('%Y-%m-%d')}.md")
     try:
-        with open(dogfooding_filename, "w") as f:
-            # Handle the case where openai_summary is None
-            if openai_summary:
-                f.write(openai_summary + "\n" + form + "\n" + dogfooding_report_markdown)
-            else:
-                f.write(dogfooding_report_markdown)
+        # Handle the case where openai_summary is None
+        if openai_summary:
+            file_lock.atomic_write(dogfooding_filename, openai_summary + "\n" + form + "\n" + dogfooding_report_markdown)
+        else:
+            file_lock.atomic_write(dogfooding_filename, dogfooding_report_markdown)
         print(f"Dogfooding report saved to {dogfooding_filename}")
+        report_search.index_report(dogfooding_filename)
     except IOError as e:
-        print(f"Error writing dogfooding report to file: {e}")
\ No newline at end of file
+        print(f"Error writing dogfooding report to file: {e}")
+
+    llm.run_usage.write(dogfooding_filename)
\ No newline at end of file
@@ -1,25 +1,34 @@
+import argparse
 import os
 import sys
-import requests
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
-import time
 
-load_dotenv()
-OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-OPENAI_ORG_KEY = os.environ["OPENAI_ORG_KEY"]
-SHORTCUT_API_KEY = os.environ["SHORTCUT_API_KEY"]
-PORTKEY_API_KEY = os.environ["PORTKEY_API_KEY"]
-GOOGLE_VIRTUAL_KEY = os.environ["GOOGLE_VIRTUAL_KEY"]
+import enrichment
+import file_lock
+import llm
+import llm_batch
+import platform_classifier
+import profiling
+import prompts
+import release_notes as notes_constraints
+import report_search
+import search_cache
+import shortcut_api
+import team_sections
+import workspaces
+from checkpoint import NoCheckpoint, RunCheckpoint, add_checkpoint_arguments
+from deadline import add_deadline_arguments, run_deadline
+from reported_index import add_reported_arguments, open_reported_index
+from settings import settings
+from snapshot import add_snapshot_arguments, open_fetch_stages
+from startup import lazy_import
+
+requests = lazy_import("requests")
 
 BASE_URL = "https://api.app.shortcut.com"
 
-WORKFLOW_STATES = {
-    "500028067": "GO",
-}
-
-TEAM_MAPPING = {
+DEFAULT_TEAM_MAPPING = {
     "686377b2-3918-4de2-bd88-924f7cff3374": "Earn Team",
     "67da9922-f33e-431a-9e40-5cbe4ac48d29": "Banking Team",
     "685d209a-04cc-4ec9-9742-49174eae7908": "Activation Team",
@@ -28,6 +37,67 @@ TEAM_MAPPING = {
     "68637e43-f987-4ecb-989b-a71fd18729ee": "Growth Team",
 }
 
+# Epic and story lines of the Markdown report; owner names are only
+# fetched from Shortcut if one of them references {owners}
+EPIC_LINE = "- [{title}]({url})"
+STORY_LINE = "- [{title}]({url})"
+
+SUMMARY_INSTRUCTIONS = """Please create a comprehensive weekly release summary with the following structure:
+
+1. **Executive Summary** (2-3 sentences overview of the week's achievements)
+2. **Key Epics** (summary of work completed at the epic level)
+3. **Team Contributions** (summary of stories completed by each team)
+4. **Platform Breakdown** (if applicable, categorize work by platform)
+
+Use emojis to make the report engaging and ensure the language is accessible to both technical and non-technical stakeholders."""
+
+RELEASE_NOTES_INSTRUCTIONS = """You are an expert in marketing and product development for the crypto industry, 
+specializing in enhancing release notes for Trust Wallet products. 
+Your role is to emulate the style of Apple’s release notes, focusing on clear, structured content with specific 
+feature highlights in a user-friendly presentation. Organize the notes into distinct sections: 
+Features, Security Enhancements, and Bug Fixes. For the Features section, begin each point with a clear 
+subtitle and ensure the subtitle and bullet point are on the same line. Pay special attention to the "feat" 
+label from Github commits; they should all be included in the Features section. Do not include subtitles for 
+Security Enhancements and Bug Fixes to maintain simplicity. Feature descriptions should not end with commit IDs. 
+Use engaging and concise descriptions for new features, and prominently highlight improvements 
+in accessibility and usability. Detail important technical and security updates in an informative yet accessible way
+for non-technical users. Mention any regional or device-specific limitations or availability, similar
+to Apple's style, to manage user expectations. Maintain a professional and neutral tone in the writing, 
+avoiding the use of 'we'. 
+Android release notes have limit of 500 characters.
+iOS and Extension release notes have limit of 700 characters.
+Do not add any markdown formatting for release notes, just add line breaks or industry standard formatting for better readability."""
+
+# Versioned prompts: the static instructions are the system message, so
+# every run shares the same prompt prefix; stories follow in canonical order
+SUMMARY_PROMPT = prompts.PromptTemplate("go.summary", 2, f"""You summarize the weekly release report the user sends.
+
+{SUMMARY_INSTRUCTIONS}""")
+
+RELEASE_NOTES_PROMPT = prompts.PromptTemplate("go.release_notes", 3, f"""You write the release notes of one platform from its completed stories, which the user sends.
+
+{RELEASE_NOTES_INSTRUCTIONS}
+
+Write the notes of the platform the user names only. Start the response with that platform's heading,
+"## Extension", "## iOS" or "## Android", followed by its notes as plain text without any other markup:
+## <Platform>
+[PLATFORM NOTES HERE]""")
+
+
+def go_state_id():
+    """Returns the 'GO' workflow state id of the current workspace."""
+    return workspaces.state_id("go", "500028067")
+
+
+def workflow_states():
+    """Returns the names of the reported workflow states, by state id."""
+    return {go_state_id(): "GO"}
+
+
+def team_mapping():
+    """Returns the Shortcut group id to team name mapping of the current workspace."""
+    return workspaces.team_mapping(DEFAULT_TEAM_MAPPING)
+
 
 def get_last_tuesday_utc():
     """Returns the date of last Tuesday at 00:00 UTC as a timezone-aware datetime."""
@@ -45,29 +115,6 @@ def get_last_tuesday_utc():
     return last_tuesday.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def fetch_owner_details(owner_ids):
-    """Fetches owner details from Shortcut API.
-
-    Args:
-        owner_ids: A list of owner IDs.
-
-    Returns:
-        A dictionary mapping owner_id to owner name. Returns "Unknown User"
-        if the owner's name cannot be retrieved.
-    """
-    owners = {}
-    for owner_id in owner_ids:
-        url = f"{BASE_URL}/api/v3/members/{owner_id}"
-        headers = {"Shortcut-Token": SHORTCUT_API_KEY}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            owner_data = response.json()
-            owners[owner_id] = owner_data.get("profile", {}).get("name", "Unknown User")
-        else:
-            owners[owner_id] = "Unknown User"
-    return owners
-
-
 def parse_date(date_str):
     """Parses a date string from Shortcut API into a timezone-aware datetime."""
     if not date_str:
@@ -83,17 +130,146 @@ def parse_date(date_str):
         return None
 
 
-def fetch_go_epics_from_last_tuesday():
-    """Fetches epics marked as 'Done' from last Tuesday 00:00 UTC to now."""
+@profiling.profiled("grouping")
+def group_completed_stories(stories, start, end):
+    """Groups 'GO' stories completed between start and end by team.
+
+    Args:
+        stories: Raw story dictionaries as returned by the Shortcut API.
+        start: Timezone-aware start of the reporting window.
+        end: Timezone-aware end of the reporting window.
+
+    Returns:
+        A tuple of (team_tasks, owner_ids_set) where team_tasks maps a team
+        name to a list of (title, url, state, owner_ids, description) tuples.
+    """
+    team_tasks = defaultdict(list)
+    owner_ids_set = set()
+    states = workflow_states()
+    teams = team_mapping()
+
+    for story in stories:
+        # Check if the story was completed within our date range
+        completed_at = story.get("completed_at")
+        if not completed_at:
+            continue
+
+        completion_date = parse_date(completed_at)
+        if completion_date is None:
+            print(f"Error parsing completion date for story {story.get('name', 'Unknown')}: {completed_at}")
+            continue
+
+        if start <= completion_date <= end:
+            workflow_state_id = str(story.get("workflow_state_id"))
+            group_id = story.get("group_id", "")
+            description = story.get("description", "")
+            owner_ids = story.get("owner_ids", [])
+            owner_ids_set.update(owner_ids)
+
+            if workflow_state_id in states:
+                state = states[workflow_state_id]
+                team_name = teams.get(group_id, "Unknown Squad")
+
+                if team_name != "Unknown Squad":
+                    team_tasks[team_name].append(
+                        (story["name"], story["app_url"], state, owner_ids, description)
+                    )
+
+    return team_tasks, owner_ids_set
+
+
+@profiling.profiled("grouping")
+def group_completed_epics(epics, start, end, team_for_epic):
+    """Groups epics completed between start and end by team.
+
+    Args:
+        epics: Raw epic dictionaries as returned by the Shortcut API.
+        start: Timezone-aware start of the reporting window.
+        end: Timezone-aware end of the reporting window.
+        team_for_epic: Callable returning the team name for an epic.
+
+    Returns:
+        A tuple of (completed_epics, owner_ids_set) where completed_epics maps
+        a team name to a list of (title, url, owner_ids, description) tuples.
+    """
+    completed_epics = defaultdict(list)
+    owner_ids_set = set()
+
+    for epic in epics:
+        completion_date = parse_date(epic.get("completed_at"))
+
+        if completion_date and start <= completion_date <= end:
+            team_name = team_for_epic(epic)
+
+            owner_ids = epic.get("owner_ids", [])
+            owner_ids_set.update(owner_ids)
+
+            completed_epics[team_name].append(
+                (epic["name"], epic["app_url"], owner_ids, epic.get("description", ""))
+            )
+
+    return completed_epics, owner_ids_set
+
+
+@profiling.profiled("render")
+def create_markdown_report(team_tasks, completed_epics, start_date, end_date, owner_details=None):
+    """Generates the Markdown report listing completed epics and stories by team.
+
+    Lines are rendered with EPIC_LINE and STORY_LINE; owner_details maps
+    owner ids to names and is only needed if a template shows owners.
+    """
+    markdown_output = f"# Weekly Release Report\n"
+    markdown_output += f"**Period:** {start_date} to {end_date}\n\n"
+
+    # Add Completed Epics section
+    markdown_output += f"## Completed Epics\n\n"
+    if not any(completed_epics.values()):
+        markdown_output += "No epics were completed this week.\n\n"
+    else:
+        for team, epics in completed_epics.items():
+            for title, url, owners, description in epics:
+                markdown_output += EPIC_LINE.format(
+                    title=title, url=url, owners=enrichment.owner_names(owners, owner_details)
+                ) + "\n"
+            markdown_output += "\n"
+
+    markdown_output += "---\n\n"
+
+    # Add Completed Stories section
+    markdown_output += f"## Completed Stories by Team\n\n"
+    if not any(team_tasks.values()):
+        markdown_output += "No stories were completed this week.\n\n"
+    else:
+        for team, tasks in team_tasks.items():
+            if tasks:
+                markdown_output += f"### {team}\n\n"
+                for title, url, state, owners, description in tasks:
+                    markdown_output += STORY_LINE.format(
+                        title=title, url=url, owners=enrichment.owner_names(owners, owner_details)
+                    ) + "\n"
+                markdown_output += "\n"
+
+    return markdown_output
+
+
+def fetch_go_epics_from_last_tuesday(window=None):
+    """Fetches the epics marked as 'Done' and the teams of those completed in the window.
+
+    Args:
+        window: Optional (start, end) datetimes replacing last Tuesday 00:00 UTC to now.
+
+    Returns:
+        A dictionary {"epics": [epic], "epic_groups": {epic_id: group_id}} of the
+        raw epics and the group of the first story of every epic completed in the
+        window, or None if there is an error fetching data.
+    """
     headers = {
         "Content-Type": "application/json",
-        "Shortcut-Token": SHORTCUT_API_KEY,
+        "Shortcut-Token": settings.shortcut_api_key,
     }
 
-    last_tuesday = get_last_tuesday_utc()
-    now = datetime.now(timezone.utc)
-    completed_epics = defaultdict(list)
-    owner_ids_set = set()
+    start, end = window or (get_last_tuesday_utc(), datetime.now(timezone.utc))
+    fetched_epics = []
 
     print("Fetching completed epics...")
     url = f"{BASE_URL}/api/v3/search/epics?query=state%3A%22Done%22"
@@ -103,39 +279,11 @@ def fetch_go_epics_from_last_tuesday():
 
     while url and page_count < max_pages:
         try:
-            response = requests.get(url, headers=headers)
+            response = shortcut_api.get(url, headers=headers)
             response.raise_for_status()
-            data = response.json()
-            epics = data.get("data", [])
-
-            for epic in epics:
-                completed_at = epic.get("completed_at")
-                completion_date = parse_date(completed_at)
-
-                if completion_date and last_tuesday <= completion_date <= now:
-                    team_name = "Unknown Squad"
-                    # Find associated team by looking at the stories within the epic
-                    story_urls = epic.get("stories", [])
-                    if story_urls:
-                        # Fetch one story to determine the team
-                        first_story_url = f"{BASE_URL}{story_urls[0]['url']}"
-                        story_response = requests.get(first_story_url, headers=headers)
-                        if story_response.status_code == 200:
-                            story_data = story_response.json()
-                            group_id = story_data.get("group_id")
-                            if group_id in TEAM_MAPPING:
-                                team_name = TEAM_MAPPING[group_id]
-
-                    owner_ids = epic.get("owner_ids", [])
-                    owner_ids_set.update(owner_ids)
-
-                    epic_title = epic["name"]
-                    app_url = epic["app_url"]
-                    description = epic.get("description", "")
-
-                    completed_epics[team_name].append(
-                        (epic_title, app_url, owner_ids, description)
-                    )
+            with profiling.stage("json_decode"):
+                data = response.json()
+            fetched_epics.extend(data.get("data", []))
 
             next_page = data.get("next")
             url = f"{BASE_URL}{next_page}" if next_page else None
@@ -143,45 +291,49 @@ def fetch_go_epics_from_last_tuesday():
 
         except requests.exceptions.RequestException as e:
             print(f"Request error fetching epics: {e}")
-            return {}, set()
+            return None
 
-    print(f"Found {sum(len(epics) for epics in completed_epics.values())} completed epics.")
-    return completed_epics, owner_ids_set
+    # Find the team of each completed epic by looking at the first of its stories
+    epic_groups = {}
+    try:
+        for epic in fetched_epics:
+            completion_date = parse_date(epic.get("completed_at"))
+            story_urls = epic.get("stories", [])
+            if not (completion_date and start <= completion_date <= end and story_urls):
+                continue
+            story_response = shortcut_api.get(f"{BASE_URL}{story_urls[0]['url']}", headers=headers)
+            if story_response.status_code == 200:
+                epic_groups[str(epic["id"])] = story_response.json().get("group_id")
+    except requests.exceptions.RequestException as e:
+        print(f"Request error fetching epics: {e}")
+        return None
 
+    return {"epics": fetched_epics, "epic_groups": epic_groups}
 
-def fetch_go_stories_and_epics_from_last_tuesday():
-    """Fetches stories and epics marked as 'GO' or 'Done' from last Tuesday 00:00 UTC to now.
+
+def search_go_stories():
+    """Searches Shortcut for the stories currently in the 'GO' state.
 
     Returns:
-        A Markdown-formatted string containing the stories grouped by team.
-        Returns an empty string if there is an error fetching data.
+        A list of raw story dictionaries, or None if there is an error fetching data.
     """
     headers = {
         "Content-Type": "application/json",
-        "Shortcut-Token": SHORTCUT_API_KEY,
+        "Shortcut-Token": settings.shortcut_api_key,
     }
 
-    last_tuesday = get_last_tuesday_utc()
-    now = datetime.now(timezone.utc)
-
-    start_date = last_tuesday.strftime("%Y-%m-%d")
-    end_date = now.strftime("%Y-%m-%d")
+    fetched_stories = []
 
-    print(f"Fetching stories marked as 'GO' from {start_date} to {end_date}")
+    state_id = go_state_id()
 
-    team_tasks = defaultdict(list)
-    owner_ids_set = set()
-
-    go_state_id = "500028067"
-
-    url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{go_state_id}&detail=full"
+    url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{state_id}&detail=full"
 
     page_count = 0
     max_pages = 10  # Limit to prevent infinite loops
 
     while url and page_count < max_pages:
         try:
-            response = requests.get(url, headers=headers)
+            response = shortcut_api.get(url, headers=headers)
             if response.status_code != 200:
                 error_data = response.json() if response.content else {"error": "Unknown error"}
                 print(f"Error fetching data: {error_data}")
@@ -189,56 +341,15 @@ def fetch_go_stories_and_epics_from_last_tuesday():
                 # If we hit the maximum results error, let's try a different approach
                 if error_data.get('error') == 'maximum-results-exceeded':
                     print("Too many results. Trying alternative approach...")
-                    return fetch_done_stories_alternative_approach(start_date, end_date)
-                return ""
+                    return fetch_done_stories_alternative_approach()
+                return None
 
-            data = response.json()
+            with profiling.stage("json_decode"):
+                data = response.json()
             stories = data.get("data", [])
 
             print(f"Processing page {page_count + 1}, found {len(stories)} stories")
-
-            for story in stories:
-                # Check if the story was completed within our date range
-                completed_at = story.get("completed_at")
-                if completed_at:
-                    # Parse the completion date
-                    try:
-                        # Handle different datetime formats from Shortcut API
-                        if completed_at.endswith('Z'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('Z', '+00:00'))
-                        elif '+' in completed_at or completed_at.endswith('UTC'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('UTC', '+00:00'))
-                        else:
-                            # If no timezone info, assume UTC
-                            completion_date = datetime.fromisoformat(completed_at).replace(tzinfo=timezone.utc)
-
-                        # Ensure our comparison datetimes are timezone-aware
-                        if last_tuesday.tzinfo is None:
-                            last_tuesday = last_tuesday.replace(tzinfo=timezone.utc)
-                        if now.tzinfo is None:
-                            now = now.replace(tzinfo=timezone.utc)
-
-                        # Check if completion date is within our range
-                        if completion_date >= last_tuesday and completion_date <= now:
-                            workflow_state_id = str(story.get("workflow_state_id"))
-                            group_id = story.get("group_id", "")
-                            description = story.get("description", "")
-                            owner_ids = story.get("owner_ids", [])
-                            owner_ids_set.update(owner_ids)
-
-                            if workflow_state_id in WORKFLOW_STATES:
-                                state = WORKFLOW_STATES[workflow_state_id]
-                                team_name = TEAM_MAPPING.get(group_id, "Unknown Squad")
-                                story_title = story["name"]
-                                app_url = story["app_url"]
-
-                                if team_name != "Unknown Squad":
-                                    team_tasks[team_name].append(
-                                        (story_title, app_url, state, owner_ids, description)
-                                    )
-                    except (ValueError, TypeError) as e:
-                        print(f"Error parsing completion date for story {story.get('name', 'Unknown')}: {e}")
-                        continue
+            fetched_stories.extend(stories)
 
             next_page = data.get("next")
             url = f"{BASE_URL}{next_page}" if next_page else None
@@ -248,153 +359,103 @@ def fetch_go_stories_and_epics_from_last_tuesday():
             print(f"Request error: {e}")
             break
 
-    print(f"Found {sum(len(tasks) for tasks in team_tasks.values())} completed stories")
-
-    # Fetch and combine epic data
-    completed_epics, epic_owner_ids = fetch_go_epics_from_last_tuesday()
-    owner_ids_set.update(epic_owner_ids)
+    return fetched_stories
 
-    owner_details = fetch_owner_details(owner_ids_set)
-
-    markdown_output = f"# Weekly Release Report\n"
-    markdown_output += f"**Period:** {start_date} to {end_date}\n\n"
 
-    # Add Completed Epics section
-    markdown_output += f"## Completed Epics\n\n"
-    if not any(completed_epics.values()):
-        markdown_output += "No epics were completed this week.\n\n"
-    else:
-        for team, epics in completed_epics.items():
-            for title, url, owners, description in epics:
-                owner_names = ", ".join(owner_details.get(owner, "Unknown User") for owner in owners)
-                markdown_output += f"- [{title}]({url})\n"
-            markdown_output += "\n"
-
-    markdown_output += "---\n\n"
-
-    # Add Completed Stories section
-    markdown_output += f"## Completed Stories by Team\n\n"
-    if not any(team_tasks.values()):
-        markdown_output += "No stories were completed this week.\n\n"
-    else:
-        for team, tasks in team_tasks.items():
-            if tasks:
-                markdown_output += f"### {team}\n\n"
-                for title, url, state, owners, description in tasks:
-                    owner_names = ", ".join(owner_details.get(owner, "Unknown User") for owner in owners)
-                    markdown_output += f"- [{title}]({url})\n"
-                markdown_output += "\n"
-
-    return markdown_output
-
-
-def fetch_done_stories_alternative_approach(start_date, end_date):
+def fetch_done_stories_alternative_approach():
     """Alternative approach: fetch stories by team to avoid hitting the 1000 result limit."""
     headers = {
         "Content-Type": "application/json",
-        "Shortcut-Token": SHORTCUT_API_KEY,
+        "Shortcut-Token": settings.shortcut_api_key,
     }
 
     print("Using alternative approach: fetching by team...")
 
-    team_tasks = defaultdict(list)
-    owner_ids_set = set()
-    go_state_id = "500028067"
-
-    last_tuesday = get_last_tuesday_utc()
-    now = datetime.utcnow()
+    fetched_stories = []
+    state_id = go_state_id()
 
-    for team_id, team_name in TEAM_MAPPING.items():
+    for team_id, team_name in team_mapping().items():
         print(f"Fetching stories for {team_name}...")
 
-        url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{go_state_id}+group%3A{team_id}&detail=full"
+        url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{state_id}+group%3A{team_id}&detail=full"
 
         try:
-            response = requests.get(url, headers=headers)
+            response = shortcut_api.get(url, headers=headers)
             if response.status_code != 200:
                 print(f"Error fetching data for {team_name}: {response.json()}")
                 continue
 
-            data = response.json()
-            stories = data.get("data", [])
-
-            for story in stories:
-                # Check if the story was completed within our date range
-                completed_at = story.get("completed_at")
-                if completed_at:
-                    try:
-                        # Handle different datetime formats from Shortcut API
-                        if completed_at.endswith('Z'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('Z', '+00:00'))
-                        elif '+' in completed_at or completed_at.endswith('UTC'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('UTC', '+00:00'))
-                        else:
-                            # If no timezone info, assume UTC
-                            completion_date = datetime.fromisoformat(completed_at).replace(tzinfo=timezone.utc)
-
-                        # Ensure our comparison datetimes are timezone-aware
-                        if last_tuesday.tzinfo is None:
-                            last_tuesday = last_tuesday.replace(tzinfo=timezone.utc)
-                        if now.tzinfo is None:
-                            now = now.replace(tzinfo=timezone.utc)
-
-                        if completion_date >= last_tuesday and completion_date <= now:
-                            workflow_state_id = str(story.get("workflow_state_id"))
-                            description = story.get("description", "")
-                            owner_ids = story.get("owner_ids", [])
-                            owner_ids_set.update(owner_ids)
-
-                            if workflow_state_id in WORKFLOW_STATES:
-                                state = WORKFLOW_STATES[workflow_state_id]
-                                story_title = story["name"]
-                                app_url = story["app_url"]
-
-                                team_tasks[team_name].append(
-                                    (story_title, app_url, state, owner_ids, description)
-                                )
-                    except (ValueError, TypeError) as e:
-                        print(f"Error parsing completion date for story {story.get('name', 'Unknown')}: {e}")
-                        continue
+            with profiling.stage("json_decode"):
+                data = response.json()
+            fetched_stories.extend(data.get("data", []))
 
         except requests.exceptions.RequestException as e:
             print(f"Request error for {team_name}: {e}")
             continue
 
-    completed_epics, epic_owner_ids = fetch_go_epics_from_last_tuesday()
-    owner_ids_set.update(epic_owner_ids)
+    return fetched_stories
 
-    print(f"Found {sum(len(tasks) for tasks in team_tasks.values())} completed stories using alternative approach")
 
-    owner_details = fetch_owner_details(owner_ids_set)
+def fetch_go_stories_and_epics_from_last_tuesday(
+    checkpoint=None, reported=None, window=None, story_versions=None, search_days=None
+):
+    """Fetches stories and epics marked as 'GO' or 'Done' from last Tuesday 00:00 UTC to now.
 
-    markdown_output = f"# Weekly Release Report\n"
-    markdown_output += f"**Period:** {start_date} to {end_date}\n\n"
+    Args:
+        checkpoint: Optional RunCheckpoint used to skip already fetched stages.
+        reported: Optional ReportedIndex of the stories reported in earlier weeks, which are skipped.
+        window: Optional (start, end) datetimes replacing last Tuesday to now, e.g. of a snapshot.
+        story_versions: Optional dictionary filled with the 'updated_at' value of every fetched story, by id.
+        search_days: Optional search_cache.DaySearchCache composing the window's stories from per-day buckets.
 
-    # Add Completed Epics section
-    markdown_output += f"## Completed Epics\n\n"
-    if not any(completed_epics.values()):
-        markdown_output += "No epics were completed this week.\n\n"
+    Returns:
+        A Markdown-formatted string containing the stories grouped by team.
+        Returns an empty string if there is an error fetching data.
+    """
+    checkpoint = checkpoint or NoCheckpoint()
+
+    last_tuesday, now = window or (get_last_tuesday_utc(), datetime.now(timezone.utc))
+
+    start_date = last_tuesday.strftime("%Y-%m-%d")
+    end_date = now.strftime("%Y-%m-%d")
+
+    print(f"Fetching stories marked as 'GO' from {start_date} to {end_date}")
+
+    if search_days is not None:
+        fetched_stories = checkpoint.stage("stories", lambda: search_days.stories(go_state_id(), "completed", last_tuesday, now))
     else:
-        for team, epics in completed_epics.items():
-            markdown_output += f"### {team}\n\n"
-            for title, url, owners, description in epics:
-                owner_names = ", ".join(owner_details.get(owner, "Unknown User") for owner in owners)
-                markdown_output += f"- [{title}]({url})\n"
-            markdown_output += "\n"
+        fetched_stories = checkpoint.stage("stories", search_go_stories)
+    if fetched_stories is None:
+        return ""
+    if reported is not None:
+        fetched_stories = reported.exclude(fetched_stories)
+    if story_versions is not None:
+        story_versions.update({story["id"]: story.get("updated_at") for story in fetched_stories})
+
+    team_tasks, owner_ids_set = group_completed_stories(fetched_stories, last_tuesday, now)
+    print(f"Found {sum(len(tasks) for tasks in team_tasks.values())} completed stories")
 
-    markdown_output += "---\n\n"
+    # Fetch and combine epic data; the raw epics are grouped here, so snapshots and checkpoints hold API payloads
+    epics = checkpoint.stage("epics", run_deadline.guard(
+        "epics", lambda: fetch_go_epics_from_last_tuesday((last_tuesday, now))
+    )) or {"epics": [], "epic_groups": {}}
+    teams = team_mapping()
+    completed_epics, epic_owner_ids = group_completed_epics(
+        epics["epics"], last_tuesday, now,
+        lambda epic: teams.get(epics["epic_groups"].get(str(epic["id"])), "Unknown Squad"),
+    )
+    print(f"Found {sum(len(epics) for epics in completed_epics.values())} completed epics.")
 
-    # Add Completed Stories section
-    markdown_output += f"## Completed Stories by Team\n\n"
-    for team, tasks in team_tasks.items():
-        if tasks:
-            markdown_output += f"### {team}\n\n"
-            for title, url, state, owners, description in tasks:
-                owner_names = ", ".join(owner_details.get(owner, "Unknown User") for owner in owners)
-                markdown_output += f"- [{title}]({url})\n"
-            markdown_output += "\n"
+    owner_details = None
+    if enrichment.uses(enrichment.OWNERS, EPIC_LINE, STORY_LINE):
+        owner_ids_set.update(epic_owner_ids)
+        members = checkpoint.stage("members", run_deadline.guard(
+            "owners", lambda: (enrichment.fetch_members() or []) if owner_ids_set else []
+        ))
+        if members is not None:
+            owner_details = enrichment.member_names(members, owner_ids_set)
 
-    return markdown_output
+    return create_markdown_report(team_tasks, completed_epics, start_date, end_date, owner_details)
 
 
 def categorize_stories_by_platform(markdown_report: str):
@@ -422,34 +483,42 @@ def categorize_stories_by_platform(markdown_report: str):
     lines = markdown_report.split('\n')
     current_team = ""
 
+    story_lines = []
     for line in lines:
         if line.startswith('### '):
             current_team = line[4:].strip()
         elif line.startswith('- ['):
-            story_info = line[2:].strip()
-            story_lower = story_info.lower()
-            categorized_story = False
+            story_lines.append((line[2:].strip(), current_team))
 
-            for platform, keywords in platform_keywords.items():
-                if any(keyword in story_lower for keyword in keywords):
-                    categorized[platform].append(f"{story_info} (Team: {current_team})")
-                    categorized_story = True
-                    break
+    predictions = platform_classifier.predict_platforms([story_info for story_info, _ in story_lines])
 
-            if not categorized_story:
-                categorized["other"].append(f"{story_info} (Team: {current_team})")
+    for (story_info, current_team), predicted in zip(story_lines, predictions):
+        if predicted:
+            categorized[predicted].append(f"{story_info} (Team: {current_team})")
+            continue
+
+        story_lower = story_info.lower()
+        categorized_story = False
+
+        for platform, keywords in platform_keywords.items():
+            if any(keyword in story_lower for keyword in keywords):
+                categorized[platform].append(f"{story_info} (Team: {current_team})")
+                categorized_story = True
+                break
+
+        if not categorized_story:
+            categorized["other"].append(f"{story_info} (Team: {current_team})")
 
     return categorized
 
 
-def generate_release_notes(categorized_stories):
-    """Generates release notes for each platform using OpenAI."""
+def generate_release_notes(categorized_stories, checkpoint=None, store=None, story_versions=None):
+    """Generates release notes for each platform using OpenAI.
 
-    headers = {
-        "x-portkey-api-key": PORTKEY_API_KEY,
-        "x-portkey-virtual-key": GOOGLE_VIRTUAL_KEY,
-        "Content-Type": "application/json",
-    }
+    With a TeamSectionStore, the notes of a platform whose stories (by id and
+    'updated_at' in story_versions) did not change are reused from it.
+    """
+    checkpoint = checkpoint or NoCheckpoint()
 
     release_notes = "# Release Notes\n\n"
 
@@ -460,121 +529,135 @@ def generate_release_notes(categorized_stories):
         if platform == "other":
             continue
 
-        stories_text = "\n".join(stories)
-
-        prompt = f"""Based on the following completed stories for {platform.upper()}, generate user-friendly release notes:
-
-{stories_text}
-
-You are an expert in marketing and product development for the crypto industry, 
-specializing in enhancing release notes for Trust Wallet products. 
-Your role is to emulate the style of Apple’s release notes, focusing on clear, structured content with specific 
-feature highlights in a user-friendly presentation. Organize the notes into distinct sections: 
-Features, Security Enhancements, and Bug Fixes. For the Features section, begin each point with a clear 
-subtitle and ensure the subtitle and bullet point are on the same line. Pay special attention to the "feat" 
-label from Github commits; they should all be included in the Features section. Do not include subtitles for 
-Security Enhancements and Bug Fixes to maintain simplicity. Feature descriptions should not end with commit IDs. 
-Use engaging and concise descriptions for new features, and prominently highlight improvements 
-in accessibility and usability. Detail important technical and security updates in an informative yet accessible way
-for non-technical users. Mention any regional or device-specific limitations or availability, similar
-to Apple's style, to manage user expectations. Maintain a professional and neutral tone in the writing, 
-avoiding the use of 'we'. 
-Android release notes have limit of 500 characters.
-iOS and Extension release notes have limit of 700 characters.
-Do not add any markdown formatting for release notes, just add line breaks or industry standard formatting for better readability.
-Please create release notes:
-## Extension
-[EXTENSION NOTES HERE]
-
-## iOS
-[IOS NOTES HERE]
-
-## Android
-[ANDROID NOTES HERE]
-
-Format the response as a clean output for {platform.upper()} release notes."""
+        stories_text = prompts.story_lines_block(stories)
+        content = f"Platform: {llm.PLATFORM_TITLES[platform]}\n\nCompleted stories:\n{stories_text}"
+        data = RELEASE_NOTES_PROMPT.request(content)
 
-        data = {
-            "model": "gemini-2.0-flash",
-            "messages": [{"role": "user", "content": prompt}],
+        platform_notes = checkpoint.load(f"release_notes:{platform}")
+        if platform_notes is not None:
+            release_notes += f"\n{platform_notes}\n\n"
+            continue
 
-        }
+        def generate():
+            llm.pace(3)
+            notes = llm.chat_completion(data, f"release_notes:{platform}", prompt_version=RELEASE_NOTES_PROMPT.key)
+            return notes_constraints.enforce_constraints(platform, notes_constraints.platform_section(platform, notes))
 
         try:
-            time.sleep(3)
-            response = requests.post(
-                "https://api.portkey.ai/v1/chat/completions",
-                headers=headers,
-                json=data,
-            )
-            response.raise_for_status()
-            platform_notes = response.json()["choices"][0]["message"]["content"]
+            if store is not None:
+                notes_fingerprint = team_sections.fingerprint(stories_text, story_versions, RELEASE_NOTES_PROMPT.key, content)
+                platform_notes = store.cached(f"release_notes:{platform}", notes_fingerprint, generate)
+            else:
+                platform_notes = generate()
+            checkpoint.save(f"release_notes:{platform}", platform_notes)
             release_notes += f"\n{platform_notes}\n\n"
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
             print(f"Error generating release notes for {platform}: {e}")
             release_notes += f"\n## {platform.upper()} Release Notes\n\nError generating release notes for this platform.\n\n"
 
     return release_notes
 
 
-def generate_openai_summary(markdown_report: str):
-    """Generates a summary of the weekly release report using OpenAI's GPT-4o model."""
-    if not OPENAI_API_KEY:
-        print("Error: OPENAI_API_KEY not set.")
-        return None
-
-    headers = {
-        "x-portkey-api-key": PORTKEY_API_KEY,
-        "x-portkey-virtual-key": GOOGLE_VIRTUAL_KEY,
-        "Content-Type": "application/json",
-    }
-
-    prompt = f"""{markdown_report}
-
-Please create a comprehensive weekly release summary with the following structure:
-
-1. **Executive Summary** (2-3 sentences overview of the week's achievements)
-2. **Key Epics** (summary of work completed at the epic level)
-3. **Team Contributions** (summary of stories completed by each team)
-4. **Platform Breakdown** (if applicable, categorize work by platform)
+def enforce_section_constraints(sections):
+    """Validates the platform notes of a structured response, regenerating only the violating ones.
 
-Use emojis to make the report engaging and ensure the language is accessible to both technical and non-technical stakeholders."""
+    In a batched run the corrective calls of all platforms go into the same batch.
+    """
+    deferred = None
+    if sections:
+        for platform in llm.PLATFORMS:
+            if sections.get(platform):
+                try:
+                    sections[platform] = notes_constraints.enforce_constraints(platform, sections[platform], heading=False)
+                except llm.LLMDeferred as e:
+                    deferred = e
+    if deferred is not None:
+        raise deferred
+    return sections
 
-    data = {
-        "model": "gemini-2.0-flash",
-        "messages": [{"role": "user", "content": prompt}],
 
-    }
+def generate_openai_summary(markdown_report: str):
+    """Generates a summary of the weekly release report using OpenAI's GPT-4o model."""
+    data = SUMMARY_PROMPT.request(prompts.story_block(markdown_report))
 
     try:
-        time.sleep(3)
-        response = requests.post(
-            "https://api.portkey.ai/v1/chat/completions",
-            headers=headers,
-            json=data,
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
+        llm.pace(3)
+        return llm.chat_completion(data, "summary", prompt_version=SUMMARY_PROMPT.key)
+    except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
         print(f"Error during summary OpenAI API call: {e}")
         return None
 
 
 if __name__ == "__main__":
-    stories_report = fetch_go_stories_and_epics_from_last_tuesday()
+    parser = argparse.ArgumentParser(description="Generate the weekly 'GO' release report.")
+    parser.add_argument("--single-call", action="store_true",
+                        help="Generate the summary and all release notes with one structured LLM call.")
+    llm.add_budget_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_reported_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_deadline_arguments(parser)
+    team_sections.add_incremental_arguments(parser)
+    llm_batch.add_batch_arguments(parser)
+    profiling.add_profile_arguments(parser)
+    search_cache.add_search_cache_arguments(parser)
+    args = parser.parse_args()
+    run_deadline.configure(args.deadline)
+    profiling.run_profile.configure("go", args.profile)
+    llm.run_usage.configure("go", args.max_llm_tokens, args.max_llm_seconds, args.on_budget_exceeded)
+
+    fetch = open_fetch_stages(args, "go")
+    window = fetch.window or (get_last_tuesday_utc(), datetime.now(timezone.utc))
+    checkpoint = RunCheckpoint(
+        "go",
+        window[0].strftime("%Y-%m-%d"),
+        window[1].strftime("%Y-%m-%d"),
+        resume=args.resume,
+        runs_dir=fetch.runs_dir,
+    )
+
+    reported = open_reported_index("go", args.include_reported, args.from_snapshot)
+    story_versions = {}
+    stories_report = fetch_go_stories_and_epics_from_last_tuesday(
+        fetch.bind(checkpoint), reported, window, story_versions,
+        search_cache.DaySearchCache() if args.search_cache else None,
+    )
+    fetch.write("go", *window, path=args.snapshot)
 
     if not stories_report:
         print("No data fetched from Shortcut.")
         sys.exit(1)
 
-    final_report = stories_report
+    categorized_stories = checkpoint.stage("categorized", lambda: categorize_stories_by_platform(stories_report))
+
+    store = team_sections.TeamSectionStore("go", window[0]) if args.incremental else None
+
+    def generate_sections():
+        """Returns the summary and release notes; runs once per round with --batch."""
+        sections = None
+        if args.single_call:
+            sections = checkpoint.stage("sections", lambda: enforce_section_constraints(llm.generate_report_sections(
+                stories_report, categorized_stories, SUMMARY_INSTRUCTIONS, RELEASE_NOTES_INSTRUCTIONS
+            )))
+            if sections is None:
+                print("Falling back to separate summary and release notes calls.")
+        if sections:
+            return sections["summary"], llm.compose_release_notes(sections, categorized_stories)
+
+        if store is not None:
+            summary = checkpoint.stage("summary", lambda: team_sections.generate_incremental_summary(
+                store, stories_report, story_versions, SUMMARY_INSTRUCTIONS, heading="### ",
+                report_sections=("Completed Epics",),
+            ))
+        else:
+            summary = checkpoint.stage("summary", lambda: generate_openai_summary(stories_report))
+        return summary, generate_release_notes(categorized_stories, checkpoint, store, story_versions)
 
-    openai_summary = generate_openai_summary(stories_report)
+    openai_summary, release_notes = llm_batch.run(generate_sections, args.batch)
+    if store is not None:
+        store.save()
     print(openai_summary)
 
-    categorized_stories = categorize_stories_by_platform(stories_report)
-    release_notes = generate_release_notes(categorized_stories)
-
     final_report = ""
     if openai_summary:
         final_report += openai_summary + "\n\n"
@@ -587,12 +670,15 @@ if __name__ == "__main__":
     reports_dir = "reports"
     os.makedirs(reports_dir, exist_ok=True)
 
-    last_tuesday = get_last_tuesday_utc()
-    filename = os.path.join(reports_dir, f"weekly_go_{last_tuesday.strftime('%Y-%m-%d')}.md")
+    filename = os.path.join(reports_dir, f"weekly_go_{window[0].strftime('%Y-%m-%d')}.md")
 
     try:
-        with open(filename, "w") as f:
-            f.write(final_report)
+        file_lock.atomic_write(filename, final_report)
         print(f"Weekly release report saved to {filename}")
+        reported.record_report(stories_report)
+        reported.save()
+        report_search.index_report(filename)
     except IOError as e:
-        print(f"Error writing to file: {e}")
\ No newline at end of file
+        print(f"Error writing to file: {e}")
+
+    llm.run_usage.write(filename)
\ No newline at end of file
@@ -1,23 +1,33 @@
+import argparse
 import os
 import sys
-import requests
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
-import time
 
-load_dotenv()
-OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-OPENAI_ORG_KEY = os.environ["OPENAI_ORG_KEY"]
-SHORTCUT_API_KEY = os.environ["SHORTCUT_API_KEY"]
+import enrichment
+import file_lock
+import llm
+import llm_batch
+import platform_classifier
+import profiling
+import prompts
+import report_search
+import search_cache
+import shortcut_api
+import team_sections
+import workspaces
+from checkpoint import NoCheckpoint, RunCheckpoint, add_checkpoint_arguments
+from deadline import add_deadline_arguments, run_deadline
+from reported_index import add_reported_arguments, open_reported_index
+from settings import settings
+from snapshot import add_snapshot_arguments, open_fetch_stages
+from startup import lazy_import
+
+requests = lazy_import("requests")
 
 BASE_URL = "https://api.app.shortcut.com"
 
-WORKFLOW_STATES = {
-    "500000513": "Done",
-}
-
-TEAM_MAPPING = {
+DEFAULT_TEAM_MAPPING = {
     "686377b2-3918-4de2-bd88-924f7cff3374": "Earn Team",
     "67da9922-f33e-431a-9e40-5cbe4ac48d29": "Banking Team",
     "685d209a-04cc-4ec9-9742-49174eae7908": "Activation Team",
@@ -41,6 +51,54 @@ TEAM_MAPPING = {
 # "65559cb8-f0fe-4fa2-b65f-6713ef84e56b": "Marketing Team",
 # "65b6a41b-8430-4775-bd60-33cfb1f54ac9": "QA Team",
 
+# Story line of the Markdown report; owner names are only fetched from
+# Shortcut if it references {owners}
+STORY_LINE = "- [{title}]({url})"
+
+SUMMARY_INSTRUCTIONS = """Please create a comprehensive weekly release summary with the following structure:
+
+1. **Executive Summary** (2-3 sentences overview of the week's achievements)
+2. **Team Contributions** (summary of work completed by each team)
+3. **Key Deliverables** (highlight major features or fixes completed)
+4. **Platform Breakdown** (if applicable, categorize work by platform)
+
+Use emojis to make the report engaging and ensure the language is accessible to both technical and non-technical stakeholders."""
+
+RELEASE_NOTES_INSTRUCTIONS = """Please create release notes that:
+1. Are written for end users (non-technical language)
+2. Focus on user benefits and improvements
+3. Group related features together
+4. Use bullet points for easy reading
+5. Include emojis to make it engaging
+6. Avoid technical jargon and internal team references"""
+
+# Versioned prompts: the static instructions are the system message, so
+# every run shares the same prompt prefix; stories follow in canonical order
+SUMMARY_PROMPT = prompts.PromptTemplate("done.summary", 2, f"""You summarize the weekly release report the user sends.
+
+{SUMMARY_INSTRUCTIONS}""")
+
+RELEASE_NOTES_PROMPT = prompts.PromptTemplate("done.release_notes", 2, f"""You write the release notes of one platform from its completed stories, which the user sends.
+
+{RELEASE_NOTES_INSTRUCTIONS}
+
+Format the response as a clean markdown section for the platform's release notes.""")
+
+
+def done_state_id():
+    """Returns the 'Done' workflow state id of the current workspace."""
+    return workspaces.state_id("done", "500000513")
+
+
+def workflow_states():
+    """Returns the names of the reported workflow states, by state id."""
+    return {done_state_id(): "Done"}
+
+
+def team_mapping():
+    """Returns the Shortcut group id to team name mapping of the current workspace."""
+    return workspaces.team_mapping(DEFAULT_TEAM_MAPPING)
+
 
 def get_last_tuesday_utc():
     """Returns the date of last Tuesday at 00:00 UTC as a timezone-aware datetime."""
@@ -57,66 +115,118 @@ def get_last_tuesday_utc():
     return last_tuesday.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def fetch_owner_details(owner_ids):
-    """Fetches owner details from Shortcut API.
+def parse_date(date_str):
+    """Parses a date string from Shortcut API into a timezone-aware datetime."""
+    if not date_str:
+        return None
+    try:
+        if date_str.endswith('Z'):
+            return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        elif '+' in date_str or date_str.endswith('UTC'):
+            return datetime.fromisoformat(date_str.replace('UTC', '+00:00'))
+        else:
+            return datetime.fromisoformat(date_str).replace(tzinfo=timezone.utc)
+    except (ValueError, TypeError):
+        return None
+
+
+@profiling.profiled("grouping")
+def group_completed_stories(stories, start, end):
+    """Groups 'Done' stories completed between start and end by team.
 
     Args:
-        owner_ids: A list of owner IDs.
+        stories: Raw story dictionaries as returned by the Shortcut API.
+        start: Timezone-aware start of the reporting window.
+        end: Timezone-aware end of the reporting window.
 
     Returns:
-        A dictionary mapping owner_id to owner name. Returns "Unknown User"
-        if the owner's name cannot be retrieved.
+        A tuple of (team_tasks, owner_ids_set) where team_tasks maps a team
+        name to a list of (title, url, state, owner_ids, description) tuples.
     """
-    owners = {}
-    for owner_id in owner_ids:
-        url = f"{BASE_URL}/api/v3/members/{owner_id}"
-        headers = {"Shortcut-Token": SHORTCUT_API_KEY}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            owner_data = response.json()
-            owners[owner_id] = owner_data.get("profile", {}).get("name", "Unknown User")
-        else:
-            owners[owner_id] = "Unknown User"
-    return owners
+    team_tasks = defaultdict(list)
+    owner_ids_set = set()
+    states = workflow_states()
+    teams = team_mapping()
 
+    for story in stories:
+        # Check if the story was completed within our date range
+        completed_at = story.get("completed_at")
+        if not completed_at:
+            continue
 
-def fetch_done_stories_from_last_tuesday():
-    """Fetches stories marked as 'Done' from last Tuesday 00:00 UTC to now.
+        completion_date = parse_date(completed_at)
+        if completion_date is None:
+            print(f"Error parsing completion date for story {story.get('name', 'Unknown')}: {completed_at}")
+            continue
+
+        if start <= completion_date <= end:
+            workflow_state_id = str(story.get("workflow_state_id"))
+            group_id = story.get("group_id", "")
+            description = story.get("description", "")
+            owner_ids = story.get("owner_ids", [])
+            owner_ids_set.update(owner_ids)
+
+            if workflow_state_id in states:
+                state = states[workflow_state_id]
+                team_name = teams.get(group_id, "Unknown Squad")
+
+                if team_name != "Unknown Squad":
+                    team_tasks[team_name].append(
+                        (story["name"], story["app_url"], state, owner_ids, description)
+                    )
+
+    return team_tasks, owner_ids_set
+
+
+@profiling.profiled("render")
+def create_markdown_report(team_tasks, start_date, end_date, owner_details=None):
+    """Generates the Markdown report listing completed stories by team.
+
+    Story lines are rendered with STORY_LINE; owner_details maps owner ids to
+    names and is only needed if the template shows owners.
+    """
+    markdown_output = f"# Weekly Release Report\n"
+    markdown_output += f"**Period:** {start_date} to {end_date}\n\n"
+
+    for team, tasks in team_tasks.items():
+        if tasks:  # Only show teams with completed tasks
+            markdown_output += f"## {team}\n\n"
+            for title, url, state, owners, description in tasks:
+                markdown_output += STORY_LINE.format(
+                    title=title, url=url, owners=enrichment.owner_names(owners, owner_details)
+                ) + "\n"
+            markdown_output += "\n"
+
+    return markdown_output
+
+
+def search_done_stories():
+    """Searches Shortcut for the stories currently in the 'Done' state.
 
     Returns:
-        A Markdown-formatted string containing the stories grouped by team.
-        Returns an empty string if there is an error fetching data.
+        A list of raw story dictionaries, or None if there is an error fetching data.
     """
     headers = {
         "Content-Type": "application/json",
-        "Shortcut-Token": SHORTCUT_API_KEY,
+        "Shortcut-Token": settings.shortcut_api_key,
     }
 
-    last_tuesday = get_last_tuesday_utc()
-    now = datetime.now(timezone.utc)
-
-    start_date = last_tuesday.strftime("%Y-%m-%d")
-    end_date = now.strftime("%Y-%m-%d")
-
-    print(f"Fetching stories marked as 'Done' from {start_date} to {end_date}")
-
-    team_tasks = defaultdict(list)
-    owner_ids_set = set()
+    fetched_stories = []
 
     # Instead of searching by update date, let's search by completion date and state
     # We'll use a more specific query to reduce results
-    done_state_id = "500000513"  # The 'Done' state ID
+    state_id = done_state_id()  # The 'Done' state ID
 
     # First, let's try to fetch stories that are currently in 'Done' state
     # and filter by completion date client-side
-    url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{done_state_id}&detail=full"
+    url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{state_id}&detail=full"
 
     page_count = 0
     max_pages = 10  # Limit to prevent infinite loops
 
     while url and page_count < max_pages:
         try:
-            response = requests.get(url, headers=headers)
+            response = shortcut_api.get(url, headers=headers)
             if response.status_code != 200:
                 error_data = response.json() if response.content else {"error": "Unknown error"}
                 print(f"Error fetching data: {error_data}")
@@ -124,56 +234,15 @@ def fetch_done_stories_from_last_tuesday():
                 # If we hit the maximum results error, let's try a different approach
                 if error_data.get('error') == 'maximum-results-exceeded':
                     print("Too many results. Trying alternative approach...")
-                    return fetch_done_stories_alternative_approach(start_date, end_date)
-                return ""
+                    return fetch_done_stories_alternative_approach()
+                return None
 
-            data = response.json()
+            with profiling.stage("json_decode"):
+                data = response.json()
             stories = data.get("data", [])
 
             print(f"Processing page {page_count + 1}, found {len(stories)} stories")
-
-            for story in stories:
-                # Check if the story was completed within our date range
-                completed_at = story.get("completed_at")
-                if completed_at:
-                    # Parse the completion date
-                    try:
-                        # Handle different datetime formats from Shortcut API
-                        if completed_at.endswith('Z'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('Z', '+00:00'))
-                        elif '+' in completed_at or completed_at.endswith('UTC'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('UTC', '+00:00'))
-                        else:
-                            # If no timezone info, assume UTC
-                            completion_date = datetime.fromisoformat(completed_at).replace(tzinfo=timezone.utc)
-
-                        # Ensure our comparison datetimes are timezone-aware
-                        if last_tuesday.tzinfo is None:
-                            last_tuesday = last_tuesday.replace(tzinfo=timezone.utc)
-                        if now.tzinfo is None:
-                            now = now.replace(tzinfo=timezone.utc)
-
-                        # Check if completion date is within our range
-                        if completion_date >= last_tuesday and completion_date <= now:
-                            workflow_state_id = str(story.get("workflow_state_id"))
-                            group_id = story.get("group_id", "")
-                            description = story.get("description", "")
-                            owner_ids = story.get("owner_ids", [])
-                            owner_ids_set.update(owner_ids)
-
-                            if workflow_state_id in WORKFLOW_STATES:
-                                state = WORKFLOW_STATES[workflow_state_id]
-                                team_name = TEAM_MAPPING.get(group_id, "Unknown Squad")
-                                story_title = story["name"]
-                                app_url = story["app_url"]
-
-                                if team_name != "Unknown Squad":
-                                    team_tasks[team_name].append(
-                                        (story_title, app_url, state, owner_ids, description)
-                                    )
-                    except (ValueError, TypeError) as e:
-                        print(f"Error parsing completion date for story {story.get('name', 'Unknown')}: {e}")
-                        continue
+            fetched_stories.extend(stories)
 
             next_page = data.get("next")
             url = f"{BASE_URL}{next_page}" if next_page else None
@@ -183,118 +252,93 @@ def fetch_done_stories_from_last_tuesday():
             print(f"Request error: {e}")
             break
 
-    print(f"Found {sum(len(tasks) for tasks in team_tasks.values())} completed stories")
+    return fetched_stories
 
-    owner_details = fetch_owner_details(owner_ids_set)
 
-    markdown_output = f"# Weekly Release Report\n"
-    markdown_output += f"**Period:** {start_date} to {end_date}\n\n"
-
-    for team, tasks in team_tasks.items():
-        if tasks:  # Only show teams with completed tasks
-            markdown_output += f"## {team}\n\n"
-            for title, url, state, owners, description in tasks:
-                owner_names = ", ".join(
-                    owner_details.get(owner, "Unknown User") for owner in owners
-                )
-                markdown_output += f"- [{title}]({url})\n"
-            markdown_output += "\n"
-
-    return markdown_output
-
-
-def fetch_done_stories_alternative_approach(start_date, end_date):
+def fetch_done_stories_alternative_approach():
     """Alternative approach: fetch stories by team to avoid hitting the 1000 result limit."""
     headers = {
         "Content-Type": "application/json",
-        "Shortcut-Token": SHORTCUT_API_KEY,
+        "Shortcut-Token": settings.shortcut_api_key,
     }
 
     print("Using alternative approach: fetching by team...")
 
-    team_tasks = defaultdict(list)
-    owner_ids_set = set()
-    done_state_id = "500000513"
-
-    last_tuesday = get_last_tuesday_utc()
-    now = datetime.utcnow()
+    fetched_stories = []
+    state_id = done_state_id()
 
     # Fetch stories for each team separately to avoid hitting the limit
-    for team_id, team_name in TEAM_MAPPING.items():
+    for team_id, team_name in team_mapping().items():
         print(f"Fetching stories for {team_name}...")
 
         # Search for done stories in this specific team
-        url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{done_state_id}+group%3A{team_id}&detail=full"
+        url = f"{BASE_URL}/api/v3/search/stories?query=state%3A{state_id}+group%3A{team_id}&detail=full"
 
         try:
-            response = requests.get(url, headers=headers)
+            response = shortcut_api.get(url, headers=headers)
             if response.status_code != 200:
                 print(f"Error fetching data for {team_name}: {response.json()}")
                 continue
 
-            data = response.json()
-            stories = data.get("data", [])
-
-            for story in stories:
-                # Check if the story was completed within our date range
-                completed_at = story.get("completed_at")
-                if completed_at:
-                    try:
-                        # Handle different datetime formats from Shortcut API
-                        if completed_at.endswith('Z'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('Z', '+00:00'))
-                        elif '+' in completed_at or completed_at.endswith('UTC'):
-                            completion_date = datetime.fromisoformat(completed_at.replace('UTC', '+00:00'))
-                        else:
-                            # If no timezone info, assume UTC
-                            completion_date = datetime.fromisoformat(completed_at).replace(tzinfo=timezone.utc)
-
-                        # Ensure our comparison datetimes are timezone-aware
-                        if last_tuesday.tzinfo is None:
-                            last_tuesday = last_tuesday.replace(tzinfo=timezone.utc)
-                        if now.tzinfo is None:
-                            now = now.replace(tzinfo=timezone.utc)
-
-                        if completion_date >= last_tuesday and completion_date <= now:
-                            workflow_state_id = str(story.get("workflow_state_id"))
-                            description = story.get("description", "")
-                            owner_ids = story.get("owner_ids", [])
-                            owner_ids_set.update(owner_ids)
-
-                            if workflow_state_id in WORKFLOW_STATES:
-                                state = WORKFLOW_STATES[workflow_state_id]
-                                story_title = story["name"]
-                                app_url = story["app_url"]
-
-                                team_tasks[team_name].append(
-                                    (story_title, app_url, state, owner_ids, description)
-                                )
-                    except (ValueError, TypeError) as e:
-                        print(f"Error parsing completion date for story {story.get('name', 'Unknown')}: {e}")
-                        continue
+            with profiling.stage("json_decode"):
+                data = response.json()
+            fetched_stories.extend(data.get("data", []))
 
         except requests.exceptions.RequestException as e:
             print(f"Request error for {team_name}: {e}")
             continue
 
-    print(f"Found {sum(len(tasks) for tasks in team_tasks.values())} completed stories using alternative approach")
+    return fetched_stories
 
-    owner_details = fetch_owner_details(owner_ids_set)
 
-    markdown_output = f"# Weekly Release Report\n"
-    markdown_output += f"**Period:** {start_date} to {end_date}\n\n"
+def fetch_done_stories_from_last_tuesday(
+    checkpoint=None, reported=None, window=None, story_versions=None, search_days=None
+):
+    """Fetches stories marked as 'Done' from last Tuesday 00:00 UTC to now.
 
-    for team, tasks in team_tasks.items():
-        if tasks:  # Only show teams with completed tasks
-            markdown_output += f"## {team}\n\n"
-            for title, url, state, owners, description in tasks:
-                owner_names = ", ".join(
-                    owner_details.get(owner, "Unknown User") for owner in owners
-                )
-                markdown_output += f"- [{title}]({url})\n"
-            markdown_output += "\n"
+    Args:
+        checkpoint: Optional RunCheckpoint used to skip already fetched stages.
+        reported: Optional ReportedIndex of the stories reported in earlier weeks, which are skipped.
+        window: Optional (start, end) datetimes replacing last Tuesday to now, e.g. of a snapshot.
+        story_versions: Optional dictionary filled with the 'updated_at' value of every fetched story, by id.
+        search_days: Optional search_cache.DaySearchCache composing the window's stories from per-day buckets.
 
-    return markdown_output
+    Returns:
+        A Markdown-formatted string containing the stories grouped by team.
+        Returns an empty string if there is an error fetching data.
+    """
+    checkpoint = checkpoint or NoCheckpoint()
+
+    last_tuesday, now = window or (get_last_tuesday_utc(), datetime.now(timezone.utc))
+
+    start_date = last_tuesday.strftime("%Y-%m-%d")
+    end_date = now.strftime("%Y-%m-%d")
+
+    print(f"Fetching stories marked as 'Done' from {start_date} to {end_date}")
+
+    if search_days is not None:
+        fetched_stories = checkpoint.stage("stories", lambda: search_days.stories(done_state_id(), "completed", last_tuesday, now))
+    else:
+        fetched_stories = checkpoint.stage("stories", search_done_stories)
+    if fetched_stories is None:
+        return ""
+    if reported is not None:
+        fetched_stories = reported.exclude(fetched_stories)
+    if story_versions is not None:
+        story_versions.update({story["id"]: story.get("updated_at") for story in fetched_stories})
+
+    team_tasks, owner_ids_set = group_completed_stories(fetched_stories, last_tuesday, now)
+    print(f"Found {sum(len(tasks) for tasks in team_tasks.values())} completed stories")
+
+    owner_details = None
+    if enrichment.uses(enrichment.OWNERS, STORY_LINE):
+        members = checkpoint.stage("members", run_deadline.guard(
+            "owners", lambda: (enrichment.fetch_members() or []) if owner_ids_set else []
+        ))
+        if members is not None:
+            owner_details = enrichment.member_names(members, owner_ids_set)
+
+    return create_markdown_report(team_tasks, start_date, end_date, owner_details)
 
 
 def categorize_stories_by_platform(markdown_report: str):
@@ -324,44 +368,51 @@ def categorize_stories_by_platform(markdown_report: str):
     lines = markdown_report.split('\n')
     current_team = ""
 
+    story_lines = []
     for line in lines:
         if line.startswith('## '):
             current_team = line[3:].strip()
         elif line.startswith('- ['):
             # Extract story title and URL
-            story_info = line[2:].strip()  # Remove '- '
+            story_lines.append((line[2:].strip(), current_team))  # Remove '- '
+
+    # The trained classifier decides where it is confident; keyword rules decide the rest
+    predictions = platform_classifier.predict_platforms([story_info for story_info, _ in story_lines])
+
+    for (story_info, current_team), predicted in zip(story_lines, predictions):
+        if predicted:
+            categorized[predicted].append(f"{story_info} (Team: {current_team})")
+            continue
 
-            # Categorize based on keywords in title
-            story_lower = story_info.lower()
-            categorized_story = False
+        # Categorize based on keywords in title
+        story_lower = story_info.lower()
+        categorized_story = False
 
-            for platform, keywords in platform_keywords.items():
-                if any(keyword in story_lower for keyword in keywords):
-                    categorized[platform].append(f"{story_info} (Team: {current_team})")
-                    categorized_story = True
-                    break
+        for platform, keywords in platform_keywords.items():
+            if any(keyword in story_lower for keyword in keywords):
+                categorized[platform].append(f"{story_info} (Team: {current_team})")
+                categorized_story = True
+                break
 
-            if not categorized_story:
-                categorized["other"].append(f"{story_info} (Team: {current_team})")
+        if not categorized_story:
+            categorized["other"].append(f"{story_info} (Team: {current_team})")
 
     return categorized
 
 
-def generate_release_notes(categorized_stories):
+def generate_release_notes(categorized_stories, checkpoint=None, store=None, story_versions=None):
     """Generates release notes for each platform using OpenAI.
 
     Args:
         categorized_stories: Dictionary with platform categories and their stories
+        checkpoint: Optional RunCheckpoint keeping the notes of each platform
+        store: Optional TeamSectionStore; notes of a platform whose stories did not change are reused from it
+        story_versions: The 'updated_at' value of every story by id, fingerprinting the stories with store
 
     Returns:
         A string containing the OpenAI-generated release notes for all platforms.
     """
-
-    headers = {
-        "x-portkey-api-key": os.environ["PORTKEY_API_KEY"],
-        "x-portkey-virtual-key": os.environ["GOOGLE_VIRTUAL_KEY"],
-        "Content-Type": "application/json",
-    }
+    checkpoint = checkpoint or NoCheckpoint()
 
     release_notes = "# Release Notes\n\n"
 
@@ -372,41 +423,28 @@ def generate_release_notes(categorized_stories):
         if platform == "other":
             continue  # Skip 'other' category for release notes
 
-        stories_text = "\n".join(stories)
-
-        prompt = f"""Based on the following completed stories for {platform.upper()}, generate user-friendly release notes:
-
-{stories_text}
-
-Please create release notes that:
-1. Are written for end users (non-technical language)
-2. Focus on user benefits and improvements
-3. Group related features together
-4. Use bullet points for easy reading
-5. Include emojis to make it engaging
-6. Avoid technical jargon and internal team references
-
-Format the response as a clean markdown section for {platform.upper()} release notes."""
+        stories_text = prompts.story_lines_block(stories)
+        content = f"Platform: {platform.upper()}\n\nCompleted stories:\n{stories_text}"
+        data = RELEASE_NOTES_PROMPT.request(content)
 
-        data = {
-            "model": "gemini-2.0-flash",
-            "messages": [{"role": "user", "content": prompt}],
+        platform_notes = checkpoint.load(f"release_notes:{platform}")
+        if platform_notes is not None:
+            release_notes += f"\n{platform_notes}\n\n"
+            continue
 
-        }
+        def generate():
+            llm.pace(3)
+            return llm.chat_completion(data, f"release_notes:{platform}", prompt_version=RELEASE_NOTES_PROMPT.key)
 
         try:
-            time.sleep(3)
-            response = requests.post(
-                "https://api.portkey.ai/v1/chat/completions",
-                headers=headers,
-                json=data,
-            )
-            print(response.headers)
-            response.raise_for_status()
-            print(response.json())
-            platform_notes = response.json()["choices"][0]["message"]["content"]
+            if store is not None:
+                notes_fingerprint = team_sections.fingerprint(stories_text, story_versions, RELEASE_NOTES_PROMPT.key, content)
+                platform_notes = store.cached(f"release_notes:{platform}", notes_fingerprint, generate)
+            else:
+                platform_notes = generate()
+            checkpoint.save(f"release_notes:{platform}", platform_notes)
             release_notes += f"\n{platform_notes}\n\n"
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
             print(f"Error generating release notes for {platform}: {e}")
             release_notes += f"\n## {platform.upper()} Release Notes\n\nError generating release notes for this platform.\n\n"
 
@@ -422,65 +460,89 @@ def generate_openai_summary(markdown_report: str):
     Returns:
         A string containing the OpenAI-generated summary.
     """
-    openai_api_key = OPENAI_API_KEY
-    if not openai_api_key:
-        print("Error: OPENAI_API_KEY not set.")
-        return None
-
-    headers = {
-        "x-portkey-api-key": os.environ["PORTKEY_API_KEY"],
-        "x-portkey-virtual-key": os.environ["GOOGLE_VIRTUAL_KEY"],
-        "Content-Type": "application/json",
-    }
-
-    prompt = f"""{markdown_report}
-
-Please create a comprehensive weekly release summary with the following structure:
-
-1. **Executive Summary** (2-3 sentences overview of the week's achievements)
-2. **Team Contributions** (summary of work completed by each team)
-3. **Key Deliverables** (highlight major features or fixes completed)
-4. **Platform Breakdown** (if applicable, categorize work by platform)
-
-Use emojis to make the report engaging and ensure the language is accessible to both technical and non-technical stakeholders."""
-
-    data = {
-        "model": "gemini-2.0-flash",
-        "messages": [{"role": "user", "content": prompt}],
-
-    }
+    data = SUMMARY_PROMPT.request(prompts.story_block(markdown_report))
 
     try:
-        time.sleep(3)
-        response = requests.post(
-            "https://api.portkey.ai/v1/chat/completions",
-            headers=headers,
-            json=data,
-        )
-        print(response.headers)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
+        llm.pace(3)
+        return llm.chat_completion(data, "summary", prompt_version=SUMMARY_PROMPT.key)
+    except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
         print(f"Error during summary OpenAI API call: {e}")
         return None
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the weekly 'Done' release report.")
+    parser.add_argument("--single-call", action="store_true",
+                        help="Generate the summary and all release notes with one structured LLM call.")
+    llm.add_budget_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_reported_arguments(parser)
+    add_snapshot_arguments(parser)
+    add_deadline_arguments(parser)
+    team_sections.add_incremental_arguments(parser)
+    llm_batch.add_batch_arguments(parser)
+    profiling.add_profile_arguments(parser)
+    search_cache.add_search_cache_arguments(parser)
+    args = parser.parse_args()
+    run_deadline.configure(args.deadline)
+    profiling.run_profile.configure("done", args.profile)
+    llm.run_usage.configure("done", args.max_llm_tokens, args.max_llm_seconds, args.on_budget_exceeded)
+
+    fetch = open_fetch_stages(args, "done")
+    window = fetch.window or (get_last_tuesday_utc(), datetime.now(timezone.utc))
+    checkpoint = RunCheckpoint(
+        "done",
+        window[0].strftime("%Y-%m-%d"),
+        window[1].strftime("%Y-%m-%d"),
+        resume=args.resume,
+        runs_dir=fetch.runs_dir,
+    )
+
     # Fetch stories marked as 'Done' from last Tuesday to now
-    stories_report = fetch_done_stories_from_last_tuesday()
+    reported = open_reported_index("done", args.include_reported, args.from_snapshot)
+    story_versions = {}
+    stories_report = fetch_done_stories_from_last_tuesday(
+        fetch.bind(checkpoint), reported, window, story_versions,
+        search_cache.DaySearchCache() if args.search_cache else None,
+    )
+    fetch.write("done", *window, path=args.snapshot)
     print(stories_report)
 
     if not stories_report:
         print("No data fetched from Shortcut.")
         sys.exit(1)
 
-    # Generate main summary
-    openai_summary = generate_openai_summary(stories_report)
-    print(openai_summary)
+    categorized_stories = checkpoint.stage("categorized", lambda: categorize_stories_by_platform(stories_report))
+
+    store = team_sections.TeamSectionStore("done", window[0]) if args.incremental else None
+
+    def generate_sections():
+        """Returns the summary and release notes; runs once per round with --batch."""
+        sections = None
+        if args.single_call:
+            sections = checkpoint.stage("sections", lambda: llm.generate_report_sections(
+                stories_report, categorized_stories, SUMMARY_INSTRUCTIONS, RELEASE_NOTES_INSTRUCTIONS
+            ))
+            if sections is None:
+                print("Falling back to separate summary and release notes calls.")
+        if sections:
+            return sections["summary"], llm.compose_release_notes(sections, categorized_stories)
+
+        # Generate main summary, with --incremental from the summaries of the teams
+        if store is not None:
+            summary = checkpoint.stage("summary", lambda: team_sections.generate_incremental_summary(
+                store, stories_report, story_versions, SUMMARY_INSTRUCTIONS, heading="## "
+            ))
+        else:
+            summary = checkpoint.stage("summary", lambda: generate_openai_summary(stories_report))
+
+        # Generate release notes from the stories categorized by platform
+        return summary, generate_release_notes(categorized_stories, checkpoint, store, story_versions)
 
-    # Categorize stories by platform and generate release notes
-    categorized_stories = categorize_stories_by_platform(stories_report)
-    release_notes = generate_release_notes(categorized_stories)
+    openai_summary, release_notes = llm_batch.run(generate_sections, args.batch)
+    if store is not None:
+        store.save()
+    print(openai_summary)
 
     # Combine all reports
     final_report = ""
@@ -496,12 +558,15 @@ if __name__ == "__main__":
     reports_dir = "reports"
     os.makedirs(reports_dir, exist_ok=True)
 
-    last_tuesday = get_last_tuesday_utc()
-    filename = os.path.join(reports_dir, f"weekly_release_{last_tuesday.strftime('%Y-%m-%d')}.md")
+    filename = os.path.join(reports_dir, f"weekly_release_{window[0].strftime('%Y-%m-%d')}.md")
 
     try:
-        with open(filename, "w") as f:
-            f.write(final_report)
+        file_lock.atomic_write(filename, final_report)
         print(f"Weekly release report saved to {filename}")
+        reported.record_report(stories_report)
+        reported.save()
+        report_search.index_report(filename)
     except IOError as e:
-        print(f"Error writing to file: {e}")
\ No newline at end of file
+        print(f"Error writing to file: {e}")
+
+    llm.run_usage.write(filename)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+
+import profiling
+from deadline import run_deadline
+from file_lock import SharedTokenBucket
+from settings import settings
+
+POOL_SIZE = 8
+MAX_RETRIES = 3
+
+
+def _env_float(name, default):
+    value = settings.get(name)
+    return float(value) if value else default
+
+
+_lock = threading.Lock()
+_sessions = {}
+_limiters = {}
+
+
+def _for_token(token):
+    """Returns the Session and rate limiter of a Shortcut token, creating them on first use.
+
+    The Session is private to the process; the token bucket is shared with
+    every other process using the same token, so concurrent report runs
+    together stay under the token's quota.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        if token not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[token] = session
+            # Shortcut allows 200 requests per minute and token
+            _limiters[token] = SharedTokenBucket(
+                f"shortcut_{hashlib.sha256(token.encode()).hexdigest()[:16]}",
+                _env_float("SHORTCUT_RATE_LIMIT", 200) / 60,
+                _env_float("SHORTCUT_RATE_BURST", 10),
+            )
+        return _sessions[token], _limiters[token]
+
+
+def _retry_after(response, attempt):
+    """Returns the seconds to wait after a 429, from the Retry-After header or a backoff."""
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return 10 * 2 ** attempt
+
+
+def get(url, headers=None, **kwargs):
+    """Sends a GET request to the Shortcut API through the connection pool and rate limiter of its token.
+
+    A 429 response pauses every process using the token for the Retry-After
+    time before the request is retried, up to MAX_RETRIES times. Requests
+    time out after SHORTCUT_TIMEOUT seconds (default 30), less when the run's
+    deadline is closer, and are not sent at all once it has passed.
+
+    Args:
+        url: The request URL.
+        headers: Request headers, including the 'Shortcut-Token' header.
+        **kwargs: Further arguments for requests.Session.get.
+
+    Returns:
+        The requests.Response.
+
+    Raises:
+        requests.exceptions.Timeout: If the run's deadline has passed.
+    """
+    import requests
+
+    session, limiter = _for_token((headers or {}).get("Shortcut-Token", ""))
+    timeout = kwargs.pop("timeout", _env_float("SHORTCUT_TIMEOUT", 30))
+    for attempt in range(MAX_RETRIES + 1):
+        if run_deadline.expired():
+            run_deadline.degrade("shortcut_fetch", f"stopped fetching from Shortcut at {url.split('?')[0]}")
+            raise requests.exceptions.Timeout("Run deadline reached")
+        limiter.acquire()
+        with profiling.stage("shortcut_wait"):
+            response = session.get(url, headers=headers, timeout=run_deadline.timeout(timeout), **kwargs)
+        if response.status_code != 429 or attempt == MAX_RETRIES:
+            return response
+
+        wait = _retry_after(response, attempt)
+        if not run_deadline.allows(wait):
+            return response
+        print(f"Shortcut rate limit hit, pausing requests with this token for {wait:.0f}s")
+        limiter.pause(wait)
@@ -0,0 +1,143 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+from checkpoint import RUNS_DIR, NoCheckpoint
+from file_lock import FileLock
+
+SNAPSHOTS_DIR = "snapshots"
+SNAPSHOT_FORMAT = "shortcut-ai-snapshot"
+SNAPSHOT_VERSION = 2  # 2: raw epics and members instead of grouped epics and owner names
+
+
+def default_snapshot_path(report_type, start, end):
+    return os.path.join(SNAPSHOTS_DIR, f"{report_type}_{start.strftime('%Y-%m-%d')}_{end.strftime('%Y-%m-%d')}.jsonl.gz")
+
+
+def write_snapshot(path, report_type, start, end, stages):
+    """Writes the fetched data of a run as gzip-compressed JSON Lines.
+
+    The first line is a header with the format version, the report type and
+    the reporting window. Every stage follows as a {"stage", "value"} record;
+    list values (raw stories) are written as an empty list followed by one
+    {"stage", "item"} record per element, so large snapshots stay streamable.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "report_type": report_type,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with FileLock(path):
+        with gzip.open(tmp_path, "wt") as f:
+            f.write(json.dumps(header) + "\n")
+            for stage, value in stages.items():
+                if isinstance(value, list):
+                    f.write(json.dumps({"stage": stage, "value": []}) + "\n")
+                    for item in value:
+                        f.write(json.dumps({"stage": stage, "item": item}, separators=(",", ":")) + "\n")
+                else:
+                    f.write(json.dumps({"stage": stage, "value": value}, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, path)
+    print(f"Snapshot of {len(stages)} fetch stages saved to {path}")
+
+
+class Snapshot:
+    """The fetched data of one report run, loaded from a snapshot file."""
+
+    def __init__(self, path):
+        with gzip.open(path, "rt") as f:
+            header = json.loads(f.readline())
+            if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot")
+            self.stages = {}
+            for line in f:
+                record = json.loads(line)
+                if "item" in record:
+                    self.stages[record["stage"]].append(record["item"])
+                else:
+                    self.stages[record["stage"]] = record["value"]
+
+        self.path = path
+        self.report_type = header["report_type"]
+        self.start = datetime.fromisoformat(header["start"])
+        self.end = datetime.fromisoformat(header["end"])
+
+
+class FetchStages:
+    """Routes the fetch stages of a run through a snapshot.
+
+    Wraps the run's checkpoint for the stages that call Shortcut. With a
+    snapshot loaded (--from-snapshot) the stages are served from it and
+    nothing is fetched; otherwise they run through the checkpoint as usual
+    and, with --snapshot, their results are collected and written at the end.
+    """
+
+    def __init__(self, snapshot=None, record=False):
+        self.checkpoint = NoCheckpoint()
+        self.snapshot = snapshot
+        self.recorded = {} if record else None
+
+    @property
+    def window(self):
+        """The (start, end) reporting window of the snapshot, or None for a live run."""
+        return (self.snapshot.start, self.snapshot.end) if self.snapshot else None
+
+    @property
+    def runs_dir(self):
+        """Directory of the run's checkpoints; renders from a snapshot keep theirs apart from live runs'."""
+        if self.snapshot is None:
+            return RUNS_DIR
+        name = os.path.basename(self.snapshot.path).split(".")[0]
+        return os.path.join(RUNS_DIR, "from_snapshot", name)
+
+    def bind(self, checkpoint):
+        """Uses the run's checkpoint for live fetch stages; returns self."""
+        self.checkpoint = checkpoint
+        return self
+
+    def stage(self, stage, compute):
+        if self.snapshot is not None:
+            if stage not in self.snapshot.stages:
+                print(f"Stage '{stage}' is missing from snapshot {self.snapshot.path}")
+                return None
+            return self.snapshot.stages[stage]
+
+        value = self.checkpoint.stage(stage, compute)
+        if self.recorded is not None and value is not None:
+            self.recorded[stage] = value
+        return value
+
+    def write(self, report_type, start, end, path=None):
+        """Writes the collected stages if the run was asked to snapshot them."""
+        if self.recorded is None:
+            return
+        try:
+            write_snapshot(path or default_snapshot_path(report_type, start, end), report_type, start, end, self.recorded)
+        except IOError as e:
+            print(f"Error writing snapshot: {e}")
+
+
+def open_fetch_stages(args, report_type):
+    """Returns the FetchStages of a run from its --snapshot/--from-snapshot options."""
+    if args.from_snapshot:
+        snapshot = Snapshot(args.from_snapshot)
+        if snapshot.report_type != report_type:
+            raise SystemExit(f"{args.from_snapshot} is a '{snapshot.report_type}' snapshot, not '{report_type}'")
+        print(f"Rendering from snapshot {args.from_snapshot} ({snapshot.start.date()} to {snapshot.end.date()})")
+        return FetchStages(snapshot=snapshot)
+    return FetchStages(record=args.snapshot is not None)
+
+
+def add_snapshot_arguments(parser):
+    """Adds the --snapshot and --from-snapshot options to a script's argument parser."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--snapshot", nargs="?", const="", default=None, metavar="PATH",
+                       help=f"Save the fetched stories, epics and members to a snapshot (default: {SNAPSHOTS_DIR}/).")
+    group.add_argument("--from-snapshot", metavar="PATH",
+                       help="Render the report from a snapshot instead of fetching from Shortcut.")
@@ -0,0 +1,82 @@
+import importlib.util
+import os
+import re
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cumulative import time allowed for a report script's own imports (excluding
+# the interpreter's site setup), measured with `python -X importtime script --help`
+IMPORT_BUDGET_MS = 50
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def lazy_import(name):
+    """Returns a module that is only imported when one of its attributes is first used.
+
+    Heavy dependencies such as requests are bound with this at module level,
+    so code paths that never make a request (render-only runs, resumed runs)
+    do not pay for importing them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def measure_imports(script):
+    """Runs a script's --help with -X importtime and returns its top-level imports.
+
+    Returns:
+        A list of (module, cumulative_microseconds) for the imports made by
+        the script itself, slowest first.
+    """
+    import subprocess
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", script, "--help"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        env=dict(os.environ, PYTHONPATH=SCRIPT_DIR),
+    )
+    imports = []
+    site_done = False
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 0 and site_done:
+            imports.append((module, cumulative))
+        if indent == 0 and module == "site":
+            site_done = True  # Everything before is interpreter startup
+    return sorted(imports, key=lambda item: -item[1])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from report_loader import REPORT_SCRIPTS
+
+    parser = argparse.ArgumentParser(description="Check the import time of the report scripts against the budget.")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to show per script.")
+    args = parser.parse_args()
+
+    over_budget = []
+    for report_type, script in sorted(REPORT_SCRIPTS.items()):
+        imports = measure_imports(os.path.join(SCRIPT_DIR, script))
+        total_ms = sum(cumulative for _, cumulative in imports) / 1000
+        slowest = ", ".join(f"{module} {cumulative / 1000:.1f}ms" for module, cumulative in imports[:args.top])
+        print(f"{script}: {total_ms:.1f}ms of imports (budget {args.budget_ms:.0f}ms); slowest: {slowest}")
+        if total_ms > args.budget_ms:
+            over_budget.append(script)
+
+    if over_budget:
+        print(f"Over the import budget: {', '.join(over_budget)}")
+        sys.exit(1)
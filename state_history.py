@@ -0,0 +1,276 @@
+import argparse
+import bisect
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+import file_lock
+import shortcut_api
+from settings import settings
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+BASE_URL = "https://api.app.shortcut.com"
+
+HISTORY_PATH = os.path.join("cache", "state_history.json")
+HISTORY_VERSION = 1
+
+
+def parse_time(value):
+    """Parses an ISO 8601 timestamp or a datetime into epoch seconds; naive times are UTC."""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def transitions_from_actions(changed_at, actions, story_id=None):
+    """Extracts the workflow state changes from the actions of a history entry or webhook payload.
+
+    Args:
+        changed_at: Timestamp of the entry.
+        actions: Its actions, as sent by Shortcut.
+        story_id: Only return changes of this story; all stories if None.
+
+    Returns:
+        A list of (story_id, changed_at, state_id) tuples.
+    """
+    transitions = []
+    for action in actions:
+        if action.get("entity_type") != "story" or (story_id is not None and action.get("id") != story_id):
+            continue
+        new_state = action.get("changes", {}).get("workflow_state_id", {}).get("new")
+        if new_state is None and action.get("action") == "create":
+            new_state = action.get("workflow_state_id")
+        if new_state is not None:
+            transitions.append((action["id"], changed_at, str(new_state)))
+    return transitions
+
+
+def fetch_story_transitions(story_id):
+    """Fetches the workflow state changes of a story from its Shortcut history.
+
+    Returns:
+        A list of [changed_at, state_id] pairs, or None if the history could not be fetched.
+    """
+    url = f"{BASE_URL}/api/v3/stories/{story_id}/history"
+    try:
+        response = shortcut_api.get(url, headers={"Shortcut-Token": settings.shortcut_api_key})
+        response.raise_for_status()
+        return [
+            [changed_at, state_id]
+            for entry in response.json()
+            for _, changed_at, state_id in transitions_from_actions(entry.get("changed_at"), entry.get("actions", []), story_id)
+            if changed_at
+        ]
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching history of story {story_id}: {e}")
+        return None
+
+
+class IntervalTree:
+    """Static interval tree over half-open [start, end) intervals.
+
+    The intervals are kept sorted by start; the implicit balanced tree over
+    that array (the middle element of every range is its root) is augmented
+    with the largest end in each subtree, so overlap queries skip every
+    subtree that ends too early or starts too late and run in O(log n + k).
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.ids = [story_id for _, _, story_id in intervals]
+        self.max_end = list(self.ends)
+        self._augment(0, len(intervals))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _augment(self, lo, hi):
+        if lo >= hi:
+            return -math.inf
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(self.ends[mid], self._augment(lo, mid), self._augment(mid + 1, hi))
+        return self.max_end[mid]
+
+    def overlapping(self, start, end):
+        """Returns the ids of the intervals overlapping [start, end)."""
+        found = set()
+        self._collect(0, len(self.starts), start, end, found)
+        return found
+
+    def _collect(self, lo, hi, start, end, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            return  # Everything in this subtree ended before the query
+        self._collect(lo, mid, start, end, found)
+        if self.starts[mid] < end:
+            if self.ends[mid] > start:
+                found.add(self.ids[mid])
+            self._collect(mid + 1, hi, start, end, found)
+
+    def started_between(self, start, end):
+        """Returns the ids of the intervals starting in [start, end)."""
+        return set(self.ids[bisect.bisect_left(self.starts, start):bisect.bisect_left(self.starts, end)])
+
+
+class StateIndex:
+    """Interval trees of the time every story spent in each workflow state.
+
+    Args:
+        transitions: Dictionary of story id to its [changed_at, state_id]
+            pairs in time order; a story stays in a state until its next
+            transition, or to this day after the last one.
+    """
+
+    def __init__(self, transitions):
+        intervals = {}
+        for story_id, story_transitions in transitions.items():
+            times = [parse_time(changed_at) for changed_at, _ in story_transitions] + [math.inf]
+            for i, (_, state_id) in enumerate(story_transitions):
+                intervals.setdefault(str(state_id), []).append((times[i], times[i + 1], int(story_id)))
+        self.trees = {state_id: IntervalTree(state_intervals) for state_id, state_intervals in intervals.items()}
+
+    def _tree(self, state_id):
+        return self.trees.get(str(state_id)) or IntervalTree([])
+
+    def in_state_at(self, state_id, when):
+        """Returns the ids of the stories that were in the state at the given time."""
+        when = parse_time(when)
+        return self._tree(state_id).overlapping(when, math.nextafter(when, math.inf))
+
+    def in_state_during(self, state_id, start, end):
+        """Returns the ids of the stories that were in the state at any time in [start, end)."""
+        return self._tree(state_id).overlapping(parse_time(start), parse_time(end))
+
+    def entered_during(self, state_id, start, end):
+        """Returns the ids of the stories that moved into the state in [start, end)."""
+        return self._tree(state_id).started_between(parse_time(start), parse_time(end))
+
+
+class StateHistory:
+    """The workflow state transitions of every story seen, kept in cache/state_history.json.
+
+    Transitions come from the stories' Shortcut history (sync), from the
+    'moved_at' of search results and from webhook payloads (record_story,
+    through the daemon's StoryState). Queries go to the StateIndex built
+    from them and make no API calls.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self.stories = {}
+        self._index = None
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get("version") == HISTORY_VERSION:
+                    self.stories = data.get("stories", {})
+            except (IOError, ValueError) as e:
+                print(f"Error loading state history, starting empty: {e}")
+        return self
+
+    def save(self):
+        try:
+            file_lock.atomic_write(self.path, json.dumps({"version": HISTORY_VERSION, "stories": self.stories}))
+        except IOError as e:
+            print(f"Error saving state history: {e}")
+
+    def _entry(self, story_id):
+        return self.stories.setdefault(str(story_id), {"synced": None, "transitions": []})
+
+    def record(self, story_id, changed_at, state_id):
+        """Adds one transition of a story, ignoring ones already known."""
+        transitions = self._entry(story_id)["transitions"]
+        transition = [changed_at, str(state_id)]
+        if transition in transitions:
+            return
+        transitions.append(transition)
+        transitions.sort(key=lambda t: parse_time(t[0]))
+        # A move into the state a story is already in is no transition
+        transitions[:] = [t for i, t in enumerate(transitions) if i == 0 or t[1] != transitions[i - 1][1]]
+        self._index = None
+
+    def record_story(self, story, changed_at=None):
+        """Records the current state of a story record since its 'moved_at' (or creation).
+
+        changed_at, the time of the webhook the record was built from, is used
+        for records that carry neither, such as stories created by a webhook.
+        """
+        changed_at = story.get("moved_at") or story.get("created_at") or changed_at
+        if changed_at and story.get("workflow_state_id") is not None:
+            self.record(story["id"], changed_at, story["workflow_state_id"])
+
+    def sync(self, stories):
+        """Fetches the Shortcut history of the stories changed since their last sync.
+
+        Stories whose 'updated_at' matches the last sync make no request;
+        if a history cannot be fetched the story's current state is recorded.
+
+        Returns:
+            Dictionary of story id to transitions for the given stories.
+        """
+        fetched = 0
+        for story in stories:
+            entry = self._entry(story["id"])
+            if story.get("updated_at") and entry["synced"] == story["updated_at"]:
+                continue
+            transitions = fetch_story_transitions(story["id"])
+            if transitions is not None:
+                for changed_at, state_id in transitions:
+                    self.record(story["id"], changed_at, state_id)
+                entry["synced"] = story.get("updated_at")
+                fetched += 1
+            self.record_story(story)
+        print(f"State history: fetched {fetched} of {len(stories)} story histories")
+        return {str(story["id"]): self.stories[str(story["id"])]["transitions"] for story in stories}
+
+    def index(self):
+        """Returns the StateIndex of every recorded story, rebuilt only after changes."""
+        if self._index is None:
+            self._index = StateIndex({story_id: entry["transitions"] for story_id, entry in self.stories.items()})
+        return self._index
+
+
+def add_state_history_arguments(parser):
+    """Adds the --state-history option to a script's argument parser."""
+    parser.add_argument("--state-history", action="store_true",
+                        help=f"Decide state membership from the stories' workflow state history "
+                             f"(kept in {HISTORY_PATH}) instead of their current state and dates.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the local index of story workflow state intervals.")
+    parser.add_argument("--path", default=HISTORY_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    at_parser = subparsers.add_parser("at", help="Stories in a state at a time.")
+    at_parser.add_argument("state_id")
+    at_parser.add_argument("time", help="ISO 8601 time, e.g. 2026-10-13T12:00:00Z")
+    entered_parser = subparsers.add_parser("entered", help="Stories that moved into a state in a window.")
+    entered_parser.add_argument("state_id")
+    entered_parser.add_argument("start")
+    entered_parser.add_argument("end")
+    args = parser.parse_args()
+
+    history = StateHistory(args.path).load()
+    index = history.index()
+    started = time.perf_counter()
+    if args.command == "at":
+        story_ids = index.in_state_at(args.state_id, args.time)
+    else:
+        story_ids = index.entered_during(args.state_id, args.start, args.end)
+    elapsed = (time.perf_counter() - started) * 1000
+    for story_id in sorted(story_ids):
+        print(story_id)
+    print(f"{len(story_ids)} stories of {len(history.stories)} ({elapsed:.2f} ms)")
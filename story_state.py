@@ -0,0 +1,206 @@
+import json
+import os
+from collections import defaultdict
+
+from state_history import StateHistory
+
+STATE_DIR = os.path.join("cache", "story_state")
+COMPACT_EVERY = 500  # Events appended to the log before the snapshot is rewritten
+
+# Entity types of the webhook actions applied to the state
+ENTITY_TYPES = ("story", "epic")
+
+
+class StoryState:
+    """Warm, incrementally updated copy of the Shortcut stories and epics we report on.
+
+    The state lives in memory and is persisted as a JSON snapshot plus an
+    append-only JSON Lines log of applied webhook payloads. Loading replays
+    the log on top of the snapshot, so a crash never loses acknowledged events.
+    Every workflow state a story is seen in is also recorded in its state
+    history, saved with the snapshot, for point-in-time state queries.
+    """
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.snapshot_path = os.path.join(state_dir, "snapshot.json")
+        self.log_path = os.path.join(state_dir, "events.jsonl")
+        self.history = StateHistory(os.path.join(state_dir, "state_history.json"))
+        self.stories = {}
+        self.epics = {}
+        self.stories_by_state = defaultdict(set)
+        self.events_since_compact = 0
+        self.last_changed_at = None
+
+    def load(self):
+        """Loads the snapshot and replays any logged events after it."""
+        self.history.load()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            for story in snapshot.get("stories", []):
+                self.upsert_story(story)
+            for epic in snapshot.get("epics", []):
+                self.epics[epic["id"]] = epic
+            self.last_changed_at = snapshot.get("last_changed_at")
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            payload = json.loads(line)
+                        except ValueError:
+                            print(f"Skipping unreadable event log line: {line.strip()[:200]}")
+                            continue
+                        self._apply(payload)
+                        self.events_since_compact += 1
+        return self
+
+    def upsert_story(self, story, changed_at=None):
+        """Inserts or replaces a full story record, e.g. from a Shortcut search.
+
+        changed_at is the time of the webhook a record was built from.
+        """
+        story_id = story["id"]
+        previous = self.stories.get(story_id)
+        if previous is not None:
+            self.stories_by_state[str(previous.get("workflow_state_id"))].discard(story_id)
+        self.stories[story_id] = story
+        self.stories_by_state[str(story.get("workflow_state_id"))].add(story_id)
+        self.history.record_story(story, changed_at)
+
+    def upsert_epic(self, epic):
+        """Inserts or replaces a full epic record."""
+        self.epics[epic["id"]] = epic
+
+    def stories_in_states(self, state_ids):
+        """Returns the stories currently in any of the given workflow state ids."""
+        return [
+            self.stories[story_id]
+            for state_id in state_ids
+            for story_id in self.stories_by_state.get(str(state_id), ())
+        ]
+
+    def team_for_epic(self, epic, team_mapping):
+        """Returns the team owning an epic, judged by any known story inside it."""
+        for story in self.stories.values():
+            if story.get("epic_id") == epic["id"] and story.get("group_id") in team_mapping:
+                return team_mapping[story["group_id"]]
+        return "Unknown Squad"
+
+    def apply_webhook(self, payload):
+        """Applies one Shortcut webhook payload and appends it to the on-disk log."""
+        self._apply(payload)
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+        self.events_since_compact += 1
+
+        if self.events_since_compact >= COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the snapshot atomically and truncates the event log."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        snapshot = {
+            "last_changed_at": self.last_changed_at,
+            "stories": list(self.stories.values()),
+            "epics": list(self.epics.values()),
+        }
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.snapshot_path)
+        self.history.save()
+
+        with open(self.log_path, "w"):
+            pass
+        self.events_since_compact = 0
+
+    def _apply(self, payload):
+        """Applies the story and epic actions of a payload, skipping (and logging) the others."""
+        if not isinstance(payload, dict) or not isinstance(payload.get("actions", []), list):
+            print(f"Skipping malformed webhook payload: {json.dumps(payload)[:200]}")
+            return
+        changed_at = payload.get("changed_at")
+        if changed_at:
+            self.last_changed_at = changed_at
+
+        for action in payload.get("actions", []):
+            problem = _action_problem(action)
+            if problem:
+                print(f"Skipping webhook action ({problem}): {json.dumps(action)[:200]}")
+            elif action["entity_type"] == "story":
+                self._apply_story_action(action, changed_at)
+            else:
+                self._apply_epic_action(action, changed_at)
+
+    def _apply_story_action(self, action, changed_at):
+        story_id = action["id"]
+        if action.get("action") == "delete":
+            story = self.stories.pop(story_id, None)
+            if story is not None:
+                self.stories_by_state[str(story.get("workflow_state_id"))].discard(story_id)
+            return
+
+        story = dict(self.stories.get(story_id, {"id": story_id}))
+        _merge_action(story, action, changed_at)
+
+        changes = action.get("changes", {})
+        if "workflow_state_id" in changes:
+            story["moved_at"] = changed_at
+        if changes.get("completed", {}).get("new") is True and "completed_at" not in changes:
+            story["completed_at"] = changed_at
+        elif changes.get("completed", {}).get("new") is False:
+            story["completed_at"] = None
+
+        self.upsert_story(story, changed_at)
+
+    def _apply_epic_action(self, action, changed_at):
+        epic_id = action["id"]
+        if action.get("action") == "delete":
+            self.epics.pop(epic_id, None)
+            return
+
+        epic = dict(self.epics.get(epic_id, {"id": epic_id}))
+        _merge_action(epic, action, changed_at)
+
+        changes = action.get("changes", {})
+        if changes.get("completed", {}).get("new") is True and "completed_at" not in changes:
+            epic["completed_at"] = changed_at
+        self.upsert_epic(epic)
+
+
+def _action_problem(action):
+    """Returns why a webhook action cannot be applied to the state, or None if it can."""
+    if not isinstance(action, dict):
+        return "not an object"
+    if action.get("entity_type") not in ENTITY_TYPES:
+        return f"unknown entity type {action.get('entity_type')!r}"
+    if "id" not in action:
+        return "no id"
+    changes = action.get("changes", {})
+    if not isinstance(changes, dict) or not all(isinstance(change, dict) for change in changes.values()):
+        return "malformed changes"
+    return None
+
+
+def _merge_action(record, action, changed_at):
+    """Copies the fields of a webhook action onto a stored record."""
+    for key, value in action.items():
+        if key not in ("changes", "action", "entity_type"):
+            record[key] = value
+
+    for field, change in action.get("changes", {}).items():
+        if "new" in change:
+            record[field] = change["new"]
+        elif "adds" in change or "removes" in change:
+            # List fields such as owner_ids are sent as adds/removes
+            values = [v for v in record.get(field, []) if v not in change.get("removes", [])]
+            values.extend(v for v in change.get("adds", []) if v not in values)
+            record[field] = values
+
+    if changed_at:
+        record["updated_at"] = changed_at
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+
+import file_lock
+import llm
+import prompts
+from startup import lazy_import
+
+requests = lazy_import("requests")
+
+SECTIONS_DIR = os.path.join("cache", "team_sections")
+SECTIONS_VERSION = 1
+
+TEAM_SUMMARY_PROMPT = prompts.PromptTemplate("team_summary", 2, """The user sends the stories one team completed this week.
+Summarize the work this team completed this week in 2-4 sentences for a weekly release summary.
+Name the most important features or fixes, keep the language accessible to non-technical stakeholders and do not add headings.""")
+
+
+def split_team_sections(markdown_report, heading):
+    """Splits the story list of a report into its team sections.
+
+    Args:
+        markdown_report: The Markdown report.
+        heading: The heading prefix of the team sections, e.g. '## ' or '### '.
+
+    Returns:
+        A dictionary of team name to the story lines of its section.
+    """
+    sections = {}
+    team = None
+    for line in markdown_report.split("\n"):
+        if line.startswith(heading):
+            team = line[len(heading):].strip()
+            sections[team] = []
+        elif line.startswith("#"):
+            team = None
+        elif team is not None and line.startswith("- "):
+            sections[team].append(line)
+    return {team: "\n".join(lines) for team, lines in sections.items() if lines}
+
+
+def fingerprint(text, story_versions, *prompt_parts):
+    """Hashes the stories linked from a section with their updated_at values and the prompt used.
+
+    Args:
+        text: The section; stories are identified by the ids in their URLs.
+        story_versions: Dictionary of story id to its 'updated_at' value.
+        *prompt_parts: Prompt text the generated section depends on.
+    """
+    ids = sorted({int(story_id) for story_id in prompts.STORY_ID_RE.findall(text)})
+    payload = {
+        "version": SECTIONS_VERSION,
+        "stories": [[story_id, story_versions.get(story_id)] for story_id in ids],
+        "prompt": list(prompt_parts),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class TeamSectionStore:
+    """Generated report sections with the fingerprints of the stories they were generated from.
+
+    Kept per report type and window start in cache/team_sections/, so a rerun
+    later in the week reuses every section whose stories did not change.
+    Each section is counted once as reused or generated, even when a batched
+    run asks for it again in every round.
+    """
+
+    def __init__(self, report_type, start, sections_dir=SECTIONS_DIR):
+        self.path = os.path.join(sections_dir, f"{report_type}_{start.strftime('%Y-%m-%d')}.json")
+        self.sections = {}
+        self.reused = set()
+        self.generated = set()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.sections = json.load(f)
+            except (IOError, ValueError):
+                self.sections = {}
+
+    def cached(self, key, section_fingerprint, compute):
+        """Returns the stored text of a section if its fingerprint matches, computing it otherwise.
+
+        Results of compute() that are None (failed calls) are not stored.
+        """
+        entry = self.sections.get(key)
+        if entry and entry["fingerprint"] == section_fingerprint:
+            if key not in self.generated:
+                self.reused.add(key)
+            return entry["text"]
+        text = compute()
+        if text is not None:
+            self.sections[key] = {"fingerprint": section_fingerprint, "text": text}
+            self.generated.add(key)
+            self.reused.discard(key)
+        return text
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            file_lock.atomic_write(self.path, json.dumps(self.sections, indent=2, ensure_ascii=False))
+        except IOError as e:
+            print(f"Error saving team sections: {e}")
+        print(f"Team sections: {len(self.reused)} reused, {len(self.generated)} generated")
+
+
+def _complete(template, content, purpose):
+    try:
+        return llm.chat_completion(template.request(content), purpose, prompt_version=template.key)
+    except (requests.exceptions.RequestException, llm.LLMSkipped) as e:
+        print(f"Error generating {purpose}: {e}")
+        return None
+
+
+def generate_incremental_summary(store, markdown_report, story_versions, summary_instructions, heading,
+                                 report_sections=()):
+    """Generates the report summary from per-team sections, regenerating only changed teams.
+
+    Every team section is summarized on its own and stored with the
+    fingerprint of its stories; the overall summary is then composed from
+    the team summaries, so its input is a few sentences per team rather
+    than every story, and it is only recomposed if a team summary changed.
+    Report sections that are not per team, such as the completed epics,
+    are passed to the composing call as they are.
+
+    Args:
+        store: The run's TeamSectionStore.
+        markdown_report: The Markdown report listing the stories.
+        story_versions: Dictionary of story id to its 'updated_at' value.
+        summary_instructions: The script's summary prompt instructions.
+        heading: The heading prefix of the team sections in the report.
+        report_sections: Titles of '## ' sections of the report, e.g.
+            'Completed Epics', whose lines are sent along with the team summaries.
+
+    Returns:
+        The summary, or None if it could not be generated.
+    """
+    team_summaries = {}
+    for team, section in split_team_sections(markdown_report, heading).items():
+        content = f"Team: {team}\n\n{prompts.story_block(section)}"
+        team_summaries[team] = store.cached(
+            f"team:{team}",
+            fingerprint(section, story_versions, TEAM_SUMMARY_PROMPT.key),
+            lambda: _complete(TEAM_SUMMARY_PROMPT, content, f"team_summary:{team}"),
+        )
+
+    available = {team: text for team, text in team_summaries.items() if text}
+    blocks = split_team_sections(markdown_report, "## ")
+    report_text = "\n\n".join(f"## {title}\n{blocks[title]}" for title in report_sections if title in blocks)
+    if not available and not report_text:
+        return None
+    template = prompts.PromptTemplate("team_summaries.summary", 3, f"""The user sends summaries of the work each team completed this week,
+each under its team's heading, after the report's other sections (such as the completed epics) if it has any.
+
+{summary_instructions}""")
+    team_text = "\n\n".join(f"## {team}\n{available[team]}" for team in sorted(available))
+    content = "\n\n".join(text for text in (report_text, team_text) if text)
+    combined_fingerprint = hashlib.sha256(f"{template.key}\n{content}".encode()).hexdigest()
+    return store.cached("summary", combined_fingerprint, lambda: _complete(template, content, "summary"))
+
+
+def add_incremental_arguments(parser):
+    """Adds the --incremental option to a script's argument parser."""
+    parser.add_argument("--incremental", action="store_true",
+                        help="Summarize per team and reuse the team summaries and release notes "
+                             "whose stories did not change since the last run in the same window.")
@@ -0,0 +1,113 @@
+import glob
+import json
+
+import pytest
+
+import llm
+import llm_batch
+
+
+@pytest.fixture
+def batched(monkeypatch, tmp_path):
+    """Fresh batch, usage and health state, with the caches of the run under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_ROUTER_PROBE_RATE", "0")
+    monkeypatch.setattr(llm, "batch_requests", llm.BatchRequests())
+    monkeypatch.setattr(llm, "run_usage", llm.RunUsage())
+    monkeypatch.setattr(llm, "gateway_health", llm.GatewayHealth(path=None))
+
+
+def ask(content, purpose):
+    try:
+        return llm.chat_completion({"messages": [{"role": "user", "content": content}]}, purpose)
+    except llm.LLMSkipped:
+        return None
+
+
+def generate():
+    """A report's LLM sections: a summary, release notes and a corrective call on the notes."""
+    summary = ask("Summarize the week", "summary")
+    notes = ask("Release notes for iOS", "release_notes:ios")
+    fixed = ask(f"Fix these notes: {notes}", "release_notes_fix:ios") if notes else None
+    return {"summary": summary, "notes": notes, "fixed": fixed}
+
+
+def submitted_jobs():
+    return sorted(glob.glob("cache/llm_batches/local/*.input.jsonl"))
+
+
+def test_batched_run_answers_dependent_calls_in_later_rounds(batched):
+    result = llm_batch.run(generate, mode="local")
+
+    assert result == {
+        "summary": "Stand-in reply to: Summarize the week",
+        "notes": "Stand-in reply to: Release notes for iOS",
+        "fixed": "Stand-in reply to: Fix these notes: Stand-in reply to: Release notes for iOS",
+    }
+    # The summary and the notes go into the first job, the corrective call into the second
+    assert [sum(1 for _ in open(path)) for path in submitted_jobs()] in ([2, 1], [1, 2])
+    assert [call["purpose"] for call in llm.run_usage.calls] == ["summary", "release_notes:ios", "release_notes_fix:ios"]
+    assert all(call["batch"] for call in llm.run_usage.calls)
+    assert not glob.glob("cache/llm_batches/submitted/*")
+
+
+def test_rerun_resumes_the_submitted_job(batched, monkeypatch):
+    submit = llm_batch.LocalBatchGateway.submit
+    submits = []
+    monkeypatch.setattr(llm_batch.LocalBatchGateway, "submit",
+                        lambda self, input_jsonl: submits.append(input_jsonl) or submit(self, input_jsonl))
+
+    class Interrupted(Exception):
+        pass
+
+    retrieve = llm_batch.LocalBatchGateway.retrieve
+
+    def interrupt(self, batch_id):
+        raise Interrupted()
+
+    monkeypatch.setattr(llm_batch.LocalBatchGateway, "retrieve", interrupt)
+    with pytest.raises(Interrupted):
+        llm_batch.run(generate, mode="local")
+    [submitted] = glob.glob("cache/llm_batches/submitted/*.json")
+    with open(submitted) as f:
+        batch_id = json.load(f)["id"]
+
+    monkeypatch.setattr(llm_batch.LocalBatchGateway, "retrieve", retrieve)
+    monkeypatch.setattr(llm, "batch_requests", llm.BatchRequests())
+    result = llm_batch.run(generate, mode="local")
+
+    assert result["fixed"] == "Stand-in reply to: Fix these notes: Stand-in reply to: Release notes for iOS"
+    # The first round polled the interrupted job; only the corrective call's job was submitted anew
+    assert len(submits) == 2
+    assert batch_id in [path.split("/")[-1].split(".")[0] for path in submitted_jobs()]
+    assert not glob.glob("cache/llm_batches/submitted/*")
+
+
+def test_failed_job_falls_back_to_direct_calls(batched, monkeypatch):
+    def fail(gateway, pending):
+        raise llm_batch.BatchFailed("batch ended as failed")
+
+    direct = []
+
+    def complete(request, purpose, prompt_version=None):
+        direct.append((purpose, request["model"]))
+        return f"Direct reply to: {request['messages'][-1]['content']}"
+
+    monkeypatch.setattr(llm_batch, "run_batch", fail)
+    monkeypatch.setattr(llm, "_complete", complete)
+    monkeypatch.setenv("PORTKEY_API_KEY", "test")
+    monkeypatch.setenv("GOOGLE_VIRTUAL_KEY", "test")
+
+    result = llm_batch.run(generate, mode="local")
+
+    assert result == {
+        "summary": "Direct reply to: Summarize the week",
+        "notes": "Direct reply to: Release notes for iOS",
+        "fixed": "Direct reply to: Fix these notes: Direct reply to: Release notes for iOS",
+    }
+    assert [purpose for purpose, _ in direct] == ["summary", "release_notes:ios", "release_notes_fix:ios"]
+    # The calls of the failed job keep the models the batched run routed them to
+    routes = llm.batch_requests.routes
+    assert set(routes) == {("summary", "standard"), ("release_notes:ios", "standard")}
+    assert all(model == routes[(purpose, "standard")][0] for purpose, model in direct if (purpose, "standard") in routes)
+    assert not llm.batch_requests.active
@@ -0,0 +1,55 @@
+import pytest
+
+import model_router
+from llm import GatewayHealth
+
+
+@pytest.fixture(autouse=True)
+def no_probes(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_ROUTER_PROBE_RATE", "0")
+
+
+def health_with(calls):
+    """An in-memory GatewayHealth with (model, latency, ok, prompt_tokens) observations."""
+    health = GatewayHealth(path=None)
+    for model, latency, ok, prompt_tokens in calls:
+        health.record(model, latency, ok, prompt_tokens)
+    return health
+
+
+def test_keeps_the_tier_order_without_observations():
+    assert model_router.route("summary", 1000, "standard", health_with([]), log=False) == model_router.TIER_MODELS["standard"]
+    assert model_router.route("summary", 1000, "high", health_with([]), log=False) == model_router.TIER_MODELS["high"]
+
+
+def test_demotes_a_failing_model():
+    health = health_with([("gemini-2.5-flash", 5.0, False, 1000)] * 3 + [("gemini-2.5-flash", 5.0, True, 1000)])
+
+    assert model_router.route("summary", 1000, "high", health, log=False) == ["gemini-2.0-flash", "gemini-2.5-flash"]
+
+
+def test_demotes_a_model_too_slow_for_the_prompt_size(monkeypatch):
+    monkeypatch.setenv("LLM_ROUTER_SLOW_SECONDS", "60")
+    # 0.01s per prompt token: 10s for a 1000-token prompt, 100s for a 10000-token one
+    health = health_with([("gemini-2.5-flash", 10.0, True, 1000)])
+
+    assert model_router.route("summary", 1000, "high", health, log=False)[0] == "gemini-2.5-flash"
+    assert model_router.route("summary", 10000, "high", health, log=False) == ["gemini-2.0-flash", "gemini-2.5-flash"]
+
+
+def test_probe_keeps_the_tier_order(monkeypatch):
+    monkeypatch.setenv("LLM_ROUTER_PROBE_RATE", "1")
+    health = health_with([("gemini-2.5-flash", 5.0, False, 1000)] * 3)
+
+    assert model_router.route("summary", 1000, "high", health, log=False) == model_router.TIER_MODELS["high"]
+
+
+def test_logs_the_decision():
+    health = health_with([("gemini-2.5-flash", 5.0, False, 1000)] * 3)
+    model_router.route("summary", 1000, "high", health)
+
+    with open(model_router.ROUTING_LOG_PATH) as f:
+        [line] = f.read().splitlines()
+    assert '"models": ["gemini-2.0-flash", "gemini-2.5-flash"]' in line
+    assert '"gemini-2.5-flash": "error rate 100%"' in line
@@ -0,0 +1,196 @@
+import json
+import os
+import socket
+import time
+
+import file_lock
+
+QUEUE_DIR = os.path.join("cache", "shard_queue")
+
+
+class DirectoryQueue:
+    """A work queue of JSON tasks kept in a directory, shareable between hosts.
+
+    Tasks move between subdirectories: pending/ -> claimed/ -> done/. A
+    worker claims a task by renaming it into claimed/, which is atomic on
+    local and network file systems, so every task runs once even with
+    workers on several machines mounting the same directory. A claim that
+    outlives its lease (a crashed or stalled worker) is put back into
+    pending/ by requeue_stale().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for state in ("pending", "claimed", "done"):
+            os.makedirs(os.path.join(path, state), exist_ok=True)
+
+    def _file(self, state, task_id):
+        return os.path.join(self.path, state, f"{task_id}.json")
+
+    def put(self, task_id, payload):
+        """Adds a task unless it already has a result."""
+        if not os.path.exists(self._file("done", task_id)):
+            file_lock.replace_file(self._file("pending", task_id), json.dumps(payload))
+
+    def claim(self):
+        """Claims the next pending task.
+
+        Returns:
+            A (task_id, payload) tuple, or None if no task is pending.
+        """
+        for name in sorted(os.listdir(os.path.join(self.path, "pending"))):
+            task_id = name[:-len(".json")]
+            claimed = self._file("claimed", task_id)
+            try:
+                os.rename(self._file("pending", task_id), claimed)
+            except FileNotFoundError:
+                continue  # Claimed by another worker first
+            os.utime(claimed)  # Starts the lease
+            with open(claimed) as f:
+                return task_id, json.load(f)
+        return None
+
+    def complete(self, task_id, result):
+        """Stores the result of a claimed task."""
+        file_lock.replace_file(self._file("done", task_id), json.dumps(result))
+        try:
+            os.remove(self._file("claimed", task_id))
+        except FileNotFoundError:
+            pass
+
+    def requeue_stale(self, lease_seconds):
+        """Puts claimed tasks whose lease expired back into pending/; returns their ids."""
+        requeued = []
+        for name in os.listdir(os.path.join(self.path, "claimed")):
+            task_id = name[:-len(".json")]
+            claimed = self._file("claimed", task_id)
+            try:
+                if time.time() - os.path.getmtime(claimed) > lease_seconds:
+                    os.rename(claimed, self._file("pending", task_id))
+                    requeued.append(task_id)
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def task_ids(self, state):
+        """Returns the ids of the tasks in one state: 'pending', 'claimed' or 'done'."""
+        return {name[:-len(".json")] for name in os.listdir(os.path.join(self.path, state))}
+
+    def results(self):
+        """Returns the results stored so far, by task id."""
+        results = {}
+        for name in os.listdir(os.path.join(self.path, "done")):
+            with open(os.path.join(self.path, "done", name)) as f:
+                results[name[:-len(".json")]] = json.load(f)
+        return results
+
+    def clear(self):
+        """Removes every task and result, e.g. before a fresh run."""
+        for state in ("pending", "claimed", "done"):
+            for name in os.listdir(os.path.join(self.path, state)):
+                os.remove(os.path.join(self.path, state, name))
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(queue, handle, should_stop=lambda: False):
+    """Claims and runs tasks until none is pending.
+
+    Args:
+        queue: The DirectoryQueue to work on.
+        handle: Function computing the JSON-serializable result of a task payload.
+        should_stop: Called before every claim; no further task is claimed once it returns True.
+
+    Returns:
+        The number of tasks run.
+    """
+    count = 0
+    while not should_stop():
+        claimed = queue.claim()
+        if claimed is None:
+            return count
+        task_id, payload = claimed
+        print(f"Worker {worker_name()} running shard {task_id}")
+        try:
+            result = handle(payload)
+        except Exception as e:  # Reported to the coordinator instead of losing the shard silently
+            result = {"error": f"{type(e).__name__}: {e}"}
+        queue.complete(task_id, result)
+        count += 1
+    return count
+
+
+def wait_for_results(queue, task_ids, lease_seconds, should_stop=lambda: False, poll_seconds=0.5,
+                     on_requeue=lambda task_ids: None, max_idle_leases=3,
+                     claim_seconds=None, on_unclaimed=lambda task_ids: False):
+    """Waits until every task has a result, re-queueing expired claims meanwhile.
+
+    Workers exit once nothing is pending, so a task re-queued after its
+    worker died would wait forever; on_requeue is called to start a worker
+    for it. If tasks sit in pending/ for claim_seconds while no task is
+    claimed, no worker is taking work: on_unclaimed is called with them and
+    returns True if it started a worker or ran them, otherwise they fail.
+    Waiting is also bounded: once no result arrived for max_idle_leases
+    leases, the missing tasks fail.
+
+    Args:
+        queue: The DirectoryQueue the tasks were put on.
+        task_ids: Ids of the tasks to wait for.
+        lease_seconds: Time after which a claimed task is given to another worker.
+        should_stop: Called on every poll; waiting stops early when it returns True.
+        poll_seconds: Delay between polls.
+        on_requeue: Called with the ids of the tasks put back into pending/.
+        max_idle_leases: Leases without a new result after which waiting gives up.
+        claim_seconds: Time tasks may wait unclaimed while no worker is busy; None waits.
+        on_unclaimed: Called with the ids of such tasks; returns True if they are being handled.
+
+    Returns:
+        The results received, by task id; tasks still running when waiting
+        stopped are missing, tasks given up on have an {'error'} result.
+    """
+    received = 0
+    progress_at = idle_at = time.monotonic()
+    failed = {}
+    while True:
+        results = {task_id: result for task_id, result in queue.results().items() if task_id in task_ids}
+        results.update((task_id, result) for task_id, result in failed.items() if task_id not in results)
+        if len(results) == len(task_ids) or should_stop():
+            return results
+        if len(results) > received:
+            received, progress_at = len(results), time.monotonic()
+        elif time.monotonic() - progress_at > max_idle_leases * lease_seconds:
+            for task_id in set(task_ids) - set(results):
+                results[task_id] = {"error": f"no result after {max_idle_leases} leases of {lease_seconds:.0f}s"}
+            return results
+        requeued = queue.requeue_stale(lease_seconds)
+        if requeued:
+            for task_id in requeued:
+                print(f"Shard {task_id} lease expired, re-queued")
+            on_requeue(requeued)
+
+        unclaimed = sorted((queue.task_ids("pending") & set(task_ids)) - set(results))
+        if not unclaimed or queue.task_ids("claimed"):
+            idle_at = time.monotonic()
+        elif claim_seconds is not None and time.monotonic() - idle_at > claim_seconds:
+            print(f"No worker claimed shards {', '.join(unclaimed)} within {claim_seconds:.0f}s")
+            if not on_unclaimed(unclaimed):
+                for task_id in unclaimed:
+                    failed[task_id] = {"error": f"no worker claimed it within {claim_seconds:.0f}s"}
+            idle_at = time.monotonic()
+        time.sleep(poll_seconds)
+
+
+def add_shard_arguments(parser):
+    """Adds the sharded execution options to a script's argument parser."""
+    parser.add_argument("--shards", type=int, default=None, metavar="N",
+                        help="Fetch per team through a work queue with N local worker processes "
+                             "(0: only workers started elsewhere with --worker).")
+    parser.add_argument("--queue-dir", default=None,
+                        help=f"Directory of the work queue, shared with workers on other hosts (default: {QUEUE_DIR}/<run>).")
+    parser.add_argument("--worker", metavar="QUEUE_DIR",
+                        help="Run as a worker: process the shards of the queue in QUEUE_DIR, then exit.")
+    parser.add_argument("--run-unclaimed", action="store_true",
+                        help="With --shards 0, run the shards no worker claims (or that were re-queued) "
+                             "in this process instead of failing them.")
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from report_loader import REPORT_SCRIPTS
+from settings import settings
+
+WORKSPACES_DIR = "workspaces"
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def team_mapping(default):
+    """Returns the team mapping of the current workspace.
+
+    A workspace run sets SHORTCUT_TEAM_MAPPING to a JSON object of Shortcut
+    group id to team name; single-workspace runs use the script's mapping.
+    """
+    value = settings.get("SHORTCUT_TEAM_MAPPING")
+    return json.loads(value) if value else default
+
+
+def state_id(name, default):
+    """Returns a workflow state id of the current workspace.
+
+    A workspace run sets SHORTCUT_STATE_IDS to a JSON object such as
+    {"done": "500000513", "go": "500028067"}; missing names use the default.
+    """
+    value = settings.get("SHORTCUT_STATE_IDS")
+    return str(json.loads(value).get(name, default)) if value else default
+
+
+def load_workspaces(path):
+    """Reads the workspace list from a JSON config file.
+
+    Every workspace needs a "name" and a "token_env" naming the environment
+    variable holding its Shortcut token. "team_mapping", "state_ids", "reports"
+    (default: all report types) and extra "env" variables are optional.
+    """
+    with open(path) as f:
+        workspaces = json.load(f)["workspaces"]
+    for workspace in workspaces:
+        if "name" not in workspace or "token_env" not in workspace:
+            raise ValueError(f"Workspace entries need 'name' and 'token_env': {workspace}")
+        if not settings.get(workspace["token_env"]):
+            raise ValueError(f"Workspace '{workspace['name']}' token variable {workspace['token_env']} is not set")
+    return workspaces
+
+
+def workspace_env(workspace):
+    """Builds the environment of the report processes of one workspace."""
+    env = dict(os.environ)
+    env.update({key: str(value) for key, value in workspace.get("env", {}).items()})
+    env["SHORTCUT_API_KEY"] = settings.get(workspace["token_env"])
+    if "team_mapping" in workspace:
+        env["SHORTCUT_TEAM_MAPPING"] = json.dumps(workspace["team_mapping"])
+    if "state_ids" in workspace:
+        env["SHORTCUT_STATE_IDS"] = json.dumps(workspace["state_ids"])
+    # The shared classifier model stays usable from the workspace directory
+    env.setdefault("PLATFORM_CLASSIFIER_PATH", os.path.abspath(os.path.join("cache", "platform_classifier.npz")))
+    return env
+
+
+def run_workspace(workspace, report_types, script_args):
+    """Runs the reports of one workspace one after another.
+
+    Each workspace runs in its own directory under workspaces/, so reports,
+    checkpoints and caches never mix, and its reports run sequentially so one
+    token is only ever used by one process and its rate limiter.
+
+    Returns:
+        A list of (report_type, return_code) tuples.
+    """
+    import subprocess
+
+    name = workspace["name"]
+    workdir = os.path.join(WORKSPACES_DIR, name)
+    os.makedirs(workdir, exist_ok=True)
+    env = workspace_env(workspace)
+
+    results = []
+    for report_type in workspace.get("reports", report_types):
+        if report_type not in report_types:
+            continue
+        script = os.path.join(SCRIPT_DIR, REPORT_SCRIPTS[report_type])
+        log_path = os.path.join(workdir, f"{report_type}.log")
+        print(f"[{name}] Running the {report_type} report...")
+        with open(log_path, "w") as log:
+            completed = subprocess.run(
+                [sys.executable, script] + script_args, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+        status = "done" if completed.returncode == 0 else f"failed with exit code {completed.returncode}"
+        print(f"[{name}] {report_type} report {status}, log in {log_path}")
+        results.append((report_type, completed.returncode))
+    return results
+
+
+def latest_reports(workspace_name, since):
+    """Returns the Markdown reports a workspace wrote since a timestamp, oldest first."""
+    reports_dir = os.path.join(WORKSPACES_DIR, workspace_name, "reports")
+    if not os.path.isdir(reports_dir):
+        return []
+    paths = [os.path.join(reports_dir, f) for f in os.listdir(reports_dir) if f.endswith(".md")]
+    return sorted((p for p in paths if os.path.getmtime(p) >= since), key=os.path.getmtime)
+
+
+def write_combined_report(workspaces, since):
+    """Writes one Markdown file with the reports of every workspace written since a timestamp."""
+    combined = "# Combined Weekly Reports\n\n"
+    for workspace in workspaces:
+        combined += f"# Workspace: {workspace['name']}\n\n"
+        paths = latest_reports(workspace["name"], since)
+        if not paths:
+            combined += "No report was generated.\n\n"
+        for path in paths:
+            with open(path) as f:
+                combined += f.read().strip() + "\n\n"
+
+    os.makedirs("reports", exist_ok=True)
+    filename = os.path.join("reports", f"combined_{datetime.now(timezone.utc).strftime('%Y-%m-%d')}.md")
+    try:
+        with open(filename, "w") as f:
+            f.write(combined)
+        print(f"Combined report saved to {filename}")
+    except IOError as e:
+        print(f"Error writing combined report: {e}")
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Run the reports of several Shortcut workspaces concurrently.")
+    parser.add_argument("--config", default="workspaces.json")
+    parser.add_argument("--reports", nargs="+", choices=sorted(REPORT_SCRIPTS), default=sorted(REPORT_SCRIPTS))
+    parser.add_argument("--combined", action="store_true", help="Also write reports/combined_<date>.md.")
+    parser.add_argument("--max-workers", type=int, default=4)
+    args, script_args = parser.parse_known_args()  # Unknown options are passed on to the report scripts
+
+    workspace_list = load_workspaces(args.config)
+    started = datetime.now(timezone.utc).timestamp()
+
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        futures = {
+            workspace["name"]: executor.submit(run_workspace, workspace, args.reports, script_args)
+            for workspace in workspace_list
+        }
+        failed = [
+            f"{name}/{report_type}"
+            for name, future in futures.items()
+            for report_type, return_code in future.result()
+            if return_code != 0
+        ]
+
+    if args.combined:
+        write_combined_report(workspace_list, started)
+
+    if failed:
+        print(f"Failed reports: {', '.join(failed)}")
+        sys.exit(1)